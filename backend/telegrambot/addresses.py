@@ -0,0 +1,168 @@
+import argparse
+import functools
+import os
+import time
+from typing import Iterable, NamedTuple
+
+from eth_utils import to_checksum_address
+
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+
+class InvalidAddress(ValueError):
+    pass
+
+
+class Address(NamedTuple):
+    checksum: str
+    raw: bytes
+
+
+DEFAULT_CACHE_SIZE = 65536
+
+_cached_normalize = None
+
+
+def configure_cache(maxsize: int | None = None):
+    """Create the normalization cache, dropping any cached entries.
+
+    ``maxsize`` defaults to ``ADDRESS_CACHE_SIZE``. The variable is read
+    here, on the first normalization, not at import, so a value set after
+    import (for example from .env) still applies.
+    """
+    global _cached_normalize
+    if maxsize is None:
+        maxsize = int(os.getenv('ADDRESS_CACHE_SIZE', str(DEFAULT_CACHE_SIZE)))
+    _cached_normalize = functools.lru_cache(maxsize=maxsize)(_normalize)
+
+
+def cache_info():
+    if _cached_normalize is None:
+        configure_cache()
+    return _cached_normalize.cache_info()
+
+
+def normalize_address(value: str) -> Address:
+    """Validate an address string once and return its checksum and 20-byte forms.
+
+    All-lowercase and all-uppercase hex are accepted as is; mixed case must
+    match its EIP-55 checksum. Results are cached per distinct input string,
+    so the keccak behind the checksum runs once per address.
+    """
+    if _cached_normalize is None:
+        configure_cache()
+    return _cached_normalize(value)
+
+
+def _normalize(value: str) -> Address:
+    if not isinstance(value, str):
+        raise InvalidAddress(f"Address must be a string, got {type(value).__name__}")
+    text = value.strip()
+    if text[:2] not in ('0x', '0X'):
+        raise InvalidAddress(f"Address must start with 0x: {value!r}")
+    body = text[2:]
+    if len(body) != 40:
+        raise InvalidAddress(f"Address must be 40 hex characters, got {len(body)}: {value!r}")
+    if not _HEX_DIGITS.issuperset(body):
+        raise InvalidAddress(f"Address contains non-hex characters: {value!r}")
+    raw = bytes.fromhex(body)
+    checksum = to_checksum_address(raw)
+    if body != body.lower() and body != body.upper() and checksum[2:] != body:
+        raise InvalidAddress(f"Address checksum does not match: {value!r}")
+    return Address(checksum, raw)
+
+
+def normalize_addresses(values: Iterable[str], strict: bool = True) -> list:
+    """Normalize a list of addresses in one batch, e.g. the rows of a bulk payout file.
+
+    Distinct strings are checked for shape and hex digits as one NumPy
+    array, decoded with a single ``bytes.fromhex`` and given their EIP-55
+    case with array operations; only the keccak of each address runs per
+    item. Entries failing the batch checks go through ``normalize_address``
+    for their error message. With ``strict`` every invalid entry is
+    reported in a single InvalidAddress; otherwise invalid entries come back
+    as None.
+    """
+    values = list(values)
+    errors = [f"Address must be a string, got {type(value).__name__}" for value in values if not isinstance(value, str)]
+    distinct = list(dict.fromkeys(value for value in values if isinstance(value, str)))
+    resolved = _normalize_batch(distinct)
+    for value in distinct:
+        if resolved.get(value) is None:
+            try:
+                resolved[value] = _normalize(value)
+            except InvalidAddress as e:
+                resolved[value] = None
+                errors.append(str(e))
+    if strict and errors:
+        shown = '; '.join(errors[:10])
+        more = f" (and {len(errors) - 10} more)" if len(errors) > 10 else ''
+        raise InvalidAddress(f"{len(errors)} invalid address(es): {shown}{more}")
+    return [resolved[value] if isinstance(value, str) else None for value in values]
+
+
+def _normalize_batch(values: list) -> dict:
+    """Normalize the well-formed entries of ``values``; the rest are left out of the result."""
+    import numpy as np
+    from eth_hash.auto import keccak
+
+    texts = [value.strip() for value in values]
+    shaped = [i for i, text in enumerate(texts) if len(text) == 42 and text[:2] in ('0x', '0X')]
+    if not shaped:
+        return {}
+    # One byte per character, so rows stay 40 wide; '?' fails the hex check.
+    joined = ''.join(texts[i][2:] for i in shaped).encode('ascii', 'replace')
+    chars = np.frombuffer(joined, np.uint8).reshape(-1, 40)
+    is_hex = np.zeros(256, bool)
+    is_hex[list(b'0123456789abcdefABCDEF')] = True
+    ok = is_hex[chars].all(axis=1)
+    upper = ((chars >= ord('A')) & (chars <= ord('F'))).any(axis=1)
+    lower = ((chars >= ord('a')) & (chars <= ord('f'))).any(axis=1)
+    chars = chars[ok]
+    # Setting 0x20 lowercases A-F and leaves digits alone.
+    lowered = chars | 0x20
+    lowered_hex = lowered.tobytes()
+    raw = bytes.fromhex(lowered_hex.decode())
+    digests = np.frombuffer(b''.join(keccak(lowered_hex[k:k + 40]) for k in range(0, len(lowered_hex), 40)),
+                            np.uint8).reshape(-1, 32)[:, :20]
+    nibbles = np.stack([digests >> 4, digests & 0x0F], axis=2).reshape(-1, 40)
+    checksummed = np.where((lowered >= ord('a')) & (nibbles >= 8), lowered - 0x20, lowered)
+    mismatched = (upper & lower)[ok] & (checksummed != chars).any(axis=1)
+    checksum_hex = checksummed.tobytes().decode()
+    resolved = {}
+    for k, i in enumerate(np.flatnonzero(ok)):
+        if not mismatched[k]:
+            resolved[values[shaped[i]]] = Address('0x' + checksum_hex[k * 40:(k + 1) * 40], raw[k * 20:(k + 1) * 20])
+    return resolved
+
+
+def _bench(count: int) -> tuple:
+    addresses = ['0x' + os.urandom(20).hex() for _ in range(count)]
+    configure_cache()
+    start = time.perf_counter()
+    for address in addresses:
+        normalize_address(address)
+    cold = (time.perf_counter() - start) / count
+    start = time.perf_counter()
+    for address in addresses:
+        normalize_address(address)
+    warm = (time.perf_counter() - start) / count
+    fresh = ['0x' + os.urandom(20).hex() for _ in range(count)]
+    start = time.perf_counter()
+    normalize_addresses(fresh)
+    batch = (time.perf_counter() - start) / count
+    return cold, warm, batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-address normalization cost, cold and warm")
+    parser.add_argument('--count', type=int, default=20000)
+    options = parser.parse_args(argv)
+    cold, warm, batch = _bench(options.count)
+    print(f"cold  {cold * 1e6:8.2f} us/address (validation + keccak checksum)")
+    print(f"warm  {warm * 1e6:8.2f} us/address (LRU hit)")
+    print(f"batch {batch * 1e6:8.2f} us/address (normalize_addresses, distinct and uncached)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import LedgerEntry
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('created', 'telegram_user_id', 'recipient', 'amount_wei', 'status', 'tx_hash')
+    list_filter = ('status', 'chain_id')
+    search_fields = ('tx_hash', 'recipient')
@@ -1,11 +1,8 @@
 from django.apps import AppConfig
-from .bot import TelegramBot
+
 
 class TelegrambotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'telegrambot'
-
-    def ready(self):
-        bot_instance = TelegramBot()
-        bot_instance.initialize_web3_connections()
-        bot_instance.setup_app()
+    # The bot and chain stack (web3, python-telegram-bot) are imported on
+    # first use rather than in ready(); start the bot with `manage.py runbot`.
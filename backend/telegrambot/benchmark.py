@@ -0,0 +1,279 @@
+"""End-to-end benchmark of the bot handlers against local fake servers.
+
+Runs the real ``TelegramBot`` handlers with the Telegram Bot API and the
+JSON-RPC node replaced by ``telegrambot.fakes``, then reports latency
+percentiles and throughput per scenario. Results are written as JSON named
+after the current commit so runs can be compared across commits::
+
+    python -m telegrambot.benchmark --count 500 --concurrency 16
+    python -m telegrambot.benchmark --compare benchmarks/<previous>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import time
+from pathlib import Path
+
+from .fakes import FakeEthereumNode, FakeTelegramServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_OUTPUT_DIR = BACKEND_DIR / 'benchmarks'
+
+# Well-known development key (first Anvil/Hardhat account); never funded on a real chain.
+BENCH_PRIVATE_KEY = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80'
+BENCH_CONTRACT = '0x0fc11bd4a1b01dc6b8abb268152f62f65eadcd9d'
+BENCH_RECIPIENT = '0xa38062B76617585a6DB4AF9759ef3A850B35Ed9a'
+BENCH_USERNAME = 'bench_bot'
+
+
+def make_update(update_id: int, text: str, chat_id: int, chat_type: str = 'private', user_id: int | None = None) -> dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': chat_type},
+        'from': {'id': user_id or abs(chat_id), 'is_bot': False, 'first_name': 'Bench'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def start_update(update_id: int, chat_id: int) -> dict:
+    return make_update(update_id, '/start', chat_id=chat_id)
+
+
+def send_update(update_id: int, chat_id: int) -> dict:
+    return make_update(update_id, f'/send {BENCH_RECIPIENT} 0.001', chat_id=chat_id)
+
+
+def confirm_update(update_id: int, chat_id: int) -> dict:
+    # Answers the confirmation left by the send scenario in the same chat.
+    return make_update(update_id, 'YES', chat_id=chat_id)
+
+
+def balance_update(update_id: int, chat_id: int) -> dict:
+    # Many users asking about the same address: served once per block.
+    return make_update(update_id, f'/balance {BENCH_RECIPIENT}', chat_id=chat_id)
+
+
+def group_update(update_id: int, chat_id: int) -> dict:
+    # Roughly one in four group messages mentions the bot and gets a reply.
+    text = f'@{BENCH_USERNAME} hello there' if update_id % 4 == 0 else f'just chatting {update_id}'
+    return make_update(update_id, text, chat_id=chat_id, chat_type='group', user_id=3000 + update_id % 50)
+
+
+SCENARIOS = {
+    'start': start_update,
+    'send': send_update,
+    'confirm': confirm_update,
+    'balance': balance_update,
+    'group': group_update,
+}
+# Scenarios that act on what the send scenario left behind, so they reuse its chats.
+FOLLOWS_SEND = ('confirm', 'balance')
+
+TX_HASH_PATTERN = re.compile(r"'tx_hash': '(?:0x)?([0-9a-fA-F]{64})'")
+
+
+def chat_ids(name: str, count: int, send_chats: list) -> list:
+    if name == 'group':
+        return [-2000 - i % 10 for i in range(count)]
+    if name in FOLLOWS_SEND and send_chats:
+        return [send_chats[i % len(send_chats)] for i in range(count)]
+    # One private chat per update, so no two sends share a confirmation.
+    return [1000 + i for i in range(count)]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest rank: the smallest value with at least q% of the values at or below it.
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, wall_seconds: float, errors: int) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'count': count,
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_per_s': round(count / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+
+async def drive(app, updates: list, concurrency: int) -> tuple:
+    from telegram import Update
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(data: dict):
+        async with semaphore:
+            update = Update.de_json(data, app.bot)
+            start = time.perf_counter()
+            await app.process_update(update)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(data) for data in updates))
+    return latencies, time.perf_counter() - start
+
+
+def configure_bot_env(telegram: FakeTelegramServer, node: FakeEthereumNode):
+    os.environ.update({
+        'ALCHEMY_HTTP_URL': node.url,
+        'CONTRACT_ADDRESS': BENCH_CONTRACT,
+        'CONTRACT_ABI_PATH': str(BACKEND_DIR / 'abi.json'),
+        'CONTRACT_OWNER_PRIVATE_KEY': BENCH_PRIVATE_KEY,
+        'TELEGRAM_BOT_TOKEN': telegram.token,
+        'TELEGRAM_BOT_USERNAME': BENCH_USERNAME,
+        'TELEGRAM_BASE_URL': telegram.base_url,
+    })
+
+
+async def run_scenarios(options, telegram: FakeTelegramServer) -> dict:
+    from .bot import TelegramBot
+
+    bot = TelegramBot()
+    bot.initialize_web3_connections()
+    app = bot.build_app()
+    await app.initialize()
+    results = {}
+    next_update_id = 1
+    send_chats = []
+    try:
+        for name in options.scenarios:
+            make = SCENARIOS[name]
+            chats = chat_ids(name, options.count, send_chats)
+            if name == 'send':
+                send_chats = chats
+            updates = [make(next_update_id + i, chat) for i, chat in enumerate(chats)]
+            next_update_id += options.count
+            sent_before = len(telegram.sent_messages)
+            latencies, wall = await drive(app, updates, options.concurrency)
+            replies = telegram.sent_messages[sent_before:]
+            errors = sum(1 for _, _, text in replies if text.startswith('Error'))
+            extra = {'replies': len(replies)}
+            if name == 'confirm':
+                # Every confirm should broadcast its own transaction; a missing
+                # or repeated hash is an error even when the reply looked fine.
+                hashes = [m.group(1).lower() for _, _, text in replies for m in TX_HASH_PATTERN.finditer(text)]
+                extra['tx_hashes'] = len(set(hashes))
+                errors = max(errors, len(updates) - extra['tx_hashes'])
+            results[name] = summarize(latencies, wall, errors)
+            results[name].update(extra)
+    finally:
+        await app.shutdown()
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(options) -> dict:
+    telegram = FakeTelegramServer(username=BENCH_USERNAME, latency=options.telegram_latency)
+    node = FakeEthereumNode(
+        block_time=options.block_time,
+        latency=options.rpc_latency,
+        error_rate=options.rpc_error_rate,
+        seed=options.seed,
+    )
+    with telegram, node:
+        configure_bot_env(telegram, node)
+        # The handlers print every message; keep the report readable.
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        logging.getLogger('telegrambot').setLevel(logging.WARNING)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scenarios = asyncio.run(run_scenarios(options, telegram))
+        rpc_requests = dict(sorted(node.request_counts.items()))
+    return {
+        'commit': current_commit(),
+        'timestamp': int(time.time()),
+        'config': {
+            'count': options.count,
+            'concurrency': options.concurrency,
+            'rpc_latency': options.rpc_latency,
+            'rpc_error_rate': options.rpc_error_rate,
+            'block_time': options.block_time,
+            'telegram_latency': options.telegram_latency,
+        },
+        'scenarios': scenarios,
+        'rpc_requests': rpc_requests,
+    }
+
+
+def compare(current: dict, baseline: dict) -> list:
+    lines = [f"Compared with {baseline.get('commit', 'unknown')[:12]}:"]
+    for name, stats in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s'):
+            if base[key]:
+                deltas.append(f"{key} {(stats[key] - base[key]) / base[key] * 100:+.1f}%")
+        lines.append(f"  {name}: " + ', '.join(deltas))
+    return lines
+
+
+def format_report(result: dict) -> list:
+    lines = [f"commit {result['commit'][:12]}"]
+    for name, s in result['scenarios'].items():
+        lines.append(
+            f"  {name:<7} n={s['count']} errors={s['errors']} p50={s['p50_ms']}ms "
+            f"p95={s['p95_ms']}ms p99={s['p99_ms']}ms {s['throughput_per_s']}/s"
+            + (f" txs={s['tx_hashes']}" if 'tx_hashes' in s else '')
+        )
+    return lines
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark bot handlers against fake Telegram and JSON-RPC servers")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--count', type=int, default=200, help="updates per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rpc-latency', type=float, default=0.0, help="seconds added to every JSON-RPC request")
+    parser.add_argument('--rpc-error-rate', type=float, default=0.0)
+    parser.add_argument('--block-time', type=float, default=2.0)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', type=Path, default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--compare', type=Path, metavar='RESULT_JSON', help="earlier result to diff against")
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    result = run(options)
+    options.output_dir.mkdir(parents=True, exist_ok=True)
+    path = options.output_dir / f"{result['commit'][:12]}-{result['timestamp']}.json"
+    path.write_text(json.dumps(result, indent=2) + '\n')
+    for line in format_report(result):
+        print(line)
+    if options.compare:
+        for line in compare(result, json.loads(options.compare.read_text())):
+            print(line)
+    print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
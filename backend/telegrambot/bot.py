@@ -1,42 +1,102 @@
 import os
-import json
+import hashlib
+import asyncio
+from collections import OrderedDict
 import logging
 import time
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from dotenv import load_dotenv
 from telegram import Update
-from telegram.ext import ContextTypes, ApplicationBuilder, CommandHandler, MessageHandler, filters, Application
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s: %(message)s'
-)
+from telegram.ext import ContextTypes, ApplicationBuilder, ApplicationHandlerStop, CommandHandler, MessageHandler, TypeHandler, filters, Application
+from . import metrics, tracing
+from .rpc import InstrumentedHTTPProvider
+from .chain_cache import BlockCache, HeadWatcher
+from .replacement import ReplacementEngine
+from .preflight import Preflight, SimulationReverted
+from .addresses import InvalidAddress, normalize_address
+from .sessions import SessionStore
+from .dedupe import NEW, UpdateDeduplicator, capture_reply
+from .analytics import TransferAnalytics, write_snapshot
+from .subscriptions import CONTRACT_EVENTS, ETH_SENT_TOPIC, EVENT_NAMES, TOKEN_SENT_TOPIC, SubscriptionManager
+from .deployments import DEFAULT_BROADCAST_DIR, DEFAULT_SNAPSHOT_PATH, UnknownDeployment, get_registry
+from django.apps import apps
 
 logger = logging.getLogger(__name__)
 
-load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+_runtime_configured = False
+
+
+def configure_runtime():
+    # Deferred from import time so that importing this module (or Django
+    # loading the app) does not read .env or reconfigure logging.
+    global _runtime_configured
+    if _runtime_configured:
+        return
+    _runtime_configured = True
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+    tracing.install_log_record_factory()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s [trace=%(trace_id)s]: %(message)s'
+    )
+    tracing.configure_from_env()
+
+
+CHAIN_ID = 84532
+DEFAULT_ABI_PATH = os.path.join(os.path.dirname(__file__), '../abi.json')
+
 
 class TelegramBot:
     def __init__(self):
+        configure_runtime()
         self.alchemy_http_url = os.getenv("ALCHEMY_HTTP_URL")
+        self.alchemy_ws_url = os.getenv("ALCHEMY_WS_URL")
+        # CONTRACT_ADDRESS overrides the address found in contract/broadcast.
         self.contract_address = os.getenv('CONTRACT_ADDRESS')
-        self.contract_abi_path = os.getenv('CONTRACT_ABI_PATH')
+        self.contract_name = os.getenv('CONTRACT_NAME', 'TelegramMiniApp')
+        self.contract_abi_path = os.getenv('CONTRACT_ABI_PATH', DEFAULT_ABI_PATH)
+        self.broadcast_dir = os.getenv('DEPLOYMENTS_BROADCAST_DIR', str(DEFAULT_BROADCAST_DIR))
+        self.deployments_snapshot_path = os.getenv('DEPLOYMENTS_SNAPSHOT_PATH', str(DEFAULT_SNAPSHOT_PATH))
         self.private_key = os.getenv('CONTRACT_OWNER_PRIVATE_KEY')
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.username = os.getenv('TELEGRAM_BOT_USERNAME')
+        self.telegram_base_url = os.getenv('TELEGRAM_BASE_URL')
+        self.record_path = os.getenv('TELEGRAM_RECORD_PATH')
         self.app = None
 
         self.http_w3 = None
         self.contract = None
+        self.codec = None
+        self.read_cache = BlockCache(maxsize=int(os.getenv('READ_CACHE_SIZE', '10000')))
+        self.head_watcher = None
+        self.subscriptions = None
+        self.contract_events_task = None
+        self.analytics_snapshot_task = None
+        self.analytics_snapshot_path = os.getenv('ANALYTICS_SNAPSHOT_PATH')
+        self.analytics = self.load_analytics(int(os.getenv('ANALYTICS_WINDOW_SECONDS', '86400')))
+        self._block_timestamps = OrderedDict()
+        self.replacement_engine = None
+        self.preflight = None
+        self.sessions = SessionStore(
+            max_entries=int(os.getenv('SESSION_MAX_ENTRIES', '1000000')),
+            default_ttl=float(os.getenv('SEND_CONFIRM_TTL_SECONDS', '60')),
+            spill_path=os.getenv('SESSION_SPILL_PATH'),
+        )
+        self.dedupe = UpdateDeduplicator(
+            window_size=int(os.getenv('DEDUPE_WINDOW_SIZE', '10000')),
+            fingerprint_ttl=float(os.getenv('DEDUPE_FINGERPRINT_SECONDS', '30')),
+        )
+        self.ledger = None
+        if apps.ready:
+            # The ledger needs the ORM; outside Django (benchmarks, replay) it stays off.
+            from .ledger import LedgerWriter
+            self.ledger = LedgerWriter(batch_size=int(os.getenv('LEDGER_BATCH_SIZE', '500')))
 
     def validate_env_vars(self):
         missing_vars = []
         if not self.alchemy_http_url:
             missing_vars.append("ALCHEMY_HTTP_URL")
-        if not self.contract_address:
-            missing_vars.append("CONTRACT_ADDRESS")
-        if not self.contract_abi_path:
-            missing_vars.append("CONTRACT_ABI_PATH")
         if not self.private_key:
             missing_vars.append("CONTRACT_OWNER_PRIVATE_KEY")
         if not self.token:
@@ -47,47 +107,101 @@ class TelegramBot:
         if missing_vars:
             raise ValueError(f"Missing environment variables: {', '.join(missing_vars)}")
         
-    def load_contract_abi(self):
+    def resolve_contract(self) -> tuple:
+        """Return the contract's address and codec from the deployment registry.
+
+        The registry is brought up to date here, once per start; later
+        lookups don't touch the broadcast files.
+        """
+        registry = get_registry(
+            self.broadcast_dir,
+            abi_paths={self.contract_name: self.contract_abi_path},
+            snapshot_path=self.deployments_snapshot_path or None,
+        )
+        registry.refresh()
         try:
-            with open(self.contract_abi_path, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            logger.error(f"ABI file not found at {self.contract_abi_path}")
-            raise
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON in ABI file at {self.contract_abi_path}")
-            raise
+            codec = registry.codec(self.contract_name)
+            if self.contract_address:
+                return self.contract_address, codec
+            return registry.resolve(self.contract_name, CHAIN_ID).address, codec
+        except UnknownDeployment as e:
+            raise ValueError(
+                f"Cannot resolve CONTRACT_NAME={self.contract_name} on CHAIN_ID={CHAIN_ID}: {e}. "
+                f"Deploy it with forge script, or set CONTRACT_ADDRESS and CONTRACT_ABI_PATH"
+            ) from None
 
     def initialize_web3_connections(self):
         self.validate_env_vars()
-        self.http_w3 = Web3(Web3.HTTPProvider(self.alchemy_http_url))
-        contract_abi = self.load_contract_abi()
+        self.http_w3 = Web3(InstrumentedHTTPProvider(self.alchemy_http_url))
+        address, self.codec = self.resolve_contract()
         self.contract = self.http_w3.eth.contract(
-            address=self.http_w3.to_checksum_address(self.contract_address),
-            abi=contract_abi
+            address=self.http_w3.to_checksum_address(address),
+            abi=self.codec.abi
+        )
+        self.preflight = Preflight(self.http_w3, self.codec)
+        if self.alchemy_ws_url:
+            # Heads and contract events are pushed; nothing polls while idle.
+            self.subscriptions = SubscriptionManager(
+                self.alchemy_ws_url,
+                log_filter={'address': self.contract.address, 'topics': [[ETH_SENT_TOPIC, TOKEN_SENT_TOPIC]]},
+            )
+        self.head_watcher = HeadWatcher(self.http_w3, self.read_cache, subscriptions=self.subscriptions)
+        max_gas_price = os.getenv('MAX_GAS_PRICE_WEI')
+        self.replacement_engine = ReplacementEngine(
+            self.http_w3,
+            self.private_key,
+            stuck_after_blocks=int(os.getenv('STUCK_AFTER_BLOCKS', '3')),
+            bump_percent=float(os.getenv('FEE_BUMP_PERCENT', '12.5')),
+            max_gas_price=int(max_gas_price) if max_gas_price else None,
         )
+        self.head_watcher.listeners.append(self.replacement_engine.on_new_block)
+        if self.ledger is not None:
+            self.replacement_engine.settled_listeners.append(self.on_transaction_settled)
         print('Web3 connections initialized')
         print(self.contract)
 
-    def send_eth(self, recipient: str, amount: float) -> str:
+    def send_eth(self, recipient: str, amount: float) -> tuple:
+        """Broadcast a sendETH call; returns the reply payload and the signed transaction fields."""
         if not self.http_w3:
             self.initialize_web3_connections()
 
+        address = normalize_address(recipient)
         account = self.http_w3.eth.account.from_key(self.private_key)
-        txn = self.contract.functions.sendETH(
-            recipient
-        ).build_transaction({
+        call = {
             'from': account.address,
-            'nonce': self.http_w3.eth.get_transaction_count(account.address),
-            'gas': 200000,
-            'gasPrice': self.http_w3.eth.gas_price,
+            'to': self.contract.address,
+            # Encoded from the cached 20-byte form; going through the contract
+            # object would re-validate the checksum with another keccak.
+            'data': '0x' + self.codec.encode_call('sendETH', address.raw).hex(),
             'value': self.http_w3.to_wei(amount, 'ether'),
-            'chainId': 84532
-        })
-        signed_txn = self.http_w3.eth.account.sign_transaction(txn, self.private_key)
-        tx_hash = self.http_w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        print(f"Create Pool sent: {tx_hash.hex()}")
-        return {'tx_hash': tx_hash.hex(), 'status': 'pending'}
+            'gas': 200000,
+        }
+        # Nonce, gas price and an eth_call of this exact transaction go out as
+        # one batch; a send that would revert is rejected before it spends a nonce.
+        with tracing.span('preflight'), metrics.NONCE_QUEUE_DEPTH.track_inprogress(), metrics.FEE_QUEUE_DEPTH.track_inprogress():
+            nonce, gas_price = self.preflight.check(call, known_block=self.read_cache.block)
+        try:
+            with metrics.OUTBOX_QUEUE_DEPTH.track_inprogress():
+                with tracing.span('sign', nonce=nonce, gas_price=gas_price):
+                    txn = dict(call, nonce=nonce, gasPrice=gas_price, chainId=CHAIN_ID)
+                    signed_txn = self.http_w3.eth.account.sign_transaction(txn, self.private_key)
+                with tracing.span('send_raw_transaction') as span:
+                    tx_hash = self.http_w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+                    span.set_attribute('tx_hash', tx_hash.hex())
+        except Exception:
+            # The nonce may not have been used; it is handed out again.
+            self.preflight.nonces.failed(account.address, nonce)
+            raise
+        self.preflight.nonces.sent(account.address, nonce)
+        logger.info(f"Create Pool sent: {tx_hash.hex()}")
+        return {'tx_hash': tx_hash.hex(), 'status': 'pending'}, txn
+
+    def track_sent(self, txn: dict, tx_hash: str):
+        # The transaction is already out: failing to watch it is logged, never reported as a failed send.
+        try:
+            self.replacement_engine.track(txn, tx_hash)
+        except Exception as e:
+            logger.error(f"Not watching {tx_hash} for fee bumps: {e}")
 
     def transfer(self, to_address: str, amount: float) -> str:
         default_account = self.http_w3.eth.default_account
@@ -109,45 +223,285 @@ class TelegramBot:
         txn_hash = self.http_w3.eth.send_raw_transaction(signed_txn.raw_transaction)
         return txn_hash.hex()
 
-    def setup_app(self):
-        self.app = ApplicationBuilder().token(self.token).build()
+    def build_app(self) -> Application:
+        builder = ApplicationBuilder().token(self.token)
+        if self.telegram_base_url:
+            builder = builder.base_url(self.telegram_base_url)
+        self.app = builder.post_init(self.startup).post_shutdown(self.shutdown).build()
+        if self.record_path:
+            from .replay import UpdateRecorder
+            recorder = UpdateRecorder(self.record_path, bot_username=self.username)
+            self.app.add_handler(TypeHandler(Update, recorder.handle), group=-2)
+        # Redelivered updates are answered from what was replied the first
+        # time and never reach the command handlers.
+        self.app.add_handler(TypeHandler(Update, self.dedupe_guard), group=-1)
+        self.app.add_handler(TypeHandler(Update, self.dedupe_record), group=1)
         self.app.add_handler(CommandHandler("start", self.start_command))
         self.app.add_handler(CommandHandler("help", self.help_command))
         self.app.add_handler(CommandHandler("custom", self.custom_command))
         self.app.add_handler(CommandHandler("send", self.send_command))
+        self.app.add_handler(CommandHandler("balance", self.balance_command))
+        self.app.add_handler(CommandHandler("status", self.status_command))
+        self.app.add_handler(CommandHandler("pool", self.pool_command))
+        self.app.add_handler(CommandHandler("history", self.history_command))
+        self.app.add_handler(CommandHandler("stats", self.stats_command))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.app.add_error_handler(self.error)
+        return self.app
+
+    def setup_app(self):
+        self.build_app()
         print('Telegram bot setup complete')
         self.app.run_polling(poll_interval=3, timeout=10, drop_pending_updates=True)
 
+    async def reply(self, update: Update, text: str) -> None:
+        with tracing.span('reply_text'):
+            await update.message.reply_text(text)
+        capture_reply(text)
+
+    def fingerprint(self, update: Update) -> bytes | None:
+        # Only the answer that sends is fingerprinted. A repeated /send must
+        # reach its handler: it is what opens the session a later YES answers.
+        message = update.message
+        if message is None or not message.text or update.effective_user is None:
+            return None
+        text = ' '.join(message.text.split())
+        if text.upper() not in ('YES', 'NO'):
+            return None
+        session = self.sessions.get(update.effective_user.id)
+        if session is None or session.state != 'confirm_send':
+            return None
+        # Tied to the confirmation being answered, so a YES to the next /send is not a repeat.
+        key = f"{text.upper()}|{session.payload}|{session.expires_at}"
+        return hashlib.blake2b(
+            f"{update.effective_user.id}|{update.effective_chat.id}|{key}".encode(), digest_size=16
+        ).digest()
+
+    async def dedupe_guard(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        status, replies = self.dedupe.begin(update.update_id, self.fingerprint(update))
+        if status == NEW:
+            self.dedupe.start_capture()
+            return
+        logger.info(f"Update {update.update_id} is a duplicate ({status}), not handling it again")
+        if replies and update.message is not None:
+            for text in replies:
+                await update.message.reply_text(text)
+        raise ApplicationHandlerStop
+
+    async def dedupe_record(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        self.dedupe.finish(update.update_id, self.dedupe.stop_capture())
+
+    @metrics.timed_handler
+    @tracing.traced_update
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        await update.message.reply_text("Hello! I'm your base transaction bot. How can I assist you today?")
+        await self.reply(update, "Hello! I'm your base transaction bot. How can I assist you today?")
         # update.effective_user.first_name
         # await context.bot.send_message(chat_id=update.effective_chat.id, text="Hello! I'm your bot. How can I assist you today?")
 
+    @metrics.timed_handler
+    @tracing.traced_update
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        await update.message.reply_text("Here are some commands you can use:\n/start - Start the bot\n/help - Get help\n/custom - Custom command\n/send - Send ETH to an address")
+        await self.reply(update, "Here are some commands you can use:\n/start - Start the bot\n/help - Get help\n/custom - Custom command\n/send - Send ETH to an address\n/balance - Show the ETH balance of an address\n/status - Show the status of a transaction\n/pool - Show the bot's ETH pool\n/history - Show your past sends\n/stats - Show ETHSent transfer statistics")
 
+    @metrics.timed_handler
+    @tracing.traced_update
     async def custom_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        await update.message.reply_text("Use the following custom message to send ETH to an address.\nFormat: /send <address> <amount>")
+        await self.reply(update, "Use the following custom message to send ETH to an address.\nFormat: /send <address> <amount>, then reply YES to confirm.")
 
+    @metrics.timed_handler
+    @tracing.traced_update
     async def send_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if len(context.args) != 2:
-            await update.message.reply_text("Usage: /send <address> <amount>")
+            await self.reply(update, "Usage: /send <address> <amount>")
             return
 
-        recipient = context.args[0]
+        with tracing.span('parse'):
+            try:
+                recipient = normalize_address(context.args[0]).checksum
+            except InvalidAddress as e:
+                recipient = None
+                address_error = str(e)
+            try:
+                amount = float(context.args[1])
+            except ValueError:
+                amount = None
+        if recipient is None:
+            await self.reply(update, f"Invalid address. {address_error}")
+            return
+        if amount is None:
+            await self.reply(update, "Invalid amount. Please enter a valid number.")
+            return
+
+        self.sessions.put(update.effective_user.id, 'confirm_send', (update.effective_chat.id, recipient, amount))
+        await self.reply(
+            update,
+            f"Reply YES within {self.sessions.default_ttl:g}s to send {amount} ETH to {recipient}, or NO to cancel."
+        )
+
+    async def confirm_send(self, update: Update, recipient: str, amount: float) -> None:
         try:
-            amount = float(context.args[1])
-        except ValueError:
-            await update.message.reply_text("Invalid amount. Please enter a valid number.")
+            tx_hash, txn = self.send_eth(recipient, amount)
+        except SimulationReverted as e:
+            await self.reply(update, f"Transaction rejected, nothing was sent: {e.reason}")
             return
+        except Exception as e:
+            await self.reply(update, f"Error: {str(e)}")
+            return
+        # Sent: from here on nothing may tell the user otherwise.
+        if self.ledger is not None:
+            self.ledger.record(
+                telegram_user_id=update.effective_user.id,
+                chat_id=update.effective_chat.id,
+                chain_id=CHAIN_ID,
+                tx_hash='0x' + tx_hash['tx_hash'],
+                recipient=recipient,
+                amount_wei=Web3.to_wei(amount, 'ether'),
+            )
+        await self.reply(update, f"Transaction sent! Hash: {tx_hash}")
+        # Following the head is what lets a stuck send be fee-bumped.
+        self.head_watcher.ensure_started()
+        self.track_sent(txn, '0x' + tx_hash['tx_hash'])
+
+    async def cached_read(self, kind: str, key: str, fetch):
+        # Reads run off the event loop and are shared per block by every caller.
+        await asyncio.wait_for(self.head_watcher.wait_ready(), timeout=10)
+        return await self.read_cache.get((kind, key), lambda block: asyncio.to_thread(fetch, block))
 
+    def fetch_tx_status(self, tx_hash: str, block: int) -> str:
+        current = self.replacement_engine.resolve(tx_hash)
+        if current is not None and current != tx_hash:
+            return f"replaced by {current}: {self.fetch_tx_status(current, block)}"
         try:
-            tx_hash = self.send_eth(recipient, amount)
-            await update.message.reply_text(f"Transaction sent! Hash: {tx_hash}")
+            receipt = self.http_w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            receipt = None
+        if receipt is not None:
+            outcome = 'succeeded' if receipt['status'] == 1 else 'failed'
+            confirmations = block - receipt['blockNumber'] + 1
+            return f"{outcome} in block {receipt['blockNumber']} ({confirmations} confirmations)"
+        try:
+            self.http_w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            return "not found"
+        return "pending"
+
+    def fetch_pool(self, block: int) -> tuple:
+        owner = self.http_w3.eth.account.from_key(self.private_key).address
+        return (
+            self.http_w3.eth.get_balance(owner, block),
+            self.http_w3.eth.get_balance(self.contract.address, block),
+        )
+
+    @metrics.timed_handler
+    @tracing.traced_update
+    async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if len(context.args) != 1:
+            await self.reply(update, "Usage: /balance <address>")
+            return
+        try:
+            address = normalize_address(context.args[0]).checksum
+        except InvalidAddress as e:
+            await self.reply(update, f"Invalid address. {e}")
+            return
+        try:
+            wei = await self.cached_read('balance', address, lambda block: self.http_w3.eth.get_balance(address, block))
+        except Exception as e:
+            await self.reply(update, f"Error: {str(e)}")
+            return
+        await self.reply(update, f"Balance of {address}: {Web3.from_wei(wei, 'ether')} ETH (block {self.read_cache.block})")
+
+    @metrics.timed_handler
+    @tracing.traced_update
+    async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if len(context.args) != 1:
+            await self.reply(update, "Usage: /status <txhash>")
+            return
+        tx_hash = context.args[0].lower()
+        if not tx_hash.startswith('0x'):
+            tx_hash = '0x' + tx_hash
+        if len(tx_hash) != 66 or not all(c in '0123456789abcdef' for c in tx_hash[2:]):
+            await self.reply(update, "Invalid transaction hash.")
+            return
+        try:
+            status = await self.cached_read('status', tx_hash, lambda block: self.fetch_tx_status(tx_hash, block))
+        except Exception as e:
+            await self.reply(update, f"Error: {str(e)}")
+            return
+        await self.reply(update, f"Transaction {tx_hash}: {status}")
+
+    @metrics.timed_handler
+    @tracing.traced_update
+    async def pool_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        try:
+            owner_wei, contract_wei = await self.cached_read('pool', '', self.fetch_pool)
+        except Exception as e:
+            await self.reply(update, f"Error: {str(e)}")
+            return
+        await self.reply(
+            update,
+            f"Pool: {Web3.from_wei(owner_wei, 'ether')} ETH in the sending wallet, "
+            f"{Web3.from_wei(contract_wei, 'ether')} ETH held by the contract (block {self.read_cache.block})"
+        )
+
+    def on_transaction_settled(self, tx_hash: str, landed_hash: str | None):
+        status = 'mined' if landed_hash else 'dropped'
+        self.ledger.update_status(CHAIN_ID, tx_hash, status, landed_hash)
+
+    @metrics.timed_handler
+    @tracing.traced_update
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if self.ledger is None:
+            await self.reply(update, "History is not available.")
+            return
+        if len(context.args) > 1:
+            await self.reply(update, "Usage: /history [cursor]")
+            return
+        from .ledger import InvalidCursor, history_page
+
+        def load():
+            # Sends still buffered in the writer should show up too.
+            self.ledger.flush()
+            return history_page(telegram_user_id=update.effective_user.id, cursor=context.args[0] if context.args else None)
+
+        try:
+            entries, next_cursor = await asyncio.to_thread(load)
+        except InvalidCursor as e:
+            await self.reply(update, str(e))
+            return
         except Exception as e:
-            await update.message.reply_text(f"Error: {str(e)}")
+            await self.reply(update, f"Error: {str(e)}")
+            return
+        if not entries:
+            await self.reply(update, "No sends yet." if not context.args else "No more sends.")
+            return
+        lines = [
+            f"{entry.created:%Y-%m-%d %H:%M} {Web3.from_wei(int(entry.amount_wei), 'ether')} ETH to {entry.recipient} ({entry.status})\n{entry.tx_hash}"
+            for entry in entries
+        ]
+        if next_cursor:
+            lines.append(f"More: /history {next_cursor}")
+        await self.reply(update, '\n\n'.join(lines))
+
+    @metrics.timed_handler
+    @tracing.traced_update
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if self.subscriptions is None:
+            await self.reply(update, "Stats are not available: contract events are only followed over a WebSocket.")
+            return
+        stats = self.analytics.snapshot(top=3, hours=6)
+        lines = [f"ETHSent, last {stats['window_seconds'] // 3600}h: {stats['transfers']} transfers, {stats['volume_eth']:.6g} ETH"]
+        for title, key in (("Top senders", 'top_senders'), ("Top recipients", 'top_recipients')):
+            if stats[key]:
+                lines.append(f"{title}:")
+                lines.extend(f"  {row['address']} {row['volume_eth']:.6g} ETH ({row['transfers']})" for row in stats[key])
+        hours = [row for row in stats['hourly'] if row['transfers']]
+        if hours:
+            lines.append("Transfer size p50/p99 by hour (UTC):")
+            lines.extend(
+                f"  {time.strftime('%H:%M', time.gmtime(row['hour']))} {row['p50_eth']:.6g}/{row['p99_eth']:.6g} ETH ({row['transfers']})"
+                for row in hours
+            )
+        await self.reply(update, '\n'.join(lines))
 
     def handle_response(self, text: str) -> str:
         if 'hello' in text.lower():
@@ -157,6 +511,8 @@ class TelegramBot:
         else:
             return "I'm not sure how to respond to that."
 
+    @metrics.timed_handler
+    @tracing.traced_update
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         message_type = update.message.chat.type
         '''if message_type == 'private':
@@ -166,6 +522,16 @@ class TelegramBot:
         elif message_type == 'channel':
             await update.message.reply_text("This is a channel.")'''
         text = update.message.text
+        answer = text.strip().upper()
+        if answer in ('YES', 'NO'):
+            session = self.sessions.get(update.effective_user.id)
+            if session is not None and session.state == 'confirm_send' and session.payload[0] == update.effective_chat.id:
+                self.sessions.pop(update.effective_user.id)
+                if answer == 'YES':
+                    await self.confirm_send(update, *session.payload[1:])
+                else:
+                    await self.reply(update, "Cancelled, nothing was sent.")
+                return
         print(f"Received message: {text}")
         print(f'User ({update.message.chat.id}) in {message_type}: "{text}"')
         if message_type == 'group':
@@ -179,10 +545,71 @@ class TelegramBot:
 
         #response = handle_response(text)
         print('Bot:', response)
-        await update.message.reply_text(response)
+        await self.reply(update, response)
+
+    async def startup(self, app: Application) -> None:
+        if self.subscriptions is not None:
+            self.head_watcher.ensure_started()
+            self.contract_events_task = asyncio.get_running_loop().create_task(self.follow_contract_events())
+        if self.analytics_snapshot_path:
+            self.analytics_snapshot_task = asyncio.get_running_loop().create_task(self.save_analytics_periodically())
+
+    def load_analytics(self, window_seconds: int) -> TransferAnalytics:
+        # Carry the window over a restart, so the first save doesn't replace it with nothing.
+        if self.analytics_snapshot_path and os.path.exists(self.analytics_snapshot_path):
+            try:
+                return TransferAnalytics.load(self.analytics_snapshot_path, window_seconds)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load analytics snapshot {self.analytics_snapshot_path}: {e}")
+        return TransferAnalytics(window_seconds=window_seconds)
+
+    async def save_analytics_periodically(self) -> None:
+        # Lets the admin stats endpoint, which runs in the web process, see the bot's events.
+        interval = float(os.getenv('ANALYTICS_SNAPSHOT_SECONDS', '60'))
+        saved = len(self.analytics)
+        while True:
+            await asyncio.sleep(interval)
+            if len(self.analytics) == saved:
+                continue
+            data = self.analytics.export()
+            try:
+                await asyncio.to_thread(write_snapshot, self.analytics_snapshot_path, data)
+                saved = len(data['block'])
+            except OSError as e:
+                logger.warning(f"Could not write analytics snapshot: {e}")
+
+    async def follow_contract_events(self) -> None:
+        async for log in self.subscriptions.logs():
+            event = EVENT_NAMES.get(log['topics'][0], 'unknown')
+            if log.get('removed'):
+                logger.warning(f"{event} in {log['transactionHash']} was removed by a reorg")
+                continue
+            CONTRACT_EVENTS.labels(event).inc()
+            if event == 'ETHSent':
+                self.analytics.add_log(log, await self.block_timestamp(log))
+            logger.info(f"{event} in block {int(log['blockNumber'], 16)}: {log['transactionHash']}")
+
+    async def block_timestamp(self, log: dict) -> int:
+        # Backfilled logs arrive long after their block, so arrival time won't do.
+        if 'blockTimestamp' in log:
+            return int(log['blockTimestamp'], 16)
+        number = int(log['blockNumber'], 16)
+        timestamp = self._block_timestamps.get(number)
+        if timestamp is None:
+            block = await asyncio.to_thread(self.http_w3.eth.get_block, number)
+            timestamp = self._block_timestamps[number] = block['timestamp']
+            while len(self._block_timestamps) > 256:
+                self._block_timestamps.popitem(last=False)
+        return timestamp
+
+    async def shutdown(self, app: Application) -> None:
+        # Unconfirmed sends survive a restart when a spill file is configured.
+        self.sessions.close()
 
     async def error(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         print(f"Update {update} caused error {context.error}")
+        if isinstance(update, Update):
+            self.dedupe.abort(update.update_id, self.dedupe.stop_capture())
 
     def transferFunds(self):
         self.transfer('0xa38062B76617585a6DB4AF9759ef3A850B35Ed9a', 0.002)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+READ_CACHE_REQUESTS = metrics.REGISTRY.counter(
+    'telegrambot_read_cache_requests_total',
+    'Chain reads by cache outcome; hit rate is (hit + coalesced) / total.',
+    ['result'],
+)
+READ_CACHE_ENTRIES = metrics.REGISTRY.gauge(
+    'telegrambot_read_cache_entries',
+    'Entries held for the current block.',
+)
+HEAD_BLOCK = metrics.REGISTRY.gauge(
+    'telegrambot_head_block',
+    'Latest block number seen by the head watcher.',
+)
+
+_HIT = READ_CACHE_REQUESTS.labels('hit')
+_COALESCED = READ_CACHE_REQUESTS.labels('coalesced')
+_MISS = READ_CACHE_REQUESTS.labels('miss')
+_MISSING = object()
+
+
+class BlockCache:
+    """Chain reads computed at most once per block per key.
+
+    Every entry belongs to the head block it was computed at; when the head
+    watcher reports a new block the whole cache is dropped. Concurrent
+    requests for a key that is still being fetched wait on the same future
+    instead of issuing their own RPC. Size is bounded LRU-style.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.block = None
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def on_new_block(self, number: int):
+        if number == self.block:
+            return
+        self.block = number
+        self._entries.clear()
+        READ_CACHE_ENTRIES.set(0)
+        HEAD_BLOCK.set(number)
+
+    async def get(self, key, compute):
+        """Return the value for ``key`` at the current block; ``compute(block)`` is awaited on a miss."""
+        block = self.block
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            self._entries.move_to_end(key)
+            _HIT.inc()
+            return entry
+
+        future = self._inflight.get((key, block))
+        if future is not None:
+            _COALESCED.inc()
+            return await asyncio.shield(future)
+
+        _MISS.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(key, block)] = future
+        try:
+            value = await compute(block)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody else awaited is not logged.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if self.block == block:
+                self._store(key, value)
+            return value
+        finally:
+            del self._inflight[(key, block)]
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        READ_CACHE_ENTRIES.set(len(self._entries))
+
+
+class HeadWatcher:
+    """The single task that follows the chain head and invalidates the cache.
+
+    With a SubscriptionManager the head comes from its ``newHeads`` stream
+    and nothing is polled; otherwise ``eth_blockNumber`` is polled every
+    ``interval`` seconds. Listeners are plain callables taking the new block
+    number; they run in a worker thread once per new block, so they may make
+    blocking RPC calls.
+    """
+
+    def __init__(self, w3, cache: BlockCache, interval: float = 2.0, subscriptions=None):
+        self.w3 = w3
+        self.cache = cache
+        self.interval = interval
+        self.subscriptions = subscriptions
+        self.listeners = []
+        self._task = None
+        self._ready = None
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def wait_ready(self):
+        self.ensure_started()
+        await self._ready.wait()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.subscriptions is not None:
+            self.subscriptions.stop()
+
+    async def _run(self):
+        if self.subscriptions is not None:
+            await self._follow()
+            return
+        while True:
+            try:
+                number = await asyncio.to_thread(lambda: self.w3.eth.block_number)
+            except Exception as e:
+                logger.warning(f"Head watcher failed to fetch block number: {e}")
+            else:
+                is_new = number != self.cache.block
+                self.cache.on_new_block(number)
+                self._ready.set()
+                if is_new:
+                    await self._notify(number)
+            await asyncio.sleep(self.interval)
+
+    async def _follow(self):
+        heads = self.subscriptions.heads()
+        self.subscriptions.ensure_started()
+        try:
+            async for head in heads:
+                number = int(head['number'], 16)
+                is_new = number != self.cache.block
+                self.cache.on_new_block(number)
+                self._ready.set()
+                if is_new:
+                    await self._notify(number)
+        finally:
+            heads.close()
+
+    async def _notify(self, number: int):
+        for listener in self.listeners:
+            try:
+                await asyncio.to_thread(listener, number)
+            except Exception as e:
+                logger.warning(f"Head listener {listener} failed at block {number}: {e}")
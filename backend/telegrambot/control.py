@@ -0,0 +1,102 @@
+"""Loopback HTTP endpoint of the bot process for metrics and profiling.
+
+The bot runs in its own process (``manage.py runbot``), so the web
+process's ``/metrics`` and ``/profile/`` views only see themselves. This
+server runs next to the bot and serves the bot's registry and profiler.
+The web views proxy to it at ``BOT_CONTROL_URL``. It binds to
+127.0.0.1 by default and has no authentication of its own: the admin
+checks happen in the web views.
+"""
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import metrics
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9108
+MAX_PROFILE_SECONDS = 600
+
+
+def control_url() -> str:
+    return os.getenv('BOT_CONTROL_URL', f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self._send(200, metrics.REGISTRY.render(process='bot'), metrics.CONTENT_TYPE)
+        elif path == '/profile':
+            if profiler.last_output_path is None:
+                self._send_json(404, {"error": "No profile has been collected yet"})
+                return
+            with open(profiler.last_output_path) as f:
+                self._send(200, f.read(), 'text/plain; charset=utf-8')
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/profile':
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            seconds = float(parse_qs(url.query).get('seconds', ['30'])[0])
+        except ValueError:
+            self._send_json(400, {"error": "seconds must be a number"})
+            return
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            self._send_json(400, {"error": f"seconds must be between 0 and {MAX_PROFILE_SECONDS}"})
+            return
+        path = profiler.start(seconds)
+        if path is None:
+            self._send_json(409, {"error": "A profile is already running"})
+            return
+        self._send_json(202, {"message": f"Profiling for {seconds:g}s", "output": path})
+
+    def _send_json(self, code: int, body: dict):
+        self._send(code, json.dumps(body), 'application/json')
+
+    def _send(self, code: int, body: str, content_type: str):
+        data = body.encode()
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Control request: {format % args}")
+
+
+class ControlServer:
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_env(cls) -> 'ControlServer':
+        return cls(os.getenv('BOT_CONTROL_HOST', DEFAULT_HOST), int(os.getenv('BOT_CONTROL_PORT', str(DEFAULT_PORT))))
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'ControlServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='bot-control', daemon=True)
+        self._thread.start()
+        logger.info(f"Bot control server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,170 @@
+import contextvars
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_UPDATES = metrics.REGISTRY.counter(
+    'telegrambot_duplicate_updates_total',
+    'Updates recognised as already handled, by how they were recognised.',
+    ['match'],
+)
+
+_captured_replies = contextvars.ContextVar('telegrambot_captured_replies', default=None)
+
+NEW = 'new'
+DUPLICATE = 'duplicate'
+IN_FLIGHT = 'in_flight'
+
+
+def capture_reply(text: str):
+    """Remember a reply sent while handling the current update, if it is being deduplicated."""
+    replies = _captured_replies.get()
+    if replies is not None:
+        replies.append(text)
+
+
+class RotatingBloomFilter:
+    """A fixed-size Bloom filter that forgets the oldest keys.
+
+    Keys go into the newest of ``generations`` filters; once it holds
+    ``capacity`` keys the oldest filter is cleared and becomes the newest.
+    Membership is checked against all of them, so a key is remembered for
+    at least ``capacity * (generations - 1)`` insertions, memory never grows,
+    and the false positive rate stays near ``error_rate`` per generation.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 1e-4, generations: int = 2):
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._filters = [bytearray((self.bits + 7) // 8) for _ in range(generations)]
+        self._count = 0
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves.
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: bytes):
+        if self._count >= self.capacity:
+            oldest = self._filters.pop(0)
+            oldest[:] = bytes(len(oldest))
+            self._filters.append(oldest)
+            self._count = 0
+        current = self._filters[-1]
+        for position in self._positions(key):
+            current[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        positions = self._positions(key)
+        return any(
+            all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+            for bits in self._filters
+        )
+
+
+class UpdateDeduplicator:
+    """Recognise updates that were already handled and keep what was replied.
+
+    The most recent ``window_size`` update ids and fingerprints are held
+    exactly, with the replies they produced, so a duplicate can be answered
+    the same way. Older update ids live on in a rotating Bloom filter: a
+    redelivery found there is suppressed without a stored answer. Telegram
+    update ids only increase, so an id above the highest one seen is new
+    without consulting the filter and false positives cannot drop fresh
+    updates. Fingerprints (the same user repeating a side-effecting command)
+    only count within ``fingerprint_ttl`` seconds. An update whose handler
+    failed is settled with ``abort`` so it does not stay in flight.
+    """
+
+    def __init__(self, window_size: int = 10_000, fingerprint_ttl: float = 30.0,
+                 bloom_capacity: int = 100_000, bloom_error_rate: float = 1e-4, clock=time.monotonic):
+        self.window_size = window_size
+        self.fingerprint_ttl = fingerprint_ttl
+        self.clock = clock
+        self.bloom = RotatingBloomFilter(bloom_capacity, bloom_error_rate)
+        self.max_update_id = -1
+        # key -> (recorded_at, replies); replies is None while still being handled.
+        self._recent = OrderedDict()
+        self._fingerprints = {}
+
+    def begin(self, update_id: int, fingerprint: bytes | None = None) -> tuple:
+        """Classify an update as NEW, DUPLICATE or IN_FLIGHT; returns ``(status, stored_replies)``."""
+        now = self.clock()
+        entry = self._recent.get(('update', update_id))
+        if entry is not None:
+            DUPLICATE_UPDATES.labels('update_id').inc()
+            return (IN_FLIGHT, None) if entry[1] is None else (DUPLICATE, entry[1])
+        if update_id <= self.max_update_id and self._id_key(update_id) in self.bloom:
+            DUPLICATE_UPDATES.labels('bloom').inc()
+            return DUPLICATE, None
+        if fingerprint is not None:
+            entry = self._recent.get(('fingerprint', fingerprint))
+            if entry is not None and now - entry[0] < self.fingerprint_ttl:
+                DUPLICATE_UPDATES.labels('fingerprint').inc()
+                return (IN_FLIGHT, None) if entry[1] is None else (DUPLICATE, entry[1])
+        self.max_update_id = max(self.max_update_id, update_id)
+        self.bloom.add(self._id_key(update_id))
+        self._remember(('update', update_id), now, None)
+        if fingerprint is not None:
+            self._remember(('fingerprint', fingerprint), now, None)
+            self._fingerprints[update_id] = fingerprint
+        return NEW, None
+
+    def finish(self, update_id: int, replies: list):
+        """Store the replies of an update that ``begin`` reported as NEW."""
+        entry = self._recent.get(('update', update_id))
+        if entry is not None and entry[1] is not None:
+            # Already settled by abort().
+            return
+        now = self.clock()
+        replies = tuple(replies)
+        self._remember(('update', update_id), now, replies)
+        fingerprint = self._fingerprints.pop(update_id, None)
+        if fingerprint is not None:
+            self._remember(('fingerprint', fingerprint), now, replies)
+
+    def abort(self, update_id: int, replies: list):
+        """Settle an update whose handler failed.
+
+        A redelivery of the same update is still answered from ``replies``
+        and not handled again. Its fingerprint is forgotten, so the user can
+        repeat the command.
+        """
+        self._remember(('update', update_id), self.clock(), tuple(replies))
+        fingerprint = self._fingerprints.pop(update_id, None)
+        if fingerprint is not None:
+            self._recent.pop(('fingerprint', fingerprint), None)
+
+    @staticmethod
+    def _id_key(update_id: int) -> bytes:
+        return update_id.to_bytes(8, 'little', signed=True)
+
+    def _remember(self, key, now: float, replies):
+        self._recent[key] = (now, replies)
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.window_size:
+            (kind, value), _ = self._recent.popitem(last=False)
+            if kind == 'update':
+                # Never settled (the update was lost mid-handling); don't keep its fingerprint either.
+                self._fingerprints.pop(value, None)
+
+    @staticmethod
+    def start_capture():
+        """Begin collecting replies for the update being handled in this context."""
+        _captured_replies.set([])
+
+    @staticmethod
+    def stop_capture() -> list:
+        replies = _captured_replies.get() or []
+        _captured_replies.set(None)
+        return replies
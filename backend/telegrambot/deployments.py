@@ -0,0 +1,334 @@
+"""Where the contracts are deployed, and how to encode calls to them.
+
+The registry indexes Foundry's ``contract/broadcast/*/<chainId>/run-latest.json``
+files and the contracts' ABIs once. It keeps the result, selectors and
+topics included, in a small JSON snapshot. The snapshot records the mtime
+of every file it was built from. A new process loads it without reading a
+broadcast or hashing a signature, and rebuilds it only when one of those
+files changed or a new run appeared. Compare a rebuild with a snapshot
+load with::
+
+    python -m telegrambot.deployments
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from eth_abi import encode as abi_encode
+from eth_utils import event_signature_to_log_topic, function_signature_to_4byte_selector, to_checksum_address
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_DIR = Path(__file__).resolve().parent.parent.parent / 'contract'
+DEFAULT_BROADCAST_DIR = CONTRACT_DIR / 'broadcast'
+DEFAULT_OUT_DIR = CONTRACT_DIR / 'out'
+# Foundry's cache directory is already ignored by git.
+DEFAULT_SNAPSHOT_PATH = CONTRACT_DIR / 'cache' / 'telegrambot-deployments.json'
+
+SNAPSHOT_VERSION = 1
+
+
+class UnknownDeployment(LookupError):
+    pass
+
+
+def _canonical_type(param: dict) -> str:
+    kind = param['type']
+    if kind.startswith('tuple'):
+        return f"({','.join(_canonical_type(c) for c in param['components'])}){kind[len('tuple'):]}"
+    return kind
+
+
+class ContractCodec:
+    """Selectors, event topics and argument types of one ABI, computed once.
+
+    ``encode_call`` takes a function name, or its full signature when the
+    name is overloaded.
+    """
+
+    def __init__(self, abi: list, functions: list, events: list, errors: list):
+        self.abi = abi
+        self._functions = functions
+        self._events = events
+        self._errors = errors
+        self.selectors = {}
+        names = {}
+        for signature, selector, types in functions:
+            entry = (bytes.fromhex(selector), types)
+            self.selectors[signature] = entry
+            names.setdefault(signature.split('(')[0], []).append(entry)
+        for name, entries in names.items():
+            if len(entries) == 1:
+                self.selectors.setdefault(name, entries[0])
+        self.topics = {}
+        for signature, topic in events:
+            self.topics[signature] = topic
+            self.topics.setdefault(signature.split('(')[0], topic)
+        # Shaped for RevertDecoder: selector -> (name, types).
+        self.errors = {bytes.fromhex(selector): (name, types) for name, selector, types in errors}
+
+    @classmethod
+    def from_abi(cls, abi: list) -> 'ContractCodec':
+        functions, events, errors = [], [], []
+        for entry in abi:
+            kind = entry.get('type')
+            if kind not in ('function', 'event', 'error'):
+                continue
+            types = [_canonical_type(i) for i in entry.get('inputs', [])]
+            signature = f"{entry['name']}({','.join(types)})"
+            if kind == 'function':
+                functions.append((signature, function_signature_to_4byte_selector(signature).hex(), types))
+            elif kind == 'event':
+                events.append((signature, '0x' + event_signature_to_log_topic(signature).hex()))
+            else:
+                errors.append((entry['name'], function_signature_to_4byte_selector(signature).hex(), types))
+        return cls(abi, functions, events, errors)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ContractCodec':
+        return cls(data['abi'], data['functions'], data['events'], data['errors'])
+
+    def to_dict(self) -> dict:
+        return {'abi': self.abi, 'functions': self._functions, 'events': self._events, 'errors': self._errors}
+
+    def selector(self, function: str) -> bytes:
+        try:
+            return self.selectors[function][0]
+        except KeyError:
+            raise KeyError(f"No unambiguous function {function!r} in the ABI") from None
+
+    def topic(self, event: str) -> str:
+        try:
+            return self.topics[event]
+        except KeyError:
+            raise KeyError(f"No event {event!r} in the ABI") from None
+
+    def encode_call(self, function: str, *args) -> bytes:
+        try:
+            selector, types = self.selectors[function]
+        except KeyError:
+            raise KeyError(f"No unambiguous function {function!r} in the ABI") from None
+        return selector + abi_encode(types, args)
+
+
+class Deployment(NamedTuple):
+    name: str
+    chain_id: int
+    address: str
+    tx_hash: str
+    timestamp: int
+
+
+class DeploymentRegistry:
+    """Resolve (contract name, chain id) to the latest deployed address and the contract's codec.
+
+    ABIs come from ``abi_paths`` (name -> a bare ABI or a Foundry artifact)
+    and otherwise from ``<out_dir>/*/<name>.json``. The first lookup loads
+    the index; ``refresh`` checks the mtimes of the files it was built from
+    and rebuilds it if any of them changed. Lookups do not touch the files
+    again unless ``refresh_interval`` seconds have passed since the last
+    check.
+    """
+
+    def __init__(self, broadcast_dir=DEFAULT_BROADCAST_DIR, abi_paths: dict | None = None,
+                 out_dir=DEFAULT_OUT_DIR, snapshot_path=DEFAULT_SNAPSHOT_PATH, refresh_interval: float | None = None):
+        self.broadcast_dir = os.path.abspath(broadcast_dir)
+        self.abi_paths = {name: os.path.abspath(path) for name, path in (abi_paths or {}).items()}
+        self.out_dir = os.path.abspath(out_dir) if out_dir else None
+        self.snapshot_path = str(snapshot_path) if snapshot_path else None
+        self.refresh_interval = refresh_interval
+        self._sources = None
+        self._checked_at = None
+        self._deployments = {}
+        self._codecs = {}
+
+    def resolve(self, name: str, chain_id: int) -> Deployment:
+        self._ensure_loaded()
+        try:
+            return self._deployments[(name, chain_id)]
+        except KeyError:
+            raise UnknownDeployment(f"No deployment of {name} on chain {chain_id} under {self.broadcast_dir}") from None
+
+    def codec(self, name: str) -> ContractCodec:
+        self._ensure_loaded()
+        try:
+            return self._codecs[name]
+        except KeyError:
+            raise UnknownDeployment(f"No ABI for {name}") from None
+
+    def deployments(self) -> list:
+        self._ensure_loaded()
+        return sorted(self._deployments.values())
+
+    def _ensure_loaded(self):
+        if self._checked_at is not None and (
+                self.refresh_interval is None or time.monotonic() - self._checked_at < self.refresh_interval):
+            return
+        self.refresh()
+
+    def refresh(self, force: bool = False):
+        """Bring the index up to date, from the snapshot if it is still current."""
+        self._checked_at = time.monotonic()
+        if not force and self._current_sources() == self._sources:
+            return
+        # The loaded index says which ABI files to check, so compare after loading.
+        if not force and self._load_snapshot() and self._current_sources() == self._sources:
+            return
+        self._build()
+        self._write_snapshot()
+
+    def _broadcast_files(self) -> list:
+        return sorted(glob.glob(os.path.join(glob.escape(self.broadcast_dir), '*', '*', 'run-latest.json')))
+
+    def _abi_files(self, names) -> dict:
+        found = {}
+        for name in names:
+            if name in self.abi_paths:
+                found[name] = self.abi_paths[name]
+            elif self.out_dir:
+                matches = sorted(glob.glob(os.path.join(glob.escape(self.out_dir), '*', f"{glob.escape(name)}.json")))
+                if matches:
+                    found[name] = matches[0]
+        return found
+
+    def _current_sources(self) -> dict:
+        # ABI files are looked up for the names in the current index; a newly
+        # deployed contract shows up as a changed broadcast file first.
+        names = {name for name, _ in self._deployments} | set(self.abi_paths)
+        paths = self._broadcast_files() + sorted(self._abi_files(names).values())
+        return {path: _mtime(path) for path in paths}
+
+    def _load_snapshot(self) -> bool:
+        if not self.snapshot_path:
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if data.get('version') != SNAPSHOT_VERSION or data.get('broadcast_dir') != self.broadcast_dir:
+            return False
+        self._deployments = {(d[0], d[1]): Deployment(*d) for d in data['deployments']}
+        self._codecs = {name: ContractCodec.from_dict(codec) for name, codec in data['codecs'].items()}
+        self._sources = data['sources']
+        return True
+
+    def _build(self):
+        deployments = {}
+        for path in self._broadcast_files():
+            try:
+                with open(path) as f:
+                    run = json.load(f)
+                chain_id = int(Path(path).parent.name)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping broadcast {path}: {e}")
+                continue
+            receipts = run.get('receipts') or []
+            succeeded = {r.get('transactionHash') for r in receipts if int(r.get('status', '0x1'), 16) == 1}
+            timestamp = int(run.get('timestamp', 0))
+            for tx in run.get('transactions', []):
+                if tx.get('transactionType') not in ('CREATE', 'CREATE2'):
+                    continue
+                name, address = tx.get('contractName'), tx.get('contractAddress')
+                if not name or not address or (receipts and tx.get('hash') not in succeeded):
+                    continue
+                current = deployments.get((name, chain_id))
+                # The same contract deployed by several scripts: the newest run wins.
+                if current is None or timestamp >= current.timestamp:
+                    deployments[(name, chain_id)] = Deployment(
+                        name, chain_id, to_checksum_address(address), tx['hash'], timestamp,
+                    )
+
+        codecs = {}
+        for name, path in self._abi_files({name for name, _ in deployments} | set(self.abi_paths)).items():
+            try:
+                with open(path) as f:
+                    abi = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping ABI {path}: {e}")
+                continue
+            codecs[name] = ContractCodec.from_abi(abi['abi'] if isinstance(abi, dict) else abi)
+
+        self._deployments = deployments
+        self._codecs = codecs
+        self._sources = self._current_sources()
+
+    def _write_snapshot(self):
+        if not self.snapshot_path:
+            return
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'broadcast_dir': self.broadcast_dir,
+            'sources': self._sources,
+            'deployments': [list(d) for d in self._deployments.values()],
+            'codecs': {name: codec.to_dict() for name, codec in self._codecs.items()},
+        }
+        tmp = f"{self.snapshot_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Could not write deployment snapshot {self.snapshot_path}: {e}")
+
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+_registries = {}
+
+
+def get_registry(broadcast_dir=DEFAULT_BROADCAST_DIR, abi_paths: dict | None = None,
+                 out_dir=DEFAULT_OUT_DIR, snapshot_path=DEFAULT_SNAPSHOT_PATH,
+                 refresh_interval: float | None = None) -> DeploymentRegistry:
+    """One registry per configuration for the whole process."""
+    key = (str(broadcast_dir), tuple(sorted((abi_paths or {}).items())), str(out_dir), str(snapshot_path),
+           refresh_interval)
+    registry = _registries.get(key)
+    if registry is None:
+        registry = _registries[key] = DeploymentRegistry(broadcast_dir, abi_paths, out_dir, snapshot_path,
+                                                         refresh_interval)
+    return registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List deployments and time a rebuild against a snapshot load")
+    parser.add_argument('--broadcast-dir', default=str(DEFAULT_BROADCAST_DIR))
+    parser.add_argument('--abi', action='append', default=[], metavar='NAME=PATH',
+                        help="ABI file for a contract, e.g. TelegramMiniApp=abi.json")
+    parser.add_argument('--snapshot', default=str(DEFAULT_SNAPSHOT_PATH))
+    options = parser.parse_args(argv)
+    abi_paths = dict(item.split('=', 1) for item in options.abi)
+
+    registry = DeploymentRegistry(options.broadcast_dir, abi_paths, snapshot_path=options.snapshot)
+    start = time.perf_counter()
+    registry.refresh(force=True)
+    rebuild = time.perf_counter() - start
+
+    registry = DeploymentRegistry(options.broadcast_dir, abi_paths, snapshot_path=options.snapshot)
+    start = time.perf_counter()
+    registry.refresh()
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    registry.refresh()
+    check = time.perf_counter() - start
+
+    for deployment in registry.deployments():
+        has_abi = 'abi' if deployment.name in registry._codecs else 'no abi'
+        print(f"{deployment.chain_id:>8} {deployment.name:<24} {deployment.address} ({has_abi})")
+    print(f"rebuild {rebuild * 1000:.2f}ms, snapshot load {load * 1000:.2f}ms, up-to-date check {check * 1000:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
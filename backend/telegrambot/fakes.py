@@ -0,0 +1,595 @@
+"""In-process stand-ins for the Telegram Bot API and an Ethereum JSON-RPC node.
+
+Both run on a background thread bound to 127.0.0.1 with an ephemeral port,
+so benchmarks and local experiments can point the real bot at them through
+``TELEGRAM_BASE_URL`` and ``ALCHEMY_HTTP_URL`` (and ``ALCHEMY_WS_URL`` when
+the node is started with ``websocket=True``).
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import rlp
+from eth_account import Account
+from eth_abi import encode as abi_encode
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+
+DEFAULT_BALANCE = 10 ** 22
+SEND_ETH_SELECTOR = '0x' + function_signature_to_4byte_selector('sendETH(address)').hex()
+ERROR_SELECTOR = function_signature_to_4byte_selector('Error(string)')
+ETH_SENT_TOPIC = '0x' + keccak(text='ETHSent(address,address,uint256)').hex()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, delayed ACKs
+    # add ~40ms to every keep-alive round trip.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._dispatch(self.rfile.read(length))
+
+    def _dispatch(self, body: bytes):
+        status, payload = self.server.owner.handle_http(self.path, self.headers.get('Content-Type', ''), body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _FakeServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle_http(self, path: str, content_type: str, body: bytes):
+        raise NotImplementedError
+
+
+class FakeTelegramServer(_FakeServer):
+    """Answers getMe, getUpdates, sendMessage and the webhook methods."""
+
+    def __init__(self, token: str = 'bench-token', username: str = 'bench_bot', latency: float = 0.0):
+        super().__init__(latency)
+        self.token = token
+        self.username = username
+        self.sent_messages = []
+        self._updates = []
+        self._webhook_url = ''
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+
+    @property
+    def base_url(self) -> str:
+        # ApplicationBuilder.base_url expects the token to be appended directly.
+        return f"{self.url}/bot"
+
+    def push_update(self, update: dict):
+        with self._cond:
+            self._updates.append(update)
+            self._cond.notify_all()
+
+    def handle_http(self, path, content_type, body):
+        parsed = urlparse(path)
+        prefix = f"/bot{self.token}/"
+        if not parsed.path.startswith(prefix):
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        method = parsed.path[len(prefix):]
+        params = dict(parse_qsl(parsed.query))
+        if body:
+            if content_type.startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body.decode()))
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return 400, {'ok': False, 'error_code': 400, 'description': f'Method {method} not supported'}
+        return 200, {'ok': True, 'result': handler(params)}
+
+    def _api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': self.username}
+
+    def _api_sendMessage(self, params):
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            chat_id = int(params['chat_id'])
+            self.sent_messages.append((time.monotonic(), chat_id, params.get('text', '')))
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'text': params.get('text', ''),
+        }
+
+    def _api_getUpdates(self, params):
+        offset = int(params.get('offset', 0))
+        timeout = min(float(params.get('timeout', 0)), 1.0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            limit = int(params.get('limit', 100))
+            return self._updates[:limit]
+
+    def _api_setWebhook(self, params):
+        self._webhook_url = params.get('url', '')
+        return True
+
+    def _api_deleteWebhook(self, params):
+        self._webhook_url = ''
+        return True
+
+    def _api_getWebhookInfo(self, params):
+        return {'url': self._webhook_url, 'has_custom_certificate': False, 'pending_update_count': len(self._updates)}
+
+
+def _hex(value: int) -> str:
+    return hex(value)
+
+
+def _rpc_error(request_id, code: int, message: str, data=None) -> dict:
+    error = {'code': code, 'message': message}
+    if data is not None:
+        error['data'] = data
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+
+
+def _log_matches(log: dict, criteria: dict) -> bool:
+    address = criteria.get('address')
+    if address:
+        addresses = address if isinstance(address, list) else [address]
+        if log['address'].lower() not in {a.lower() for a in addresses}:
+            return False
+    for position, wanted in enumerate(criteria.get('topics') or []):
+        if wanted is None:
+            continue
+        wanted = wanted if isinstance(wanted, list) else [wanted]
+        if position >= len(log['topics']) or log['topics'][position] not in wanted:
+            return False
+    return True
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+def decode_raw_transaction(raw: bytes) -> dict:
+    if raw[0] == 2:
+        fields = rlp.decode(raw[1:])
+        nonce, gas_price, to, value, data = fields[1], fields[3], fields[5], fields[6], fields[7]
+    elif raw[0] >= 0xc0:
+        fields = rlp.decode(raw)
+        nonce, gas_price, to, value, data = fields[0], fields[1], fields[3], fields[4], fields[5]
+    else:
+        raise RpcError(-32000, f"transaction type {raw[0]} not supported")
+    return {
+        'hash': '0x' + keccak(raw).hex(),
+        'from': Account.recover_transaction(raw),
+        'nonce': int.from_bytes(nonce, 'big'),
+        'gas_price': int.from_bytes(gas_price, 'big'),
+        'to': to_checksum_address(to) if to else None,
+        'value': int.from_bytes(value, 'big'),
+        'input': '0x' + bytes(data).hex(),
+    }
+
+
+class FakeEthereumNode(_FakeServer):
+    """A single-process chain with a mempool, enough for the bot's send path.
+
+    Blocks are produced every ``block_time`` seconds, on every accepted
+    transaction when ``block_time`` is 0, or only through ``mine()`` when it
+    is None. A pending transaction is mined once
+    its gas price reaches the current inclusion price, in nonce order per
+    sender; ``set_gas_price`` raises or lowers that price to simulate fee
+    spikes. Each request sleeps ``latency`` seconds and fails with
+    probability ``error_rate``.
+
+    With ``websocket`` the node also serves JSON-RPC over a WebSocket at
+    ``ws_url``, including ``eth_subscribe`` for ``newHeads`` and ``logs``;
+    blocks are then produced on a timer so subscribers are pushed heads
+    without polling. ``drop_websockets`` closes every open connection.
+    ``max_log_range`` rejects ``eth_getLogs`` spanning more blocks, as
+    hosted providers do.
+    """
+
+    def __init__(self, chain_id: int = 84532, block_time: float | None = 2.0, latency: float = 0.0,
+                 error_rate: float = 0.0, gas_price: int = 10 ** 9, replacement_bump: float = 0.1,
+                 seed: int | None = None, websocket: bool = False, max_log_range: int | None = None):
+        super().__init__(latency)
+        self.websocket = websocket
+        self._ws_server = None
+        self._ws_connections = set()
+        self._subscriptions = {}
+        self._next_subscription = 1
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self.error_rate = error_rate
+        self.max_log_range = max_log_range
+        self.gas_price = gas_price
+        self.replacement_bump = replacement_bump
+        self.random = random.Random(seed)
+        self.block_number = 0
+        self.blocks = [self._make_block(0, [])]
+        self.nonces = {}
+        self.balances = {}
+        self.pending = {}
+        self.transactions = {}
+        self.receipts = {}
+        self.request_counts = {}
+        # Recipients whose fallback reverts, to exercise pre-flight rejection.
+        self.reverting_recipients = set()
+        self._started_at = time.monotonic()
+        self._lock = threading.RLock()
+
+    @property
+    def ws_url(self) -> str:
+        host, port = self._ws_server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    def start(self):
+        super().start()
+        if self.websocket:
+            from websockets.sync.server import serve
+
+            self._ws_server = serve(self._serve_websocket, '127.0.0.1', 0, compression=None)
+            threading.Thread(target=self._ws_server.serve_forever, name='FakeEthereumNode-ws', daemon=True).start()
+            if self.block_time:
+                threading.Thread(target=self._produce, name='FakeEthereumNode-blocks', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._ws_server is not None:
+            server, self._ws_server = self._ws_server, None
+            self.drop_websockets()
+            server.shutdown()
+        super().stop()
+
+    def drop_websockets(self):
+        with self._lock:
+            connections = list(self._ws_connections)
+        for connection in connections:
+            connection.close()
+
+    def set_gas_price(self, gas_price: int):
+        with self._lock:
+            self._advance()
+            self.gas_price = gas_price
+
+    def mine(self, blocks: int = 1):
+        with self._lock:
+            self._advance()
+            for _ in range(blocks):
+                self._mine_block()
+            if self.block_time:
+                # Keep wall-clock production aligned with the manual blocks.
+                self._started_at -= blocks * self.block_time
+
+    def handle_http(self, path, content_type, body):
+        if self.latency:
+            time.sleep(self.latency)
+        payload = json.loads(body)
+        if isinstance(payload, list):
+            return 200, [self._handle_one(item) for item in payload]
+        return 200, self._handle_one(payload)
+
+    def _handle_one(self, item: dict) -> dict:
+        request_id = item.get('id')
+        method = item.get('method', '')
+        with self._lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            return _rpc_error(request_id, -32603, 'fake node error')
+        handler = getattr(self, f"_rpc_{method}", None)
+        if handler is None:
+            return _rpc_error(request_id, -32601, f"the method {method} does not exist/is not available")
+        try:
+            with self._lock:
+                self._advance()
+                result = handler(*item.get('params', []))
+        except RpcError as e:
+            return _rpc_error(request_id, e.code, str(e), e.data)
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    # websocket
+
+    def _serve_websocket(self, connection):
+        with self._lock:
+            self._ws_connections.add(connection)
+        try:
+            for message in connection:
+                if self.latency:
+                    time.sleep(self.latency)
+                item = json.loads(message)
+                method = item.get('method')
+                if method == 'eth_subscribe':
+                    response = self._subscribe(connection, item)
+                elif method == 'eth_unsubscribe':
+                    with self._lock:
+                        removed = self._subscriptions.pop(item['params'][0], None) is not None
+                    response = {'jsonrpc': '2.0', 'id': item.get('id'), 'result': removed}
+                else:
+                    response = self._handle_one(item)
+                connection.send(json.dumps(response))
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._ws_connections.discard(connection)
+                for sub_id in [k for k, (c, _, _) in self._subscriptions.items() if c is connection]:
+                    del self._subscriptions[sub_id]
+
+    def _subscribe(self, connection, item: dict) -> dict:
+        params = item.get('params', [])
+        kind = params[0] if params else None
+        if kind not in ('newHeads', 'logs'):
+            return _rpc_error(item.get('id'), -32602, f"unsupported subscription {kind}")
+        with self._lock:
+            self.request_counts['eth_subscribe'] = self.request_counts.get('eth_subscribe', 0) + 1
+            sub_id = _hex(self._next_subscription)
+            self._next_subscription += 1
+            self._subscriptions[sub_id] = (connection, kind, params[1] if len(params) > 1 else {})
+        return {'jsonrpc': '2.0', 'id': item.get('id'), 'result': sub_id}
+
+    def _publish(self, block: dict, logs: list):
+        header = {k: v for k, v in block.items() if k != 'transactions'}
+        for sub_id, (connection, kind, criteria) in list(self._subscriptions.items()):
+            if kind == 'newHeads':
+                results = [header]
+            else:
+                results = [log for log in logs if _log_matches(log, criteria)]
+            for result in results:
+                message = {'jsonrpc': '2.0', 'method': 'eth_subscription', 'params': {'subscription': sub_id, 'result': result}}
+                try:
+                    connection.send(json.dumps(message))
+                except Exception:
+                    pass
+
+    def _produce(self):
+        while self._httpd is not None:
+            with self._lock:
+                self._advance()
+                next_block = self._started_at + (self.block_number + 1) * self.block_time
+            time.sleep(max(0.0, next_block - time.monotonic()))
+
+    # chain production
+
+    def _advance(self):
+        if not self.block_time:
+            return
+        target = int((time.monotonic() - self._started_at) / self.block_time)
+        while self.block_number < target:
+            self._mine_block()
+
+    def _mine_block(self):
+        number = self.block_number + 1
+        included = []
+        progress = True
+        while progress:
+            progress = False
+            for key, tx in sorted(self.pending.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+                sender, nonce = key
+                if nonce == self.nonces.get(sender, 0) and tx['gas_price'] >= self.gas_price:
+                    del self.pending[key]
+                    self.nonces[sender] = nonce + 1
+                    included.append(tx)
+                    progress = True
+        block = self._make_block(number, included)
+        logs = []
+        for index, tx in enumerate(included):
+            logs.extend(self._apply(tx, block, index, len(logs)))
+        self.blocks.append(block)
+        self.block_number = number
+        if self._subscriptions:
+            self._publish(block, logs)
+
+    def _make_block(self, number: int, txs: list) -> dict:
+        parent = self.blocks[-1]['hash'] if number else '0x' + '00' * 32
+        return {
+            'number': _hex(number),
+            'hash': '0x' + keccak(f"fake-block-{number}".encode()).hex(),
+            'parentHash': parent,
+            'timestamp': _hex(int(time.time())),
+            'baseFeePerGas': _hex(self.gas_price),
+            'gasLimit': _hex(30_000_000),
+            'gasUsed': _hex(21_000 * len(txs)),
+            'miner': '0x' + '00' * 20,
+            'transactions': [tx['hash'] for tx in txs],
+        }
+
+    def _apply(self, tx: dict, block: dict, index: int, log_index: int) -> list:
+        sender = tx['from']
+        self.balances[sender] = self._balance(sender) - tx['value']
+        if tx['to']:
+            self.balances[tx['to']] = self._balance(tx['to']) + tx['value']
+        tx['blockNumber'] = block['number']
+        tx['blockHash'] = block['hash']
+        tx['transactionIndex'] = _hex(index)
+        logs = []
+        if tx['input'].startswith(SEND_ETH_SELECTOR):
+            # TelegramMiniApp emits ETHSent(sender, recipient, amount).
+            recipient = to_checksum_address('0x' + tx['input'][-40:])
+            logs.append({
+                'address': tx['to'],
+                'topics': [ETH_SENT_TOPIC],
+                'data': '0x' + abi_encode(['address', 'address', 'uint256'], [sender, recipient, tx['value']]).hex(),
+                'blockNumber': block['number'],
+                'blockHash': block['hash'],
+                'transactionHash': tx['hash'],
+                'transactionIndex': _hex(index),
+                'logIndex': _hex(log_index),
+                'removed': False,
+            })
+        self.receipts[tx['hash']] = {
+            'transactionHash': tx['hash'],
+            'transactionIndex': _hex(index),
+            'blockHash': block['hash'],
+            'blockNumber': block['number'],
+            'from': sender,
+            'to': tx['to'],
+            'cumulativeGasUsed': _hex(21_000 * (index + 1)),
+            'gasUsed': _hex(21_000),
+            'effectiveGasPrice': _hex(tx['gas_price']),
+            'contractAddress': None,
+            'logs': logs,
+            'logsBloom': '0x' + '00' * 256,
+            'status': '0x1',
+            'type': '0x0',
+        }
+        return logs
+
+    def _balance(self, address: str) -> int:
+        return self.balances.get(address, DEFAULT_BALANCE)
+
+    def _block(self, tag) -> dict:
+        if tag in ('latest', 'pending', 'safe', 'finalized', None):
+            return self.blocks[-1]
+        if tag == 'earliest':
+            return self.blocks[0]
+        number = int(tag, 16)
+        if number > self.block_number:
+            return None
+        return self.blocks[number]
+
+    # JSON-RPC methods
+
+    def _rpc_eth_chainId(self):
+        return _hex(self.chain_id)
+
+    def _rpc_net_version(self):
+        return str(self.chain_id)
+
+    def _rpc_eth_blockNumber(self):
+        return _hex(self.block_number)
+
+    def _rpc_eth_gasPrice(self):
+        return _hex(self.gas_price)
+
+    def _rpc_eth_maxPriorityFeePerGas(self):
+        return _hex(10 ** 6)
+
+    def _rpc_eth_getBalance(self, address, block='latest'):
+        return _hex(self._balance(to_checksum_address(address)))
+
+    def _rpc_eth_getTransactionCount(self, address, block='latest'):
+        address = to_checksum_address(address)
+        count = self.nonces.get(address, 0)
+        if block == 'pending':
+            while (address, count) in self.pending:
+                count += 1
+        return _hex(count)
+
+    def _rpc_eth_getBlockByNumber(self, tag, full=False):
+        return self._block(tag)
+
+    def _rpc_eth_getLogs(self, criteria):
+        start = self._block(criteria.get('fromBlock', 'latest'))
+        end = self._block(criteria.get('toBlock', 'latest')) or self.blocks[-1]
+        if start is None:
+            return []
+        span = int(end['number'], 16) - int(start['number'], 16) + 1
+        if self.max_log_range is not None and span > self.max_log_range:
+            raise RpcError(-32602, f"eth_getLogs is limited to a {self.max_log_range} block range")
+        logs = []
+        for block in self.blocks[int(start['number'], 16):int(end['number'], 16) + 1]:
+            for tx_hash in block['transactions']:
+                logs.extend(log for log in self.receipts[tx_hash]['logs'] if _log_matches(log, criteria))
+        return logs
+
+    def _rpc_eth_estimateGas(self, tx, block='latest'):
+        return _hex(21_000 if not tx.get('data') and not tx.get('input') else 60_000)
+
+    def _rpc_eth_call(self, tx, block='latest'):
+        # Mirrors TelegramMiniApp.sendETH: require(msg.value > 0), then forward.
+        data = tx.get('data') or tx.get('input') or '0x'
+        if data.startswith(SEND_ETH_SELECTOR):
+            if int(tx.get('value', '0x0'), 16) == 0:
+                revert = '0x' + (ERROR_SELECTOR + abi_encode(['string'], ['Send some ETH'])).hex()
+                raise RpcError(3, 'execution reverted: Send some ETH', revert)
+            recipient = to_checksum_address('0x' + data[-40:])
+            if recipient in self.reverting_recipients:
+                raise RpcError(3, 'execution reverted')
+        return '0x'
+
+    def _rpc_eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def _rpc_eth_getTransactionByHash(self, tx_hash):
+        tx = self.transactions.get(tx_hash)
+        if tx is None:
+            return None
+        return {
+            'hash': tx['hash'],
+            'from': tx['from'],
+            'to': tx['to'],
+            'nonce': _hex(tx['nonce']),
+            'gasPrice': _hex(tx['gas_price']),
+            'gas': _hex(200_000),
+            'value': _hex(tx['value']),
+            'input': tx['input'],
+            'blockNumber': tx.get('blockNumber'),
+            'blockHash': tx.get('blockHash'),
+            'transactionIndex': tx.get('transactionIndex'),
+            'type': '0x0',
+            'chainId': _hex(self.chain_id),
+            'v': '0x0', 'r': '0x0', 's': '0x0',
+        }
+
+    def _rpc_eth_sendRawTransaction(self, raw_hex):
+        tx = decode_raw_transaction(bytes.fromhex(raw_hex[2:] if raw_hex.startswith('0x') else raw_hex))
+        key = (tx['from'], tx['nonce'])
+        if tx['nonce'] < self.nonces.get(tx['from'], 0):
+            raise RpcError(-32000, 'nonce too low')
+        existing = self.pending.get(key)
+        if existing is not None and existing['hash'] != tx['hash']:
+            if tx['gas_price'] < existing['gas_price'] * (1 + self.replacement_bump):
+                raise RpcError(-32000, 'replacement transaction underpriced')
+        self.pending[key] = tx
+        self.transactions[tx['hash']] = tx
+        if self.block_time == 0:
+            self._mine_block()
+        return tx['hash']
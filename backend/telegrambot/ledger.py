@@ -0,0 +1,128 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+from .models import LedgerEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry: LedgerEntry) -> str:
+    # Integer arithmetic: a float timestamp can be off by a microsecond.
+    micros = (entry.created - _EPOCH) // _MICROSECOND
+    return f"{micros}-{entry.pk}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        micros, pk = (int(part) for part in cursor.split('-'))
+        return _EPOCH + micros * _MICROSECOND, pk
+    except (ValueError, OverflowError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+def history_page(telegram_user_id: int | None = None, recipient: str | None = None,
+                 cursor: str | None = None, limit: int = DEFAULT_PAGE_SIZE) -> tuple:
+    """Return ``(entries, next_cursor)``, newest first, for a user or a recipient.
+
+    Pages are addressed by the (created, id) of the last row seen rather
+    than an OFFSET, so every page is a bounded range scan on the matching
+    composite index no matter how deep it is.
+    """
+    if (telegram_user_id is None) == (recipient is None):
+        raise ValueError("Filter by exactly one of telegram_user_id or recipient")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if telegram_user_id is not None:
+        entries = LedgerEntry.objects.filter(telegram_user_id=telegram_user_id)
+    else:
+        entries = LedgerEntry.objects.filter(recipient=recipient)
+    if cursor:
+        created, pk = decode_cursor(cursor)
+        entries = entries.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+    page = list(entries.order_by('-created', '-pk')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+class LedgerWriter:
+    """Buffer ledger writes and apply them in bulk from a background thread.
+
+    New entries go out with one ``bulk_create`` per batch; status changes
+    queued after them are applied in the same pass, so an update never
+    overtakes the insert it refers to. ``flush`` writes everything
+    synchronously, e.g. before reading a user's history.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._entries = []
+        self._updates = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, **fields):
+        with self._lock:
+            self._entries.append(LedgerEntry(**fields))
+            full = len(self._entries) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def update_status(self, chain_id: int, tx_hash: str, status: str, landed_hash: str | None = None):
+        with self._lock:
+            self._updates.append((chain_id, tx_hash, status, landed_hash))
+        self._ensure_thread()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                entries, self._entries = self._entries, []
+                updates, self._updates = self._updates, []
+            try:
+                if entries:
+                    LedgerEntry.objects.bulk_create(entries, batch_size=self.batch_size, ignore_conflicts=True)
+                    entries = []
+                while updates:
+                    chain_id, tx_hash, status, landed_hash = updates[0]
+                    changes = {'status': status}
+                    if landed_hash and landed_hash != tx_hash:
+                        changes['tx_hash'] = landed_hash
+                    LedgerEntry.objects.filter(chain_id=chain_id, tx_hash=tx_hash).update(**changes)
+                    updates.pop(0)
+            except Exception:
+                # Keep whatever was not written for the next pass.
+                with self._lock:
+                    self._entries[:0] = entries
+                    self._updates[:0] = updates
+                raise
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ledger flush failed: {e}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Connect to the chain and run the Telegram bot with long polling."
+
+    def handle(self, *args, **options):
+        from telegrambot.bot import TelegramBot
+        from telegrambot.control import ControlServer
+
+        # Metrics and the profiler live in this process; the web views proxy to it.
+        ControlServer.from_env().start()
+        bot_instance = TelegramBot()
+        bot_instance.initialize_web3_connections()
+        bot_instance.setup_app()
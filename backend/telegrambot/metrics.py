@@ -0,0 +1,308 @@
+import abc
+import functools
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Prometheus text exposition format, see
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds. Covers a fast in-memory reply up to a slow RPC round trip.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Observations are plain attribute updates without a lock: they run on the
+# event loop thread or under the GIL, and metrics are allowed to be
+# best-effort. Keeping the hot path this small is what holds an observation
+# well under a microsecond.
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if value in (math.inf, -math.inf):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, *extra: str) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    pairs.extend(e for e in extra if e)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return _escape_help(value).replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    # HELP text is not quoted, so only backslashes and newlines are escaped.
+    return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    @contextmanager
+    def track_inprogress(self):
+        self.value += 1
+        try:
+            yield
+        finally:
+            self.value -= 1
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # One slot per finite bound plus the +Inf overflow bucket.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self, const: str = '') -> list:
+        lines = [
+            f'# HELP {self.name} {_escape_help(self.documentation)}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child, const))
+        return lines
+
+    def _render_child(self, values, child, const: str) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, values, const)} {_format_value(child.value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def track_inprogress(self):
+        return self._default.track_inprogress()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child, const: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, const, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values, const)
+        lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} already registered with a different shape")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, process: str | None = None) -> str:
+        """Render every metric, labelled with ``process`` when given so expositions can be merged."""
+        const = f'process="{_escape(process)}"' if process else ''
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render(const))
+        return '\n'.join(lines) + '\n'
+
+
+def merge_expositions(*texts: str) -> str:
+    """Combine expositions from several processes, keeping one HELP/TYPE header per metric.
+
+    Samples must already be told apart by a label such as ``process``.
+    """
+    headers = {}
+    samples = {}
+    for text in texts:
+        name = None
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                name = line.split(' ', 3)[2]
+                headers.setdefault(name, {}).setdefault(line[2:6], line)
+            elif line and name is not None:
+                samples.setdefault(name, []).append(line)
+    lines = []
+    for name in sorted(headers):
+        lines.extend(headers[name].get(kind) for kind in ('HELP', 'TYPE') if kind in headers[name])
+        lines.extend(samples.get(name, []))
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'telegrambot_handler_latency_seconds',
+    'Time from an update reaching a handler until the handler returns.',
+    ['handler'],
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'telegrambot_handler_errors_total',
+    'Handler invocations that raised.',
+    ['handler'],
+)
+RPC_LATENCY = REGISTRY.histogram(
+    'telegrambot_rpc_latency_seconds',
+    'JSON-RPC round trip time per method.',
+    ['method'],
+)
+RPC_ERRORS = REGISTRY.counter(
+    'telegrambot_rpc_errors_total',
+    'JSON-RPC calls that failed in transport or returned an error object.',
+    ['method'],
+)
+NONCE_QUEUE_DEPTH = REGISTRY.gauge(
+    'telegrambot_nonce_queue_depth',
+    'Sends currently waiting on a nonce lookup.',
+)
+FEE_QUEUE_DEPTH = REGISTRY.gauge(
+    'telegrambot_fee_queue_depth',
+    'Sends currently waiting on a gas price lookup.',
+)
+OUTBOX_QUEUE_DEPTH = REGISTRY.gauge(
+    'telegrambot_outbox_queue_depth',
+    'Signed transactions currently being broadcast.',
+)
+BOT_SCRAPE_UP = REGISTRY.gauge(
+    'telegrambot_bot_scrape_up',
+    'Whether the web process could read the bot process metrics on the last scrape.',
+)
+
+
+def timed_handler(func):
+    """Record latency and errors of an async Telegram handler under its name."""
+    latency = HANDLER_LATENCY.labels(func.__name__)
+    errors = HANDLER_ERRORS.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    return wrapper
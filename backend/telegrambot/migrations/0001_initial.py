@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_user_id', models.BigIntegerField()),
+                ('chat_id', models.BigIntegerField()),
+                ('chain_id', models.PositiveIntegerField()),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('recipient', models.CharField(max_length=42)),
+                ('amount_wei', models.DecimalField(decimal_places=0, max_digits=78)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('mined', 'Mined'), ('dropped', 'Dropped')], default='pending', max_length=16)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['telegram_user_id', '-created', '-id'], name='ledger_user_created'), models.Index(fields=['recipient', '-created', '-id'], name='ledger_recipient_created')],
+                'constraints': [models.UniqueConstraint(fields=('chain_id', 'tx_hash'), name='ledger_unique_tx')],
+            },
+        ),
+    ]
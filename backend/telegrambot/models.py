@@ -1,3 +1,35 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class LedgerEntry(models.Model):
+    """One ETH send made by the bot on behalf of a Telegram user."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        MINED = 'mined'
+        DROPPED = 'dropped'
+
+    telegram_user_id = models.BigIntegerField()
+    chat_id = models.BigIntegerField()
+    chain_id = models.PositiveIntegerField()
+    # Updated to the hash that landed when a stuck send is fee-bumped.
+    tx_hash = models.CharField(max_length=66)
+    recipient = models.CharField(max_length=42)
+    amount_wei = models.DecimalField(max_digits=78, decimal_places=0)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Keyset pagination walks (created, id) newest first within a user or
+        # a recipient; both indexes cover the filter and the sort.
+        indexes = [
+            models.Index(fields=['telegram_user_id', '-created', '-id'], name='ledger_user_created'),
+            models.Index(fields=['recipient', '-created', '-id'], name='ledger_recipient_created'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['chain_id', 'tx_hash'], name='ledger_unique_tx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tx_hash} -> {self.recipient}"
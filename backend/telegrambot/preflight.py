@@ -0,0 +1,190 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from eth_abi import decode as abi_decode
+from eth_utils import function_signature_to_4byte_selector
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SIMULATIONS = metrics.REGISTRY.counter(
+    'telegrambot_preflight_simulations_total',
+    'Pre-send eth_call simulations by outcome.',
+    ['result'],
+)
+
+ERROR_SELECTOR = function_signature_to_4byte_selector('Error(string)')
+PANIC_SELECTOR = function_signature_to_4byte_selector('Panic(uint256)')
+
+
+class SimulationReverted(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"Transaction would revert: {reason}")
+        self.reason = reason
+
+
+class RevertDecoder:
+    """Turn revert data into a readable reason using Error, Panic and the contract's custom errors."""
+
+    def __init__(self, codec):
+        self.custom_errors = codec.errors
+
+    def decode(self, data: str | None, message: str = '') -> str:
+        raw = bytes.fromhex(data[2:]) if data and data.startswith('0x') else b''
+        selector, payload = raw[:4], raw[4:]
+        try:
+            if selector == ERROR_SELECTOR:
+                return abi_decode(['string'], payload)[0]
+            if selector == PANIC_SELECTOR:
+                return f"panic 0x{abi_decode(['uint256'], payload)[0]:02x}"
+            if selector in self.custom_errors:
+                name, types = self.custom_errors[selector]
+                values = abi_decode(types, payload)
+                return f"{name}({', '.join(str(v) for v in values)})"
+        except Exception:
+            logger.debug(f"Could not decode revert data {data}")
+        if raw:
+            return f"unknown error 0x{raw.hex()}"
+        return message or 'reverted without a reason'
+
+
+class NonceAllocator:
+    """Hand out consecutive nonces per sender from a process-local counter.
+
+    The node's ``pending`` count only moves once a transaction reaches its
+    mempool, so two sends reading it back to back would get the same nonce.
+    The counter never goes below that count, which also covers transactions
+    sent from elsewhere. Every nonce handed out is in flight until the
+    caller reports it ``sent`` or ``failed``. A failed nonce is handed out
+    again before any new one, since later nonces cannot be mined past the
+    gap; once nothing is in flight the counter is dropped and the next
+    allocation starts again from the node.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = {}
+        self._in_flight = {}
+        self._gaps = {}
+
+    def allocate(self, address: str, pending_count: int) -> int:
+        with self._lock:
+            gaps = self._gaps.get(address)
+            if gaps:
+                # Gaps below the node's count were filled by someone else.
+                gaps.difference_update([n for n in gaps if n < pending_count])
+            if gaps:
+                nonce = min(gaps)
+                gaps.discard(nonce)
+            else:
+                nonce = max(self._next.get(address, 0), pending_count)
+                self._next[address] = nonce + 1
+            self._in_flight.setdefault(address, set()).add(nonce)
+            return nonce
+
+    def sent(self, address: str, nonce: int):
+        with self._lock:
+            self._settle(address, nonce)
+
+    def failed(self, address: str, nonce: int):
+        with self._lock:
+            self._settle(address, nonce)
+            if self._in_flight.get(address):
+                # Sends above this nonce are still going out; reuse it rather than rewind.
+                self._gaps.setdefault(address, set()).add(nonce)
+            else:
+                self._next.pop(address, None)
+                self._gaps.pop(address, None)
+
+    def _settle(self, address: str, nonce: int):
+        in_flight = self._in_flight.get(address)
+        if in_flight is not None:
+            in_flight.discard(nonce)
+            if not in_flight:
+                del self._in_flight[address]
+
+
+def _is_revert(error: dict) -> bool:
+    # Geth-style nodes use code 3 with revert data; others only say so in the message.
+    return error.get('code') == 3 or 'revert' in str(error.get('message', '')).lower()
+
+
+class Preflight:
+    """Simulate a send with eth_call alongside the other pre-send reads.
+
+    Nonce, gas price, head block and the simulation go to the node as one
+    JSON-RPC batch. Outcomes are cached per call shape for the block they
+    were simulated at, so an identical send in the same block skips the
+    eth_call (or is rejected without any RPC when it is known to revert).
+    The nonce comes from ``nonces`` and is only allocated once the
+    simulation passed.
+    """
+
+    def __init__(self, w3, codec, cache_size: int = 1024):
+        self.w3 = w3
+        self.decoder = RevertDecoder(codec)
+        self.nonces = NonceAllocator()
+        self.cache_size = cache_size
+        self._outcomes = OrderedDict()
+
+    @staticmethod
+    def shape(call: dict) -> tuple:
+        return (call['from'], call['to'], call.get('data', '0x'), call.get('value', 0), call.get('gas'))
+
+    def check(self, call: dict, known_block: int | None = None) -> tuple:
+        """Return ``(nonce, gas_price)`` for a call that simulates cleanly; raise SimulationReverted otherwise."""
+        shape = self.shape(call)
+        cached = self._outcomes.get(shape)
+        simulate = True
+        if cached is not None and known_block is not None and cached[0] == known_block:
+            SIMULATIONS.labels('cached').inc()
+            if cached[1] is not None:
+                raise SimulationReverted(cached[1])
+            simulate = False
+
+        requests = [
+            ('eth_getTransactionCount', [call['from'], 'pending']),
+            ('eth_gasPrice', []),
+            ('eth_blockNumber', []),
+        ]
+        if simulate:
+            requests.append(('eth_call', [self._rpc_call(call), 'latest']))
+        responses = self.w3.provider.make_batch_request(requests)
+        if not isinstance(responses, list):
+            raise RuntimeError(f"Batch request failed: {responses.get('error')}")
+        for (method, _), response in zip(requests[:3], responses):
+            if 'error' in response:
+                raise RuntimeError(f"{method} failed: {response['error'].get('message')}")
+        pending_count, gas_price, block = (int(r['result'], 16) for r in responses[:3])
+
+        if simulate:
+            reason = self._outcome(responses[3])
+            self._remember(shape, block, reason)
+            if reason is not None:
+                SIMULATIONS.labels('reverted').inc()
+                raise SimulationReverted(reason)
+            SIMULATIONS.labels('ok').inc()
+        return self.nonces.allocate(call['from'], pending_count), gas_price
+
+    def _outcome(self, response: dict) -> str | None:
+        error = response.get('error')
+        if error is None:
+            return None
+        if not _is_revert(error):
+            raise RuntimeError(f"eth_call failed: {error.get('message')}")
+        return self.decoder.decode(error.get('data'), error.get('message', ''))
+
+    def _remember(self, shape: tuple, block: int, reason: str | None):
+        self._outcomes[shape] = (block, reason)
+        self._outcomes.move_to_end(shape)
+        while len(self._outcomes) > self.cache_size:
+            self._outcomes.popitem(last=False)
+
+    @staticmethod
+    def _rpc_call(call: dict) -> dict:
+        rpc = {'from': call['from'], 'to': call['to'], 'data': call.get('data', '0x'), 'value': hex(call.get('value', 0))}
+        if call.get('gas'):
+            rpc['gas'] = hex(call['gas'])
+        return rpc
@@ -0,0 +1,96 @@
+import collections
+import faulthandler
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+_FRAME_LINE = re.compile(r'^  File "(.*)", line (\d+) in (.*)$')
+
+
+def _sample_stacks(out) -> list:
+    """Return ``(thread_id, labels)`` for every other thread, outermost frame first.
+
+    faulthandler walks all the stacks in one C call under the GIL. Walking
+    ``sys._current_frames()`` through ``f_back`` from Python lets the other
+    threads run in between, and on CPython 3.11 a frame that goes away
+    meanwhile crashes the interpreter.
+    """
+    out.seek(0)
+    out.truncate()
+    faulthandler.dump_traceback(out, all_threads=True)
+    out.seek(0)
+    stacks = []
+    labels = None
+    for line in out.read().splitlines():
+        if line.startswith('Thread 0x'):
+            labels = []
+            stacks.append((int(line.split()[1], 16), labels))
+        elif line.startswith('Current thread 0x'):
+            labels = None
+        elif labels is not None:
+            match = _FRAME_LINE.match(line)
+            if match:
+                filename, lineno, name = match.groups()
+                labels.append(f"{name} ({os.path.basename(filename)}:{lineno})")
+    return [(thread_id, labels[::-1]) for thread_id, labels in stacks]
+
+
+class SamplingProfiler:
+    """Sample the stacks of every thread for a fixed window.
+
+    Nothing is installed while idle: sampling happens on a dedicated thread
+    that only exists for the duration of a window, so the process pays no
+    cost until a window is requested. Output is in collapsed-stack format
+    (``thread;outer;...;inner count``), which flamegraph.pl and speedscope
+    read directly. Frames are labelled ``function (file:line)`` with the
+    line each frame was executing.
+    """
+
+    def __init__(self, interval: float = 0.005, output_dir: str | None = None):
+        self.interval = interval
+        self.output_dir = output_dir or os.getenv('PROFILE_DIR', tempfile.gettempdir())
+        self.last_output_path = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> str | None:
+        """Begin a window of ``seconds``. Returns the output path, or None if busy."""
+        with self._lock:
+            if self.running:
+                return None
+            path = os.path.join(self.output_dir, f"telegrambot-{int(time.time())}.collapsed")
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, path), name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return path
+
+    def _run(self, seconds: float, path: str):
+        counts = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        with tempfile.TemporaryFile('w+') as out:
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, labels in _sample_stacks(out):
+                    counts[';'.join([names.get(thread_id, f"thread-{thread_id}")] + labels)] += 1
+                samples += 1
+                time.sleep(self.interval)
+
+        with open(path, 'w') as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        self.last_output_path = path
+        logger.info(f"Profiler wrote {samples} samples to {path}")
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,254 @@
+import argparse
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from web3.exceptions import TransactionNotFound
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING_OWNER_TXS = metrics.REGISTRY.gauge(
+    'telegrambot_pending_owner_transactions',
+    'Owner transactions broadcast but not yet mined.',
+)
+REPLACEMENTS = metrics.REGISTRY.counter(
+    'telegrambot_tx_replacements_total',
+    'Fee-bumped replacements broadcast for stuck transactions.',
+    ['result'],
+)
+NONCE_CLASHES = metrics.REGISTRY.counter(
+    'telegrambot_nonce_clashes_total',
+    'Owner transactions tracked at a nonce another tracked transaction already holds.',
+)
+
+# Geth and most clients reject a replacement unless its price is at least
+# 10% above the transaction it replaces.
+MIN_REPLACEMENT_BUMP = 0.10
+
+
+class NonceClash(RuntimeError):
+    pass
+
+
+class PendingTransaction:
+    __slots__ = ('tx', 'nonce', 'gas_price', 'rejected_price', 'hashes', 'first_seen_block', 'last_bump_block',
+                 'landed_hash', 'capped')
+
+    def __init__(self, tx: dict, tx_hash: str):
+        self.tx = dict(tx)
+        self.nonce = tx['nonce']
+        self.gas_price = tx['gasPrice']
+        # Highest price a replacement was refused at; the next attempt bumps from it.
+        self.rejected_price = None
+        self.hashes = [tx_hash]
+        self.first_seen_block = None
+        self.last_bump_block = None
+        self.landed_hash = None
+        self.capped = False
+
+
+def _normalize_hash(tx_hash) -> str:
+    tx_hash = tx_hash.hex() if isinstance(tx_hash, (bytes, bytearray)) else str(tx_hash)
+    tx_hash = tx_hash.lower()
+    return tx_hash if tx_hash.startswith('0x') else '0x' + tx_hash
+
+
+class ReplacementEngine:
+    """Re-sign stuck owner transactions at the same nonce with a higher gas price.
+
+    ``on_new_block`` is driven by the head watcher. A transaction that has
+    not been mined ``stuck_after_blocks`` blocks after it was first seen (or
+    after its last bump) is replaced with its price raised by
+    ``bump_percent`` and at least to the node's current price, never below
+    the node's minimum replacement increment and never above
+    ``max_gas_price``. Every hash broadcast for a nonce is kept so the one
+    that finally landed can be reported; ``settled_listeners`` are called
+    with the original hash and the landed one (None if none of ours did).
+    """
+
+    def __init__(self, w3, private_key: str, stuck_after_blocks: int = 3, bump_percent: float = 12.5,
+                 max_gas_price: int | None = None, max_price_multiplier: float = 5.0, history_size: int = 1000):
+        self.w3 = w3
+        self.private_key = private_key
+        self.account = w3.eth.account.from_key(private_key)
+        self.stuck_after_blocks = stuck_after_blocks
+        self.bump = max(bump_percent / 100, MIN_REPLACEMENT_BUMP)
+        self.max_gas_price = max_gas_price
+        self.max_price_multiplier = max_price_multiplier
+        self.history_size = history_size
+        self._pending = {}
+        self._by_hash = OrderedDict()
+        self._lock = threading.Lock()
+        self.settled_listeners = []
+
+    def track(self, tx: dict, tx_hash):
+        """Watch a broadcast transaction; raises NonceClash if its nonce is already being watched.
+
+        The clashing hash is still remembered under the existing record, so
+        whichever of the two lands is found when the nonce settles.
+        """
+        tx_hash = _normalize_hash(tx_hash)
+        with self._lock:
+            existing = self._pending.get(tx['nonce'])
+            if existing is not None:
+                if tx_hash not in existing.hashes:
+                    existing.hashes.append(tx_hash)
+                    self._remember(tx_hash, existing)
+                NONCE_CLASHES.inc()
+                logger.error(f"Nonce {tx['nonce']} is already pending as {existing.hashes[0]}; {tx_hash} clashes with it")
+                raise NonceClash(f"Nonce {tx['nonce']} is already used by pending transaction {existing.hashes[0]}")
+            record = PendingTransaction(tx, tx_hash)
+            self._pending[record.nonce] = record
+            self._remember(tx_hash, record)
+            PENDING_OWNER_TXS.set(len(self._pending))
+
+    def resolve(self, tx_hash) -> str | None:
+        """The hash that landed (or the latest replacement) for any hash we broadcast."""
+        with self._lock:
+            record = self._by_hash.get(_normalize_hash(tx_hash))
+            if record is None:
+                return None
+            return record.landed_hash or record.hashes[-1]
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def on_new_block(self, number: int):
+        with self._lock:
+            if not self._pending:
+                return
+            pending = sorted(self._pending.values(), key=lambda r: r.nonce)
+        mined_nonce = self.w3.eth.get_transaction_count(self.account.address, 'latest')
+        for record in pending:
+            if record.nonce < mined_nonce:
+                self._settle(record)
+                continue
+            if record.first_seen_block is None:
+                record.first_seen_block = number
+            since = record.last_bump_block or record.first_seen_block
+            if number - since >= self.stuck_after_blocks and not record.capped:
+                self._replace(record, number)
+
+    def _settle(self, record: PendingTransaction):
+        for tx_hash in reversed(record.hashes):
+            try:
+                self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            record.landed_hash = tx_hash
+            break
+        with self._lock:
+            self._pending.pop(record.nonce, None)
+            PENDING_OWNER_TXS.set(len(self._pending))
+        if record.landed_hash is None:
+            # The nonce was consumed by a transaction we did not broadcast.
+            logger.warning(f"Nonce {record.nonce} was mined but none of {record.hashes} landed")
+        elif len(record.hashes) > 1:
+            logger.info(f"Nonce {record.nonce} landed as {record.landed_hash} after {len(record.hashes) - 1} replacement(s)")
+        for listener in self.settled_listeners:
+            try:
+                listener(record.hashes[0], record.landed_hash)
+            except Exception as e:
+                logger.warning(f"Settled listener {listener} failed for nonce {record.nonce}: {e}")
+
+    def _replace(self, record: PendingTransaction, number: int):
+        original_price = record.tx['gasPrice']
+        cap = self.max_gas_price or int(original_price * self.max_price_multiplier)
+        minimum = math.ceil(record.gas_price * (1 + MIN_REPLACEMENT_BUMP)) + 1
+        base = max(record.gas_price, record.rejected_price or 0)
+        new_price = max(math.ceil(base * (1 + self.bump)), minimum, self.w3.eth.gas_price)
+        if new_price > cap:
+            if minimum > cap or (record.rejected_price or 0) >= cap:
+                record.capped = True
+                REPLACEMENTS.labels('capped').inc()
+                logger.warning(f"Nonce {record.nonce} is stuck at {record.gas_price} wei; fee cap {cap} reached")
+                return
+            new_price = cap
+
+        tx = dict(record.tx, gasPrice=new_price)
+        signed = self.w3.eth.account.sign_transaction(tx, self.private_key)
+        try:
+            tx_hash = _normalize_hash(self.w3.eth.send_raw_transaction(signed.raw_transaction))
+        except Exception as e:
+            message = str(e).lower()
+            if 'nonce too low' in message or 'already known' in message:
+                # Mined (or accepted) between our checks; settle on the next block.
+                return
+            REPLACEMENTS.labels('rejected').inc()
+            logger.warning(f"Replacement for nonce {record.nonce} at {new_price} wei rejected: {e}")
+            record.rejected_price = new_price
+            record.last_bump_block = number
+            return
+
+        REPLACEMENTS.labels('sent').inc()
+        logger.info(f"Replaced nonce {record.nonce}: {record.gas_price} -> {new_price} wei, {tx_hash}")
+        with self._lock:
+            record.gas_price = new_price
+            record.hashes.append(tx_hash)
+            record.last_bump_block = number
+            self._remember(tx_hash, record)
+
+    def _remember(self, tx_hash: str, record: PendingTransaction):
+        self._by_hash[tx_hash] = record
+        while len(self._by_hash) > self.history_size:
+            self._by_hash.popitem(last=False)
+
+
+def simulate_fee_spike(spike_multiplier: float = 3.0, stuck_after_blocks: int = 2, max_blocks: int = 30,
+                       node_replacement_bump: float = 0.1) -> dict:
+    """Send one transaction, spike the node's inclusion price and mine until it lands.
+
+    ``node_replacement_bump`` is the increment the node demands of a
+    replacement; above the engine's bump, the first replacements are refused.
+    """
+    from web3 import Web3
+    from .benchmark import BENCH_PRIVATE_KEY, BENCH_RECIPIENT
+    from .fakes import FakeEthereumNode
+
+    with FakeEthereumNode(block_time=None, gas_price=10 ** 9, replacement_bump=node_replacement_bump) as node:
+        w3 = Web3(Web3.HTTPProvider(node.url))
+        engine = ReplacementEngine(w3, BENCH_PRIVATE_KEY, stuck_after_blocks=stuck_after_blocks)
+        tx = {
+            'to': BENCH_RECIPIENT,
+            'value': 10 ** 15,
+            'gas': 21000,
+            'gasPrice': w3.eth.gas_price,
+            'nonce': w3.eth.get_transaction_count(engine.account.address),
+            'chainId': node.chain_id,
+        }
+        original = w3.eth.send_raw_transaction(w3.eth.account.sign_transaction(tx, BENCH_PRIVATE_KEY).raw_transaction)
+        engine.track(tx, original)
+        node.set_gas_price(int(node.gas_price * spike_multiplier))
+        blocks = 0
+        while engine.pending_count and blocks < max_blocks:
+            node.mine()
+            blocks += 1
+            engine.on_new_block(node.block_number)
+        record = engine._by_hash[_normalize_hash(original)]
+        return {
+            'blocks': blocks,
+            'landed_hash': record.landed_hash,
+            'hashes': record.hashes,
+            'original_gas_price': tx['gasPrice'],
+            'final_gas_price': record.gas_price,
+            'spiked_gas_price': node.gas_price,
+            'mined': node.receipts.get(record.landed_hash) is not None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a fee spike against the fake node and watch the replacement engine")
+    parser.add_argument('--spike', type=float, default=3.0, help="multiplier applied to the inclusion gas price")
+    parser.add_argument('--stuck-after-blocks', type=int, default=2)
+    options = parser.parse_args(argv)
+    result = simulate_fee_spike(options.spike, options.stuck_after_blocks)
+    print(f"Landed {result['landed_hash']} after {result['blocks']} blocks and {len(result['hashes']) - 1} replacement(s)")
+    print(f"Final gas price {result['final_gas_price']} wei (node inclusion price {result['spiked_gas_price']} wei)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Record anonymized Telegram updates and replay them against the fake servers.
+
+Recording is switched on by ``TELEGRAM_RECORD_PATH``: every incoming update
+is anonymized and appended to that file. The file is a short header followed
+by length-prefixed records, so it can be appended to while the bot runs and
+read back through ``mmap`` one record at a time::
+
+    python -m telegrambot.replay updates.rec --speed 10
+    python -m telegrambot.replay updates.rec --speed max --concurrency 32
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+from .benchmark import configure_bot_env, summarize
+from .fakes import FakeEthereumNode, FakeTelegramServer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TGREC1'
+# Header: magic, u32 metadata length, metadata JSON.
+# Record: u32 payload length, f64 receive time (unix seconds), compact JSON payload.
+_LENGTH = struct.Struct('<I')
+_RECORD = struct.Struct('<Id')
+
+# A dict with an integer id and any of these keys is a User or a Chat,
+# wherever it appears: from, chat, new_chat_members[*], left_chat_member,
+# forward_origin.sender_user, reply_to_message.from, ...
+_IDENTITY_KEYS = {'first_name', 'last_name', 'username', 'type', 'title', 'is_bot'}
+_NAME_FIELDS = {'first_name': 'User', 'last_name': '', 'title': 'Chat'}
+# Names that stand alone rather than inside a User or Chat.
+_LOOSE_NAME_FIELDS = {'sender_user_name': 'User', 'author_signature': 'User'}
+_DROPPED_FIELDS = {'phone_number', 'email', 'bio', 'photo', 'location', 'contact'}
+
+
+def _is_identity(data: dict) -> bool:
+    return isinstance(data.get('id'), int) and not isinstance(data['id'], bool) and not _IDENTITY_KEYS.isdisjoint(data)
+
+
+class Anonymizer:
+    """Replace identities with stable keyed hashes, keeping the update shape.
+
+    Every User- or Chat-shaped dict is scrubbed, inside lists too. User and
+    chat ids map to the same pseudonym every time so per-user traffic
+    patterns survive, and group chats keep their negative sign. Bots keep
+    their username, which mention handling depends on. Message text is kept
+    because it decides which handler runs.
+    """
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def _digest(self, value) -> int:
+        digest = hashlib.blake2b(str(value).encode(), key=self.key, digest_size=6).digest()
+        return int.from_bytes(digest, 'big') or 1
+
+    def pseudonym(self, value: int) -> int:
+        pseudonym = self._digest(value)
+        return -pseudonym if value < 0 else pseudonym
+
+    def __call__(self, data):
+        if isinstance(data, list):
+            return [self(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        identity = _is_identity(data)
+        result = {}
+        for key, value in data.items():
+            if key in _DROPPED_FIELDS:
+                continue
+            if identity and key == 'id':
+                result[key] = self.pseudonym(value)
+            elif identity and key in _NAME_FIELDS:
+                result[key] = _NAME_FIELDS[key]
+            elif identity and key == 'username' and not data.get('is_bot'):
+                result[key] = f"user{self._digest(value)}"
+            elif key in _LOOSE_NAME_FIELDS and isinstance(value, str):
+                result[key] = _LOOSE_NAME_FIELDS[key]
+            else:
+                result[key] = self(value)
+        return result
+
+
+class UpdateRecorder:
+    def __init__(self, path: str, bot_username: str | None = None, key: bytes | None = None):
+        self.path = path
+        # A fixed key keeps pseudonyms stable across restarts of the recorder.
+        key = key or os.getenv('TELEGRAM_RECORD_KEY', '').encode()[:64] or os.urandom(16)
+        self.anonymize = Anonymizer(key)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if new_file:
+            metadata = json.dumps({'bot_username': bot_username, 'created': int(time.time())}).encode()
+            self._file.write(MAGIC + _LENGTH.pack(len(metadata)) + metadata)
+            self._file.flush()
+
+    def record(self, update: dict, received_at: float | None = None):
+        payload = json.dumps(self.anonymize(update), separators=(',', ':')).encode()
+        self._file.write(_RECORD.pack(len(payload), received_at or time.time()) + payload)
+        self._file.flush()
+
+    async def handle(self, update, context) -> None:
+        """TypeHandler callback; registered in a group ahead of the real handlers."""
+        try:
+            self.record(update.to_dict())
+        except Exception as e:
+            logger.warning(f"Failed to record update {update.update_id}: {e}")
+
+    def close(self):
+        self._file.close()
+
+
+class RecordingReader:
+    """Iterate a recording through mmap without loading it into memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an update recording")
+        (length,) = _LENGTH.unpack_from(self._map, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        self.metadata = json.loads(self._map[start:start + length])
+        self._first_record = start + length
+
+    def __iter__(self):
+        offset = self._first_record
+        end = len(self._map)
+        while offset + _RECORD.size <= end:
+            length, received_at = _RECORD.unpack_from(self._map, offset)
+            offset += _RECORD.size
+            if offset + length > end:
+                # Partially written tail of a recording that is still open.
+                break
+            yield received_at, json.loads(self._map[offset:offset + length])
+            offset += length
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def handler_name(app, update) -> str:
+    for handler in app.handlers.get(0, []):
+        if handler.check_update(update):
+            return handler.callback.__name__
+    return 'unhandled'
+
+
+async def replay(app, reader: RecordingReader, speed: float | None, concurrency: int) -> tuple:
+    """Feed recorded updates to ``app``; ``speed`` None means as fast as possible."""
+    from telegram import Update
+
+    latencies = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def one(update):
+        async with semaphore:
+            name = handler_name(app, update)
+            start = time.perf_counter()
+            await app.process_update(update)
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    first_received = None
+    for received_at, data in reader:
+        if speed is not None:
+            if first_received is None:
+                first_received = received_at
+            delay = (received_at - first_received) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif len(tasks) >= concurrency * 4:
+            # Keep only a bounded window of updates in flight at max speed.
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(one(Update.de_json(data, app.bot)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - wall_start
+
+
+async def _replay_with_bot(path: str, speed: float | None, concurrency: int) -> dict:
+    from .bot import TelegramBot
+
+    bot = TelegramBot()
+    bot.initialize_web3_connections()
+    app = bot.build_app()
+    await app.initialize()
+    try:
+        with RecordingReader(path) as reader:
+            latencies, wall = await replay(app, reader, speed, concurrency)
+    finally:
+        await app.shutdown()
+    total = sum(len(v) for v in latencies.values())
+    return {
+        'updates': total,
+        'wall_seconds': round(wall, 3),
+        'throughput_per_s': round(total / wall, 2) if wall else 0.0,
+        'handlers': {name: summarize(values, wall, 0) for name, values in sorted(latencies.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded update stream against fake Telegram and RPC servers")
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--speed', default='1', help="playback multiplier, e.g. 1, 10, or 'max'")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rpc-latency', type=float, default=0.0)
+    parser.add_argument('--block-time', type=float, default=2.0)
+    parser.add_argument('--output', type=Path, help="write the report as JSON")
+    options = parser.parse_args(argv)
+    speed = None if options.speed == 'max' else float(options.speed)
+
+    with RecordingReader(str(options.path)) as reader:
+        username = reader.metadata.get('bot_username') or 'replay_bot'
+    telegram = FakeTelegramServer(username=username.lstrip('@'))
+    node = FakeEthereumNode(block_time=options.block_time, latency=options.rpc_latency)
+    with telegram, node:
+        configure_bot_env(telegram, node)
+        os.environ['TELEGRAM_BOT_USERNAME'] = username
+        os.environ.pop('TELEGRAM_RECORD_PATH', None)
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        logging.getLogger('telegrambot').setLevel(logging.WARNING)
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = asyncio.run(_replay_with_bot(str(options.path), speed, options.concurrency))
+
+    print(f"Replayed {report['updates']} updates in {report['wall_seconds']}s ({report['throughput_per_s']}/s)")
+    for name, s in report['handlers'].items():
+        print(f"  {name:<16} n={s['count']} p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms")
+    if options.output:
+        options.output.write_text(json.dumps(report, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import time
+from web3 import Web3
+
+from . import metrics
+
+
+class InstrumentedHTTPProvider(Web3.HTTPProvider):
+    """HTTP provider that records per-method latency and error counts."""
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            response = super().make_request(method, params)
+        except Exception:
+            metrics.RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            metrics.RPC_LATENCY.labels(method).observe(time.perf_counter() - start)
+        if 'error' in response:
+            metrics.RPC_ERRORS.labels(method).inc()
+        return response
+
+    def make_batch_request(self, batch_requests):
+        # A batch is one round trip; attribute its latency to every method in it.
+        start = time.perf_counter()
+        try:
+            responses = super().make_batch_request(batch_requests)
+        except Exception:
+            for method, _ in batch_requests:
+                metrics.RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            for method, _ in batch_requests:
+                metrics.RPC_LATENCY.labels(method).observe(elapsed)
+        if isinstance(responses, list):
+            for (method, _), response in zip(batch_requests, responses):
+                if 'error' in response:
+                    metrics.RPC_ERRORS.labels(method).inc()
+        return responses
@@ -0,0 +1,71 @@
+"""Measure backend cold start with ``python -X importtime``.
+
+Each probe runs in a fresh interpreter so nothing is already imported::
+
+    python -m telegrambot.startup
+"""
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Packages that belong to the bot/chain stack and must only load on first use.
+# dotenv is not among them: settings.py loads .env for every process.
+LAZY_PACKAGES = ('web3', 'eth_account', 'telegram', 'numpy')
+
+WEB_WORKER_PROBE = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings'); "
+    "from backend.wsgi import application; "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+PROBES = {
+    'manage_check': ['manage.py', 'check'],
+    'web_worker': ['-c', WEB_WORKER_PROBE],
+}
+
+
+def import_profile(args: list) -> dict:
+    """Run ``python -X importtime <args>`` and collect per-module cumulative times."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=os.environ.copy(),
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        modules[name] = int(cumulative_us)
+        total_us += int(self_us)
+    return {'wall_seconds': wall, 'import_seconds': total_us / 1e6, 'modules': modules}
+
+
+def loaded_lazy_packages(profile: dict) -> list:
+    return sorted({name.split('.')[0] for name in profile['modules']} & set(LAZY_PACKAGES))
+
+
+def main():
+    for name, args in PROBES.items():
+        profile = import_profile(args)
+        print(f"{name}: wall {profile['wall_seconds'] * 1000:.0f}ms, imports {profile['import_seconds'] * 1000:.0f}ms")
+        slowest = sorted(profile['modules'].items(), key=lambda kv: kv[1], reverse=True)[:5]
+        for module, cumulative_us in slowest:
+            print(f"  {cumulative_us / 1000:8.1f}ms  {module}")
+        eager = loaded_lazy_packages(profile)
+        if eager:
+            print(f"  eagerly imported: {', '.join(eager)}")
+
+
+if __name__ == '__main__':
+    main()
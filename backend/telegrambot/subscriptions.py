@@ -0,0 +1,330 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+from collections import OrderedDict
+
+from eth_utils import keccak
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_EVENTS = metrics.REGISTRY.counter(
+    'telegrambot_subscription_events_total',
+    'Heads and logs delivered to consumers, by kind and source (live or backfill).',
+    ['kind', 'source'],
+)
+SUBSCRIPTION_DROPPED = metrics.REGISTRY.counter(
+    'telegrambot_subscription_dropped_total',
+    'Events dropped because a consumer queue was full.',
+    ['kind'],
+)
+SUBSCRIPTION_RECONNECTS = metrics.REGISTRY.counter(
+    'telegrambot_subscription_reconnects_total',
+    'WebSocket reconnects after the subscription connection was lost.',
+)
+CONTRACT_EVENTS = metrics.REGISTRY.counter(
+    'telegrambot_contract_events_total',
+    'ETHSent and TokenSent events emitted by the contract.',
+    ['event'],
+)
+
+ETH_SENT_TOPIC = '0x' + keccak(text='ETHSent(address,address,uint256)').hex()
+TOKEN_SENT_TOPIC = '0x' + keccak(text='TokenSent(address,address,address,uint256)').hex()
+EVENT_NAMES = {ETH_SENT_TOPIC: 'ETHSent', TOKEN_SENT_TOPIC: 'TokenSent'}
+
+
+class Subscription:
+    """One consumer's view of a stream; iterate it with ``async for``.
+
+    Each consumer has its own bounded queue so a slow one cannot hold up the
+    others; when it falls ``maxsize`` events behind the oldest are dropped.
+    """
+
+    def __init__(self, manager, kind: str, maxsize: int):
+        self.manager = manager
+        self.kind = kind
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            SUBSCRIPTION_DROPPED.labels(self.kind).inc()
+        self.queue.put_nowait(event)
+
+    def close(self):
+        self.manager.consumers[self.kind].discard(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        return await self.queue.get()
+
+
+class SubscriptionManager:
+    """Follow ``newHeads`` and contract logs over a single WebSocket.
+
+    Heads and logs are fanned out in-process to every ``heads()`` and
+    ``logs()`` consumer. The connection is re-established with backoff when
+    it drops; on reconnect, and whenever a head or log arrives more than one
+    block ahead, the skipped headers and logs are fetched so consumers see
+    every block exactly once and in order. Logs are fetched at most
+    ``max_log_range`` blocks per ``eth_getLogs``, the range hosted
+    providers accept.
+    """
+
+    def __init__(self, ws_url: str, log_filter: dict | None = None, reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 30.0, request_timeout: float = 10.0, max_log_range: int = 2000):
+        self.ws_url = ws_url
+        self.log_filter = log_filter
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.request_timeout = request_timeout
+        self.max_log_range = max_log_range
+        self.consumers = {'heads': set(), 'logs': set()}
+        self.last_block = None
+        self.connected = asyncio.Event()
+        self.seen_log_limit = 10000
+        self._seen_logs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._responses = {}
+        self._subscription_kinds = {}
+        self._ws = None
+        self._task = None
+
+    def heads(self, maxsize: int = 256) -> Subscription:
+        return self._consumer('heads', maxsize)
+
+    def logs(self, maxsize: int = 1024) -> Subscription:
+        return self._consumer('logs', maxsize)
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _consumer(self, kind: str, maxsize: int) -> Subscription:
+        subscription = Subscription(self, kind, maxsize)
+        self.consumers[kind].add(subscription)
+        return subscription
+
+    def _deliver(self, kind: str, event: dict, source: str):
+        SUBSCRIPTION_EVENTS.labels(kind, source).inc()
+        for subscription in list(self.consumers[kind]):
+            subscription.put(event)
+
+    async def _run(self):
+        from websockets.asyncio.client import connect
+
+        delay = self.reconnect_delay
+        first = True
+        while True:
+            try:
+                async with connect(self.ws_url, compression=None, max_size=None) as ws:
+                    self._ws = ws
+                    if not first:
+                        SUBSCRIPTION_RECONNECTS.inc()
+                    first = False
+                    await self._session(ws)
+                logger.warning(f"Subscription connection to {self.ws_url} closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Subscription connection to {self.ws_url} lost: {e}")
+            finally:
+                established = self.connected.is_set()
+                self._ws = None
+                self.connected.clear()
+            if established:
+                delay = self.reconnect_delay
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _session(self, ws):
+        # Notifications go through a queue so that handling them (which may
+        # need RPC calls for backfill) never blocks reading responses.
+        notifications = asyncio.Queue()
+        reader = asyncio.get_running_loop().create_task(self._read(ws, notifications))
+        reader.add_done_callback(self._fail_pending_calls)
+        try:
+            self._subscription_kinds = {}
+            self._subscription_kinds[await self._call('eth_subscribe', ['newHeads'])] = 'heads'
+            if self.log_filter is not None:
+                self._subscription_kinds[await self._call('eth_subscribe', ['logs', self.log_filter])] = 'logs'
+            head = int(await self._call('eth_blockNumber', []), 16)
+            await self._catch_up(head)
+            self.connected.set()
+            while True:
+                get = asyncio.ensure_future(notifications.get())
+                done, _ = await asyncio.wait({get, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if reader in done:
+                    get.cancel()
+                    reader.result()
+                    return
+                await self._handle(*get.result())
+        finally:
+            reader.cancel()
+
+    async def _read(self, ws, notifications: asyncio.Queue):
+        async for message in ws:
+            item = json.loads(message)
+            if item.get('method') == 'eth_subscription':
+                params = item['params']
+                kind = self._subscription_kinds.get(params['subscription'])
+                if kind is not None:
+                    notifications.put_nowait((kind, params['result']))
+                continue
+            future = self._responses.pop(item.get('id'), None)
+            if future is not None and not future.done():
+                future.set_result(item)
+
+    def _fail_pending_calls(self, reader):
+        for future in self._responses.values():
+            if not future.done():
+                future.set_exception(ConnectionError("subscription connection closed"))
+                # Marked retrieved: the caller may already have given up on it.
+                future.exception()
+        self._responses.clear()
+
+    async def _call(self, method: str, params: list):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._responses[request_id] = future
+        await self._ws.send(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}))
+        response = await asyncio.wait_for(future, self.request_timeout)
+        if 'error' in response:
+            raise RuntimeError(f"{method} failed: {response['error'].get('message')}")
+        return response['result']
+
+    async def _handle(self, kind: str, event: dict):
+        number = int(event['blockNumber' if kind == 'logs' else 'number'], 16)
+        if self.last_block is not None and number > self.last_block + 1:
+            # Notifications are handled one at a time, so anything arriving
+            # meanwhile waits until the skipped blocks have been delivered.
+            await self._catch_up(number - 1)
+        if kind == 'logs':
+            self._deliver_log(event, 'live')
+            return
+        if self.last_block is not None and number <= self.last_block:
+            return
+        self.last_block = number
+        self._deliver('heads', event, 'live')
+
+    def _deliver_log(self, log: dict, source: str):
+        # Logs can reach us live and again through a backfill of the same
+        # range; a removed (reorged) log is always passed on.
+        key = (log['blockHash'], log['logIndex'], log.get('removed', False))
+        if key in self._seen_logs:
+            return
+        self._seen_logs[key] = None
+        if len(self._seen_logs) > self.seen_log_limit:
+            self._seen_logs.popitem(last=False)
+        self._deliver('logs', log, source)
+
+    async def _catch_up(self, head: int):
+        """Deliver every header and log after the last seen block up to ``head``."""
+        if self.last_block is None:
+            # First connection: start from the current head, nothing to fill.
+            block = await self._call('eth_getBlockByNumber', [hex(head), False])
+            self.last_block = head
+            self._deliver('heads', block, 'backfill')
+            return
+        if head <= self.last_block:
+            return
+        start = chunk_start = self.last_block + 1
+        # A header the node does not have yet ends the backfill early.
+        while chunk_start <= head and self.last_block == chunk_start - 1:
+            chunk_end = min(chunk_start + self.max_log_range - 1, head)
+            logs = []
+            if self.log_filter is not None:
+                criteria = dict(self.log_filter, fromBlock=hex(chunk_start), toBlock=hex(chunk_end))
+                logs = await self._call('eth_getLogs', [criteria])
+            logs_by_block = {}
+            for log in logs:
+                logs_by_block.setdefault(int(log['blockNumber'], 16), []).append(log)
+            for number in range(chunk_start, chunk_end + 1):
+                block = await self._call('eth_getBlockByNumber', [hex(number), False])
+                if block is None:
+                    break
+                for log in logs_by_block.get(number, []):
+                    self._deliver_log(log, 'backfill')
+                self.last_block = number
+                self._deliver('heads', block, 'backfill')
+            chunk_start = chunk_end + 1
+        logger.info(f"Backfilled blocks {start}-{self.last_block}")
+
+
+async def _simulate(block_time: float, blocks: int, drops: int) -> dict:
+    from web3 import Web3
+    from .benchmark import BENCH_CONTRACT, BENCH_PRIVATE_KEY, BENCH_RECIPIENT
+    from .fakes import SEND_ETH_SELECTOR, FakeEthereumNode
+
+    with FakeEthereumNode(block_time=block_time, websocket=True) as node:
+        w3 = Web3(Web3.HTTPProvider(node.url))
+        account = w3.eth.account.from_key(BENCH_PRIVATE_KEY)
+        contract = Web3.to_checksum_address(BENCH_CONTRACT)
+        manager = SubscriptionManager(node.ws_url, log_filter={'address': contract, 'topics': [[ETH_SENT_TOPIC]]},
+                                      reconnect_delay=block_time)
+        heads, logs = manager.heads(), manager.logs()
+        manager.ensure_started()
+        await asyncio.wait_for(manager.connected.wait(), 10)
+        first = manager.last_block
+
+        seen_blocks, sent, nonce, head = [], 0, 0, first
+        drop_at = {first + (i + 1) * blocks // (drops + 1) for i in range(drops)}
+        await heads.__anext__()  # the head at connect time
+        while head < first + blocks:
+            head = int((await heads.__anext__())['number'], 16)
+            seen_blocks.append(head)
+            if head in drop_at:
+                # The close handshake needs this loop to answer it.
+                await asyncio.to_thread(node.drop_websockets)
+            data = SEND_ETH_SELECTOR + '00' * 12 + BENCH_RECIPIENT[2:].lower()
+            tx = {'to': contract, 'value': 10 ** 15, 'gas': 200_000, 'gasPrice': node.gas_price,
+                  'nonce': nonce, 'chainId': node.chain_id, 'data': data}
+            await asyncio.to_thread(w3.eth.send_raw_transaction, account.sign_transaction(tx).raw_transaction)
+            nonce += 1
+            sent += 1
+        await asyncio.sleep(block_time * 2)
+        manager.stop()
+        received = []
+        while not logs.queue.empty():
+            log = logs.queue.get_nowait()
+            if int(log['blockNumber'], 16) <= head:
+                received.append(log['transactionHash'])
+        mined = [log['transactionHash'] for log in node._rpc_eth_getLogs({'fromBlock': hex(first + 1), 'toBlock': hex(head)})]
+        return {
+            'blocks': seen_blocks,
+            'in_order': seen_blocks == list(range(first + 1, first + 1 + len(seen_blocks))),
+            'logs_expected': len(mined),
+            'logs_received': len(received),
+            'logs_match': sorted(received) == sorted(mined),
+            'ws_requests': dict(sorted(node.request_counts.items())),
+        }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Follow a fake node over WebSocket through forced disconnects")
+    parser.add_argument('--block-time', type=float, default=0.2)
+    parser.add_argument('--blocks', type=int, default=30)
+    parser.add_argument('--drops', type=int, default=3, help="times the node drops every WebSocket")
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(_simulate(options.block_time, options.blocks, options.drops))
+    print(f"Saw {len(result['blocks'])} heads, {'in order with no gaps' if result['in_order'] else 'OUT OF ORDER OR GAPPED'}")
+    print(f"ETHSent logs: {result['logs_received']} received / {result['logs_expected']} mined, "
+          f"{'exact match' if result['logs_match'] else 'MISMATCH'}")
+    print(f"RPC requests: {result['ws_requests']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,985 @@
-from django.test import TestCase
+import asyncio
+import functools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .addresses import InvalidAddress, cache_info, configure_cache, normalize_address, normalize_addresses
+from .analytics import HOUR, TransferAnalytics
+from .benchmark import BENCH_CONTRACT, BENCH_PRIVATE_KEY, BENCH_RECIPIENT, configure_bot_env, drive, make_update
+from .chain_cache import BlockCache, HeadWatcher
+from .dedupe import DUPLICATE, NEW, UpdateDeduplicator
+from .deployments import DeploymentRegistry, UnknownDeployment
+from .fakes import SEND_ETH_SELECTOR, FakeEthereumNode, FakeTelegramServer
+from .ledger import InvalidCursor, LedgerWriter, decode_cursor, encode_cursor, history_page
+from .metrics import Registry, merge_expositions
+from .models import LedgerEntry
+from .preflight import ERROR_SELECTOR, PANIC_SELECTOR, NonceAllocator, Preflight, RevertDecoder, SimulationReverted
+from .profiler import SamplingProfiler
+from .replacement import NonceClash, simulate_fee_spike
+from .replay import RecordingReader, UpdateRecorder
+from .sessions import SessionStore
+from .startup import PROBES, import_profile, loaded_lazy_packages
+from .subscriptions import ETH_SENT_TOPIC, SubscriptionManager
+from .tracing import Tracer
+
+# Cumulative import time allowed for a cold start. The chain and bot stack
+# alone costs about a second, so pulling it back into startup trips this.
+STARTUP_IMPORT_BUDGET_SECONDS = 1.0
+
+
+class StartupBudgetTests(SimpleTestCase):
+    def assert_within_budget(self, probe):
+        profile = import_profile(PROBES[probe])
+        self.assertEqual(loaded_lazy_packages(profile), [])
+        self.assertLess(profile['import_seconds'], STARTUP_IMPORT_BUDGET_SECONDS)
+
+    def test_manage_check_startup(self):
+        self.assert_within_budget('manage_check')
+
+    def test_web_worker_startup(self):
+        self.assert_within_budget('web_worker')
+
+
+class FeeSpikeTests(SimpleTestCase):
+    def test_stuck_transaction_is_bumped_and_lands(self):
+        result = simulate_fee_spike(spike_multiplier=3.0, stuck_after_blocks=2)
+        self.assertGreater(len(result['hashes']), 1)
+        self.assertGreaterEqual(result['final_gas_price'], result['spiked_gas_price'])
+        self.assertEqual(result['landed_hash'], result['hashes'][-1])
+        self.assertTrue(result['mined'])
+
+    def test_rejected_replacement_bumps_again(self):
+        # The node wants +50% for a replacement; the engine bumps 12.5% a
+        # time, so it is refused until the bumps add up.
+        with self.assertLogs('telegrambot.replacement', 'WARNING') as logs:
+            result = simulate_fee_spike(spike_multiplier=1.2, stuck_after_blocks=2, node_replacement_bump=0.5)
+        rejected = [line for line in logs.output if 'rejected' in line]
+        self.assertGreaterEqual(len(rejected), 2)
+        self.assertEqual(len(rejected), len(set(rejected)), "a refused price was retried unchanged")
+        self.assertGreaterEqual(result['final_gas_price'], result['original_gas_price'] * 1.5)
+        self.assertTrue(result['mined'])
+
+
+class ConcurrentSendTests(SimpleTestCase):
+    CHATS = 40
+
+    async def confirm_all(self, telegram):
+        from .bot import TelegramBot
+
+        bot = TelegramBot()
+        bot.ledger = None
+        bot.initialize_web3_connections()
+        app = bot.build_app()
+        await app.initialize()
+        try:
+            chats = range(5000, 5000 + self.CHATS)
+            await drive(app, [make_update(i, f'/send {BENCH_RECIPIENT} 0.001', chat_id=chat)
+                              for i, chat in enumerate(chats, 1)], concurrency=16)
+            await drive(app, [make_update(i, 'YES', chat_id=chat)
+                              for i, chat in enumerate(chats, 1 + self.CHATS)], concurrency=16)
+        finally:
+            await app.shutdown()
+
+    def test_confirms_in_one_block_get_distinct_nonces(self):
+        # Nothing is mined while the confirms go out, so the node's latest
+        # nonce stays put for all of them.
+        with FakeTelegramServer() as telegram, FakeEthereumNode(block_time=None) as node, \
+                mock.patch.dict(os.environ):
+            configure_bot_env(telegram, node)
+            asyncio.run(self.confirm_all(telegram))
+            sent = list(node.transactions.values())
+
+        self.assertEqual(len(sent), self.CHATS)
+        self.assertEqual(sorted(tx['nonce'] for tx in sent), list(range(self.CHATS)))
+        self.assertEqual(len({tx['hash'] for tx in sent}), self.CHATS)
+
+
+class SubscriptionBackfillTests(SimpleTestCase):
+    async def wait_for(self, condition, timeout: float = 10.0):
+        async with asyncio.timeout(timeout):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+    LOG_FILTER = {'address': BENCH_CONTRACT, 'topics': [[ETH_SENT_TOPIC]]}
+
+    async def send_and_mine(self, node, count: int):
+        """Mine ``count`` blocks with one ETHSent log each."""
+        from web3 import Web3
+
+        w3 = Web3(Web3.HTTPProvider(node.url))
+        account = w3.eth.account.from_key(BENCH_PRIVATE_KEY)
+        for _ in range(count):
+            data = SEND_ETH_SELECTOR + '00' * 12 + BENCH_RECIPIENT[2:].lower()
+            tx = {'to': Web3.to_checksum_address(BENCH_CONTRACT), 'value': 10 ** 15, 'gas': 200_000, 'gasPrice': node.gas_price,
+                  'nonce': node.nonces.get(account.address, 0), 'chainId': node.chain_id, 'data': data}
+            await asyncio.to_thread(w3.eth.send_raw_transaction, account.sign_transaction(tx).raw_transaction)
+            await asyncio.to_thread(node.mine)
+
+    def direct_manager(self, node, **options) -> SubscriptionManager:
+        """A manager whose requests go straight to the node, without a WebSocket."""
+        manager = SubscriptionManager('', log_filter=self.LOG_FILTER, **options)
+
+        async def call(method, params):
+            response = node._handle_one({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+            if 'error' in response:
+                raise RuntimeError(f"{method} failed: {response['error'].get('message')}")
+            return response['result']
+
+        manager._call = call
+        manager.last_block = node.block_number
+        return manager
+
+    async def follow_through_disconnect(self, node):
+        send_and_mine = functools.partial(self.send_and_mine, node)
+
+        # The reconnect waits at least half a second, long enough to mine
+        # blocks the manager is not connected for.
+        manager = SubscriptionManager(node.ws_url, log_filter=self.LOG_FILTER, reconnect_delay=1.0)
+        logs = manager.logs()
+        manager.ensure_started()
+        try:
+            await self.wait_for(manager.connected.is_set)
+            await send_and_mine(2)
+            await self.wait_for(lambda: logs.queue.qsize() == 2)
+
+            await asyncio.to_thread(node.drop_websockets)
+            await self.wait_for(lambda: not manager.connected.is_set())
+            await send_and_mine(3)
+            missed = {log['transactionHash'] for log in node._rpc_eth_getLogs({'fromBlock': hex(node.block_number - 2)})}
+
+            await self.wait_for(manager.connected.is_set)
+            await send_and_mine(1)
+            await self.wait_for(lambda: manager.last_block == node.block_number)
+            await asyncio.sleep(0.2)
+        finally:
+            manager.stop()
+        received = []
+        while not logs.queue.empty():
+            received.append(logs.queue.get_nowait())
+        return received, missed
+
+    def test_logs_missed_while_disconnected_are_backfilled_once(self):
+        with FakeEthereumNode(block_time=None, websocket=True) as node:
+            received, missed = asyncio.run(self.follow_through_disconnect(node))
+            mined = node._rpc_eth_getLogs({'fromBlock': '0x0'})
+
+        self.assertEqual(len(missed), 3)
+        counts = Counter(log['transactionHash'] for log in received)
+        self.assertEqual(set(counts), {log['transactionHash'] for log in mined})
+        self.assertEqual(max(counts.values()), 1)
+        self.assertLessEqual(missed, set(counts))
+
+    @staticmethod
+    def drain(subscription) -> list:
+        events = []
+        while not subscription.queue.empty():
+            events.append(int(subscription.queue.get_nowait()['blockNumber' if subscription.kind == 'logs' else 'number'], 16))
+        return events
+
+    def test_backfill_stays_within_the_log_range(self):
+        async def catch_up(node):
+            manager = self.direct_manager(node, max_log_range=2)
+            heads, logs = manager.heads(), manager.logs()
+            await self.send_and_mine(node, 7)
+            await manager._catch_up(node.block_number)
+            return self.drain(heads), self.drain(logs)
+
+        with FakeEthereumNode(block_time=None, max_log_range=2) as node:
+            heads, logs = asyncio.run(catch_up(node))
+            self.assertEqual(node.request_counts['eth_getLogs'], 4)
+        self.assertEqual(heads, list(range(1, 8)))
+        self.assertEqual(logs, list(range(1, 8)))
+
+    def test_live_log_ahead_of_the_head_waits_for_the_gap(self):
+        async def log_first(node):
+            manager = self.direct_manager(node)
+            heads, logs = manager.heads(), manager.logs()
+            await self.send_and_mine(node, 3)
+            # The log for block 3 arrives before any head after block 0.
+            live = node._rpc_eth_getLogs(dict(self.LOG_FILTER, fromBlock='0x3', toBlock='0x3'))[0]
+            await manager._handle('logs', live)
+            await manager._handle('heads', node._block('0x3'))
+            return self.drain(heads), self.drain(logs)
+
+        with FakeEthereumNode(block_time=None) as node:
+            heads, logs = asyncio.run(log_first(node))
+        self.assertEqual(heads, [1, 2, 3])
+        self.assertEqual(logs, [1, 2, 3])
+
+
+class DedupeTests(SimpleTestCase):
+    async def send_and_confirm_twice(self):
+        from .bot import TelegramBot
+
+        bot = TelegramBot()
+        bot.ledger = None
+        bot.initialize_web3_connections()
+        app = bot.build_app()
+        await app.initialize()
+        try:
+            # The same /send again after its first confirmation, well inside the fingerprint window.
+            for update_id, text in enumerate([f'/send {BENCH_RECIPIENT} 0.001', 'YES'] * 2, 1):
+                await drive(app, [make_update(update_id, text, chat_id=7000)], concurrency=1)
+        finally:
+            await app.shutdown()
+
+    def test_repeated_send_opens_a_new_confirmation(self):
+        with FakeTelegramServer() as telegram, FakeEthereumNode(block_time=None) as node, \
+                mock.patch.dict(os.environ):
+            configure_bot_env(telegram, node)
+            asyncio.run(self.send_and_confirm_twice())
+            replies = [text for _, _, text in telegram.sent_messages]
+
+        self.assertEqual(len(node.transactions), 2)
+        self.assertEqual([text.split()[0] for text in replies], ['Reply', 'Transaction', 'Reply', 'Transaction'])
+
+    def test_aborted_update_is_settled(self):
+        dedupe = UpdateDeduplicator()
+        self.assertEqual(dedupe.begin(1, b'yes')[0], NEW)
+        dedupe.abort(1, ['Error: boom'])
+        dedupe.finish(1, [])
+        self.assertEqual(dedupe._fingerprints, {})
+        self.assertEqual(dedupe.begin(1, b'yes'), (DUPLICATE, ('Error: boom',)))
+        self.assertEqual(dedupe.begin(2, b'yes')[0], NEW)
+
+    def test_unsettled_fingerprints_leave_with_the_window(self):
+        dedupe = UpdateDeduplicator(window_size=10)
+        for update_id in range(100):
+            dedupe.begin(update_id, update_id.to_bytes(2, 'little'))
+        self.assertLessEqual(len(dedupe._fingerprints), 10)
+
+
+class RecorderAnonymizationTests(SimpleTestCase):
+    def user(self, user_id, first_name, username, is_bot=False):
+        return {'id': user_id, 'is_bot': is_bot, 'first_name': first_name, 'last_name': 'Surname', 'username': username}
+
+    def test_recorded_fixture_keeps_no_identities(self):
+        update = {
+            'update_id': 1,
+            'message': {
+                'message_id': 10,
+                'date': 1700000000,
+                'from': self.user(111, 'Alice', 'alice'),
+                'chat': {'id': -100222, 'type': 'supergroup', 'title': 'Secret Club', 'username': 'secretclub'},
+                'new_chat_members': [self.user(777, 'Bob', 'bob'), self.user(778, 'Carol', 'carol')],
+                'left_chat_member': self.user(888, 'Dave', 'dave'),
+                'forward_origin': {'type': 'user', 'date': 1700000000, 'sender_user': self.user(999, 'Erin', 'erin')},
+                'reply_to_message': {
+                    'message_id': 9, 'date': 1700000000, 'chat': {'id': -100222, 'type': 'supergroup'},
+                    'from': self.user(555, 'Frank', 'frank'),
+                    'forward_origin': {'type': 'hidden_user', 'date': 1700000000, 'sender_user_name': 'Grace Hidden'},
+                },
+                'via_bot': self.user(4242, 'Helper', 'helper_bot', is_bot=True),
+                'text': '/start',
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            },
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'updates.rec')
+            recorder = UpdateRecorder(path, key=b'test-key')
+            recorder.record(update)
+            recorder.close()
+            with RecordingReader(path) as reader:
+                [(_, recorded)] = list(reader)
+
+        dump = json.dumps(recorded)
+        for secret in ('Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Surname', 'Secret Club',
+                       'alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'secretclub'):
+            self.assertNotIn(secret, dump)
+        message = recorded['message']
+        ids = [message['from']['id'], message['chat']['id'], message['left_chat_member']['id'],
+               message['forward_origin']['sender_user']['id'], message['reply_to_message']['from']['id'],
+               *(member['id'] for member in message['new_chat_members'])]
+        self.assertTrue(set(ids).isdisjoint({111, -100222, 777, 778, 888, 999, 555}))
+        # Shape, chat sign, pseudonym stability and the text the handlers need all survive.
+        self.assertLess(message['chat']['id'], 0)
+        self.assertEqual(message['chat']['id'], message['reply_to_message']['chat']['id'])
+        self.assertEqual(message['via_bot']['username'], 'helper_bot')
+        self.assertEqual(message['text'], '/start')
+        self.assertEqual(message['entities'], update['message']['entities'])
+
+
+class TransferAnalyticsTests(SimpleTestCase):
+    NOW = 1_800_000_000
+
+    def synthetic(self, count=3000, seed=3):
+        import random
+
+        rng = random.Random(seed)
+        timestamps = sorted(rng.randrange(self.NOW - 3 * 86400, self.NOW) for _ in range(count))
+        senders = [f"0x{rng.randrange(40):040x}" for _ in range(count)]
+        recipients = [f"0x{rng.randrange(400):040x}" for _ in range(count)]
+        amounts = [rng.randrange(1, 10 ** 18) for _ in range(count)]
+        return timestamps, senders, recipients, amounts
+
+    def assert_matches_brute_force(self, snapshot, events, now, window, hours):
+        import numpy as np
+
+        timestamps, senders, recipients, amounts = events
+        inside = [i for i, t in enumerate(timestamps) if t >= now - window]
+        self.assertEqual(snapshot['transfers'], len(inside))
+        self.assertAlmostEqual(snapshot['volume_eth'], sum(amounts[i] for i in inside) / 10 ** 18, places=6)
+        volume = Counter()
+        for i in inside:
+            volume[senders[i]] += amounts[i] / 10 ** 18
+        for row in snapshot['top_senders']:
+            self.assertAlmostEqual(row['volume_eth'], volume[row['address']], places=6)
+        self.assertEqual([row['volume_eth'] for row in snapshot['top_senders']],
+                         sorted((row['volume_eth'] for row in snapshot['top_senders']), reverse=True))
+        expected_top = sorted(volume.values(), reverse=True)[:len(snapshot['top_senders'])]
+        self.assertEqual([round(v, 6) for v in expected_top], [round(r['volume_eth'], 6) for r in snapshot['top_senders']])
+        current_hour = now // HOUR
+        for row, hour in zip(snapshot['hourly'], range(current_hour - hours + 1, current_hour + 1)):
+            sizes = [amounts[i] / 10 ** 18 for i, t in enumerate(timestamps) if t // HOUR == hour]
+            self.assertEqual(row['hour'], hour * HOUR)
+            self.assertEqual(row['transfers'], len(sizes))
+            if sizes:
+                p50, p99 = np.percentile(sizes, [50, 99])
+                self.assertAlmostEqual(row['p50_eth'], p50)
+                self.assertAlmostEqual(row['p99_eth'], p99)
+
+    def test_sliding_window_matches_brute_force(self):
+        events = self.synthetic()
+        timestamps, senders, recipients, amounts = events
+        window = 6 * HOUR
+        analytics = TransferAnalytics(window_seconds=window)
+        # Add in batches while the window slides over three days, compacting on the way.
+        with mock.patch('telegrambot.analytics.COMPACT_MIN_ROWS', 100):
+            self.slide(analytics, events, window)
+        self.assertLess(len(analytics), len(timestamps) // 4)
+
+    def slide(self, analytics, events, window):
+        timestamps, senders, recipients, amounts = events
+        added = 0
+        for now in range(self.NOW - 2 * 86400, self.NOW + 1, 5 * HOUR + 17):
+            upto = next((i for i, t in enumerate(timestamps) if t > now), len(timestamps))
+            analytics.add_transfers(range(added, upto), timestamps[added:upto], senders[added:upto],
+                                    recipients[added:upto], amounts[added:upto])
+            added = upto
+            seen = tuple(column[:upto] for column in events)
+            self.assert_matches_brute_force(analytics.snapshot(now, top=5, hours=6), seen, now, window, 6)
+
+    def test_bot_starts_from_the_saved_snapshot(self):
+        from .bot import TelegramBot
+
+        timestamps, senders, recipients, amounts = self.synthetic(count=200)
+        analytics = TransferAnalytics()
+        analytics.add_transfers(range(200), timestamps, senders, recipients, amounts)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analytics.npz')
+            analytics.save(path)
+            with mock.patch.dict(os.environ, {'ANALYTICS_SNAPSHOT_PATH': path}):
+                bot = TelegramBot()
+        self.assertEqual(len(bot.analytics), 200)
+
+    def test_stats_view_refuses_hours_beyond_the_retained_window(self):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from .views import stats
+
+        timestamps, senders, recipients, amounts = self.synthetic(count=50)
+        analytics = TransferAnalytics()
+        analytics.add_transfers(range(50), timestamps, senders, recipients, amounts)
+        admin = User(username='admin', is_staff=True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analytics.npz')
+            analytics.save(path)
+            env = {'ANALYTICS_SNAPSHOT_PATH': path, 'ANALYTICS_WINDOW_SECONDS': str(6 * HOUR)}
+            with mock.patch.dict(os.environ, env):
+                codes = {}
+                for query in ('window_hours=6&hours=6', 'window_hours=7', 'hours=24'):
+                    request = APIRequestFactory().get(f'/stats/?{query}')
+                    force_authenticate(request, user=admin)
+                    codes[query] = stats(request).status_code
+        self.assertEqual(codes, {'window_hours=6&hours=6': 200, 'window_hours=7': 400, 'hours=24': 400})
+
+
+class AddressTests(SimpleTestCase):
+    # EIP-55 test vectors.
+    CHECKSUMMED = ['0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed', '0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359',
+                   '0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB', '0xD1220A0cf47c7B9Be7A2E6BA89F429762e7b9aDb']
+    INVALID = [
+        ('5aaeb6053f3e94c9b9a09f33669435e7ef1beaed', 'start with 0x'),
+        ('0x5aaeb6053f3e94c9b9a09f33669435e7ef1bea', '40 hex characters'),
+        ('0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaeg', 'non-hex'),
+        ('0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeD', 'checksum'),
+    ]
+
+    def test_checksum_and_raw_forms(self):
+        for checksum in self.CHECKSUMMED:
+            for text in (checksum, checksum.lower(), '0X' + checksum[2:].upper(), f"  {checksum}\n"):
+                address = normalize_address(text)
+                self.assertEqual(address.checksum, checksum)
+                self.assertEqual(address.raw, bytes.fromhex(checksum[2:]))
+
+    def test_invalid_input(self):
+        for text, reason in self.INVALID:
+            with self.assertRaisesRegex(InvalidAddress, reason):
+                normalize_address(text)
+        with self.assertRaisesRegex(InvalidAddress, 'must be a string'):
+            normalize_address(None)
+
+    def test_repeats_are_cache_hits(self):
+        with mock.patch.dict(os.environ, {'ADDRESS_CACHE_SIZE': '2'}):
+            configure_cache()
+        self.assertEqual(cache_info().maxsize, 2)
+        for _ in range(3):
+            normalize_address(self.CHECKSUMMED[0])
+        self.assertEqual((cache_info().hits, cache_info().misses), (2, 1))
+        normalize_address(self.CHECKSUMMED[1])
+        normalize_address(self.CHECKSUMMED[2])
+        normalize_address(self.CHECKSUMMED[0])
+        self.assertEqual(cache_info().misses, 4)
+        configure_cache()
+
+    def test_batch_matches_one_at_a_time(self):
+        import random
+
+        rng = random.Random(5)
+        values = [*self.CHECKSUMMED, *(text for text, _ in self.INVALID), None, ['unhashable'], '0x' + 'é' * 40]
+        for _ in range(300):
+            address = normalize_address('0x' + rng.randbytes(20).hex()).checksum
+            values.append(rng.choice([address, address.lower(), address.upper().replace('0X', '0x'), f" {address} "]))
+        # Repeated strings are validated and reported once; every non-string is reported.
+        values += values[:50]
+        expected = []
+        for value in values:
+            try:
+                expected.append(normalize_address(value))
+            except (InvalidAddress, TypeError):
+                expected.append(None)
+        self.assertEqual(normalize_addresses(values, strict=False), expected)
+        with self.assertRaisesRegex(InvalidAddress, '^9 invalid address'):
+            normalize_addresses(values)
+
+
+class SendTrackingTests(SimpleTestCase):
+    async def confirm_with_failing_tracker(self):
+        from .bot import TelegramBot
+
+        bot = TelegramBot()
+        bot.ledger = mock.Mock()
+        bot.initialize_web3_connections()
+        app = bot.build_app()
+        await app.initialize()
+        try:
+            with mock.patch.object(bot.replacement_engine, 'track', side_effect=NonceClash("nonce 0 is taken")), \
+                    self.assertLogs('telegrambot.bot', 'ERROR') as logs:
+                await drive(app, [make_update(1, f'/send {BENCH_RECIPIENT} 0.001', chat_id=8000)], concurrency=1)
+                await drive(app, [make_update(2, 'YES', chat_id=8000)], concurrency=1)
+        finally:
+            await app.shutdown()
+        return bot.ledger, logs.output
+
+    def test_tracking_failure_after_broadcast_is_not_a_failed_send(self):
+        with FakeTelegramServer() as telegram, FakeEthereumNode(block_time=None) as node, \
+                mock.patch.dict(os.environ):
+            configure_bot_env(telegram, node)
+            ledger, logs = asyncio.run(self.confirm_with_failing_tracker())
+            replies = [text for _, _, text in telegram.sent_messages]
+
+        self.assertEqual(len(node.transactions), 1)
+        self.assertTrue(replies[-1].startswith('Transaction sent!'), replies)
+        self.assertEqual(ledger.record.call_args.kwargs['tx_hash'], next(iter(node.transactions)))
+        self.assertTrue(any('Not watching' in line for line in logs))
+
+
+class PreflightTests(SimpleTestCase):
+    SENDER = '0x0000000000000000000000000000000000000001'
+
+    def test_failed_send_is_reused_while_later_sends_are_in_flight(self):
+        nonces = NonceAllocator()
+        first, second = nonces.allocate(self.SENDER, 5), nonces.allocate(self.SENDER, 5)
+        nonces.failed(self.SENDER, first)
+        # The node has not seen `second` yet, so its pending count is still 5.
+        self.assertEqual([nonces.allocate(self.SENDER, 5), nonces.allocate(self.SENDER, 5)], [5, 7])
+        self.assertEqual(second, 6)
+
+    def test_failure_with_nothing_in_flight_starts_again_from_the_node(self):
+        nonces = NonceAllocator()
+        nonces.sent(self.SENDER, nonces.allocate(self.SENDER, 5))
+        nonces.failed(self.SENDER, nonces.allocate(self.SENDER, 5))
+        self.assertEqual(nonces.allocate(self.SENDER, 6), 6)
+
+    def test_gap_filled_elsewhere_is_not_reused(self):
+        nonces = NonceAllocator()
+        first, _ = nonces.allocate(self.SENDER, 5), nonces.allocate(self.SENDER, 5)
+        nonces.failed(self.SENDER, first)
+        self.assertEqual(nonces.allocate(self.SENDER, 7), 7)
+
+    def test_revert_reasons(self):
+        from eth_abi import encode
+
+        from .deployments import ContractCodec
+
+        codec = ContractCodec.from_abi([{'type': 'error', 'name': 'TooMuch', 'inputs': [{'name': 'limit', 'type': 'uint256'}]}])
+        decoder = RevertDecoder(codec)
+        custom = next(iter(codec.errors))
+        self.assertEqual(decoder.decode('0x' + (ERROR_SELECTOR + encode(['string'], ['Send some ETH'])).hex()), 'Send some ETH')
+        self.assertEqual(decoder.decode('0x' + (PANIC_SELECTOR + encode(['uint256'], [0x11])).hex()), 'panic 0x11')
+        self.assertEqual(decoder.decode('0x' + (custom + encode(['uint256'], [3])).hex()), 'TooMuch(3)')
+        self.assertEqual(decoder.decode('0xdeadbeef'), 'unknown error 0xdeadbeef')
+        # A known selector with a payload that does not decode falls back to the raw data.
+        self.assertEqual(decoder.decode('0x' + ERROR_SELECTOR.hex() + '00'), f"unknown error 0x{ERROR_SELECTOR.hex()}00")
+        self.assertEqual(decoder.decode(None, 'execution reverted'), 'execution reverted')
+        self.assertEqual(decoder.decode('0x'), 'reverted without a reason')
+
+    def test_outcomes_are_cached_for_the_block(self):
+        from web3 import Web3
+
+        from .deployments import ContractCodec
+
+        call = {
+            'from': self.SENDER,
+            'to': BENCH_CONTRACT,
+            'data': SEND_ETH_SELECTOR + BENCH_RECIPIENT[2:].lower().rjust(64, '0'),
+            'value': 10 ** 15,
+            'gas': 200000,
+        }
+        with FakeEthereumNode(block_time=None) as node:
+            preflight = Preflight(Web3(Web3.HTTPProvider(node.url)), ContractCodec.from_abi([]))
+            block = node.block_number
+            preflight.check(call, known_block=block)
+            preflight.check(call, known_block=block)
+            self.assertEqual(node.request_counts['eth_call'], 1)
+
+            with self.assertRaisesRegex(SimulationReverted, 'Send some ETH'):
+                preflight.check(dict(call, value=0), known_block=block)
+            requests = sum(node.request_counts.values())
+            with self.assertRaisesRegex(SimulationReverted, 'Send some ETH'):
+                preflight.check(dict(call, value=0), known_block=block)
+            self.assertEqual(sum(node.request_counts.values()), requests)
+
+            node.mine(1)
+            preflight.check(call, known_block=node.block_number)
+            self.assertEqual(node.request_counts['eth_call'], 3)
+
+
+class LedgerHistoryTests(TestCase):
+    USER = 42
+    RECIPIENT = BENCH_RECIPIENT
+
+    def setUp(self):
+        from datetime import datetime, timedelta, timezone
+
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Runs of three rows share a `created`, so pages split inside a tie.
+        LedgerEntry.objects.bulk_create(
+            LedgerEntry(
+                telegram_user_id=self.USER, chat_id=self.USER, chain_id=84532, tx_hash=f'0x{i:064x}',
+                recipient=self.RECIPIENT, amount_wei=i, created=start + timedelta(microseconds=i // 3),
+            )
+            for i in range(25)
+        )
+
+    def walk(self, limit):
+        seen, cursor = [], None
+        while True:
+            entries, cursor = history_page(self.USER, cursor=cursor, limit=limit)
+            seen.extend(entry.pk for entry in entries)
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_shared_timestamps_without_gaps_or_duplicates(self):
+        expected = list(LedgerEntry.objects.order_by('-created', '-pk').values_list('pk', flat=True))
+        for limit in (1, 2, 4, 7, 25, 100):
+            self.assertEqual(self.walk(limit), expected, limit)
+
+    def test_cursor_round_trip(self):
+        entry = LedgerEntry.objects.order_by('pk')[4]
+        self.assertEqual(decode_cursor(encode_cursor(entry)), (entry.created, entry.pk))
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('', 'abc', '12', '1-2-3', '1.5-2', f'{10 ** 20}-1'):
+            with self.assertRaises(InvalidCursor, msg=cursor):
+                decode_cursor(cursor)
+
+    def test_history_endpoint(self):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from .views import history
+
+        def get(query):
+            request = APIRequestFactory().get(f'/history/?{query}')
+            force_authenticate(request, user=User(username='admin', is_staff=True))
+            return history(request)
+
+        first = get(f'recipient={self.RECIPIENT.lower()}&limit=10')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual([row['amount_wei'] for row in first.data['results']], [str(i) for i in range(24, 14, -1)])
+        rest = get(f"user={self.USER}&limit=100&cursor={first.data['next_cursor']}")
+        self.assertEqual(len(rest.data['results']), 15)
+        self.assertIsNone(rest.data['next_cursor'])
+        for query in ('', f'user={self.USER}&recipient={self.RECIPIENT}', 'user=abc', f'user={self.USER}&cursor=abc', 'recipient=0x12'):
+            self.assertEqual(get(query).status_code, 400, query)
+
+    def test_flush_is_idempotent(self):
+        writer = LedgerWriter()
+        # Flushed by hand; the background thread would write outside the test's transaction.
+        writer._ensure_thread = lambda: None
+        fields = dict(telegram_user_id=7, chat_id=7, chain_id=84532, tx_hash='0x' + 'ab' * 32, recipient=self.RECIPIENT, amount_wei=1)
+        writer.record(**fields)
+        writer.record(**fields)
+        writer.flush()
+        writer.record(**fields)
+        writer.update_status(84532, fields['tx_hash'], LedgerEntry.Status.MINED)
+        writer.flush()
+        writer.flush()
+        self.assertEqual(list(LedgerEntry.objects.filter(telegram_user_id=7).values_list('status', flat=True)), ['mined'])
+
+
+class SessionStoreTests(SimpleTestCase):
+    def store(self, **options):
+        self.now = 0.0
+        return SessionStore(clock=lambda: self.now, **options)
+
+    def scheduled(self, store):
+        return sorted(key for bucket in store._wheel for key in bucket)
+
+    def test_sessions_expire_after_their_ttl(self):
+        store = self.store(default_ttl=10, wheel_size=8)
+        store.put('a', 'confirm_send')
+        store.put('b', 'confirm_send', ttl=30)
+        self.now = 9.5
+        self.assertIsNotNone(store.get('a'))
+        self.now = 10.5
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(len(store), 1)
+        self.now = 31
+        store.get('c')
+        self.assertEqual(len(store), 0)
+        self.assertEqual(self.scheduled(store), [])
+
+    def test_least_recently_used_is_evicted(self):
+        store = self.store(max_entries=2)
+        store.put('a', 'x')
+        store.put('b', 'x')
+        store.get('a')
+        store.put('c', 'x')
+        self.assertIsNone(store.get('b'))
+        self.assertEqual([store.get('a').state, store.get('c').state], ['x', 'x'])
+        self.assertEqual(self.scheduled(store), ['a', 'c'])
+
+    def test_renewal_a_lap_later_replaces_its_slot(self):
+        store = self.store(wheel_size=8)
+        store.put('a', 'x', ttl=3)
+        # Ticks 11 and 19 fall in the same bucket as tick 3.
+        store.put('a', 'x', ttl=11)
+        store.put('a', 'x', ttl=19)
+        self.assertEqual(self.scheduled(store), ['a'])
+        for self.now in (3.5, 11.5, 18.5):
+            self.assertIsNotNone(store.get('a'), self.now)
+            self.assertEqual(self.scheduled(store), ['a'])
+        self.now = 19.5
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(self.scheduled(store), [])
+
+    def test_evicted_sessions_spill_and_come_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.sqlite3')
+            store = self.store(max_entries=2, spill_path=path, spill_batch=1)
+            store.put('a', 'confirm_send', (1, BENCH_RECIPIENT, 0.5), ttl=60)
+            store.put('b', 'x', ttl=60)
+            store.put('c', 'x', ttl=60)
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.get('a').payload, (1, BENCH_RECIPIENT, 0.5))
+            self.assertEqual(len(store), 2)
+            self.assertEqual(self.scheduled(store), ['a', 'c'])
+            store.put('d', 'x', ttl=1)
+            store.close()
+
+            # The bot comes back 30s later on a fresh monotonic clock; expiry follows the wall clock.
+            restarted = self.store(spill_path=path)
+            wall = time.time()
+            with mock.patch('telegrambot.sessions.time.time', return_value=wall + 30):
+                self.assertEqual(restarted.get('a').state, 'confirm_send')
+                self.assertEqual(restarted.get('b').state, 'x')
+                self.assertIsNone(restarted.get('d'))
+            with mock.patch('telegrambot.sessions.time.time', return_value=wall + 61):
+                self.assertIsNone(restarted.get('c'))
+            restarted.close()
+
+
+class BlockCacheTests(SimpleTestCase):
+    async def read_across_blocks(self, node):
+        from web3 import Web3
+
+        w3 = Web3(Web3.HTTPProvider(node.url))
+        cache = BlockCache()
+        watcher = HeadWatcher(w3, cache, interval=0.02)
+        address = Web3.to_checksum_address(BENCH_RECIPIENT)
+
+        def read():
+            return cache.get(('balance', address), lambda block: asyncio.to_thread(w3.eth.get_balance, address, block))
+
+        await watcher.wait_ready()
+        try:
+            first = await asyncio.gather(*(read() for _ in range(20)))
+            again = await read()
+            requests = [node.request_counts['eth_getBalance']]
+            node.mine()
+            async with asyncio.timeout(10):
+                while cache.block != node.block_number:
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(*(read() for _ in range(20)))
+            requests.append(node.request_counts['eth_getBalance'])
+        finally:
+            watcher.stop()
+        return first, again, requests
+
+    def test_identical_reads_share_one_request_per_block(self):
+        # Latency keeps the first request in flight while the others arrive.
+        with FakeEthereumNode(block_time=None, latency=0.05) as node:
+            first, again, requests = asyncio.run(self.read_across_blocks(node))
+        self.assertEqual(len(set(first)), 1)
+        self.assertEqual(again, first[0])
+        self.assertEqual(requests, [1, 2])
+
+
+class DeploymentRegistryTests(SimpleTestCase):
+    ABI_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'abi.json')
+    OLD = '0x' + '11' * 20
+    NEW = '0x' + '22' * 20
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.broadcast_dir = os.path.join(directory.name, 'broadcast')
+        self.snapshot_path = os.path.join(directory.name, 'cache', 'deployments.json')
+        os.makedirs(self.broadcast_dir)
+
+    def write_run(self, script: str, address: str, timestamp: int, chain_id: int = 84532, status: str = '0x1'):
+        path = os.path.join(self.broadcast_dir, script, str(chain_id), 'run-latest.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tx_hash = '0x' + f'{timestamp:x}'.rjust(64, '0')
+        run = {
+            'transactions': [{'hash': tx_hash, 'transactionType': 'CREATE', 'contractName': 'TelegramMiniApp',
+                              'contractAddress': address}],
+            'receipts': [{'transactionHash': tx_hash, 'status': status}],
+            'timestamp': timestamp,
+        }
+        with open(path, 'w') as f:
+            json.dump(run, f)
+        # Distinct mtimes even on filesystems with coarse timestamps.
+        os.utime(path, ns=(timestamp * 10 ** 9, timestamp * 10 ** 9))
+
+    def registry(self, **options) -> DeploymentRegistry:
+        return DeploymentRegistry(self.broadcast_dir, {'TelegramMiniApp': self.ABI_PATH}, out_dir=None,
+                                  snapshot_path=self.snapshot_path, **options)
+
+    def test_newest_successful_run_wins(self):
+        self.write_run('Deploy.s.sol', self.OLD, 100)
+        self.write_run('Redeploy.s.sol', self.NEW, 200)
+        self.write_run('Failed.s.sol', '0x' + '33' * 20, 300, status='0x0')
+        self.write_run('Deploy.s.sol', self.OLD, 100, chain_id=1)
+        registry = self.registry()
+        self.assertEqual(registry.resolve('TelegramMiniApp', 84532).address.lower(), self.NEW)
+        self.assertEqual(registry.resolve('TelegramMiniApp', 1).address.lower(), self.OLD)
+        self.assertEqual(registry.codec('TelegramMiniApp').selector('sendETH').hex(), SEND_ETH_SELECTOR[2:])
+        with self.assertRaises(UnknownDeployment):
+            registry.resolve('TelegramMiniApp', 10)
+
+    def test_changed_files_are_picked_up_after_the_refresh_interval(self):
+        self.write_run('Deploy.s.sol', self.OLD, 100)
+        registry = self.registry(refresh_interval=60)
+        now = time.monotonic()
+        with mock.patch('telegrambot.deployments.time.monotonic', return_value=now):
+            self.assertEqual(registry.resolve('TelegramMiniApp', 84532).address.lower(), self.OLD)
+            self.write_run('Deploy.s.sol', self.NEW, 200)
+            self.assertEqual(registry.resolve('TelegramMiniApp', 84532).address.lower(), self.OLD)
+        with mock.patch('telegrambot.deployments.time.monotonic', return_value=now + 61):
+            self.assertEqual(registry.resolve('TelegramMiniApp', 84532).address.lower(), self.NEW)
+
+    def test_snapshot_round_trip(self):
+        self.write_run('Deploy.s.sol', self.OLD, 100)
+        built = self.registry()
+        built.refresh()
+        self.assertTrue(os.path.exists(self.snapshot_path))
+
+        loaded = self.registry()
+        with mock.patch.object(DeploymentRegistry, '_build', side_effect=AssertionError("rebuilt")):
+            loaded.refresh()
+        self.assertEqual(loaded.deployments(), built.deployments())
+        codec, expected = loaded.codec('TelegramMiniApp'), built.codec('TelegramMiniApp')
+        self.assertEqual((codec.selectors, codec.topics, codec.abi), (expected.selectors, expected.topics, expected.abi))
+
+        # A changed broadcast outdates the snapshot.
+        self.write_run('Deploy.s.sol', self.NEW, 200)
+        rebuilt = self.registry()
+        self.assertEqual(rebuilt.resolve('TelegramMiniApp', 84532).address.lower(), self.NEW)
+
+    def bot(self, **env):
+        from .bot import TelegramBot
+
+        env = dict(env, DEPLOYMENTS_BROADCAST_DIR=self.broadcast_dir, DEPLOYMENTS_SNAPSHOT_PATH=self.snapshot_path,
+                   CONTRACT_ABI_PATH=self.ABI_PATH)
+        with mock.patch.dict(os.environ):
+            os.environ.pop('CONTRACT_ADDRESS', None)
+            os.environ.update(env)
+            return TelegramBot()
+
+    def test_contract_address_overrides_the_broadcast(self):
+        self.write_run('Deploy.s.sol', self.OLD, 100)
+        self.assertEqual(self.bot().resolve_contract()[0].lower(), self.OLD)
+        self.assertEqual(self.bot(CONTRACT_ADDRESS=self.NEW).resolve_contract()[0], self.NEW)
+
+    def test_nothing_deployed(self):
+        with self.assertRaisesRegex(ValueError, '^Cannot resolve CONTRACT_NAME=TelegramMiniApp on CHAIN_ID=84532'):
+            self.bot().resolve_contract()
+
+
+class MetricsTests(SimpleTestCase):
+    def test_exposition(self):
+        registry = Registry()
+        sends = registry.counter('sends_total', 'Sends by "result".\nOne line.', ['result'])
+        sends.labels('ok').inc(2)
+        sends.labels('bad "quote"\\path\n').inc()
+        registry.gauge('depth', 'Queue depth.').set(1.5)
+        self.assertEqual(registry.render(process='bot'), (
+            '# HELP depth Queue depth.\n'
+            '# TYPE depth gauge\n'
+            'depth{process="bot"} 1.5\n'
+            '# HELP sends_total Sends by "result".\\nOne line.\n'
+            '# TYPE sends_total counter\n'
+            'sends_total{result="bad \\"quote\\"\\\\path\\n",process="bot"} 1\n'
+            'sends_total{result="ok",process="bot"} 2\n'
+        ))
+
+    def test_histogram_buckets_are_cumulative_and_inclusive(self):
+        registry = Registry()
+        latency = registry.histogram('latency_seconds', 'Latency.', buckets=(1, 0.1))
+        for value in (0.05, 0.1, 0.5, 1, 3):
+            latency.observe(value)
+        self.assertEqual(registry.render().splitlines()[2:], [
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1"} 4',
+            'latency_seconds_bucket{le="+Inf"} 5',
+            'latency_seconds_sum 4.65',
+            'latency_seconds_count 5',
+        ])
+
+    def test_label_count_is_checked(self):
+        with self.assertRaisesRegex(ValueError, 'expects labels'):
+            Registry().counter('sends_total', 'Sends.', ['result']).labels('ok', 'extra')
+
+    def test_merge_keeps_one_header_per_metric(self):
+        web, bot = Registry(), Registry()
+        for registry in (web, bot):
+            registry.counter('requests_total', 'Requests.').inc()
+        bot.gauge('sessions', 'Sessions.').set(3)
+        merged = merge_expositions(web.render(process='web'), bot.render(process='bot'), '')
+        self.assertEqual(merged, (
+            '# HELP requests_total Requests.\n'
+            '# TYPE requests_total counter\n'
+            'requests_total{process="web"} 1\n'
+            'requests_total{process="bot"} 1\n'
+            '# HELP sessions Sessions.\n'
+            '# TYPE sessions gauge\n'
+            'sessions{process="bot"} 3\n'
+        ))
+
+
+class TailSamplingTests(SimpleTestCase):
+    class Exporter:
+        def __init__(self):
+            self.traces = []
+
+        def export(self, spans):
+            self.traces.append([span.name for span in spans])
+
+    def tracer(self, **options) -> Tracer:
+        self.exporter = self.Exporter()
+        return Tracer(self.exporter, **options)
+
+    def test_failed_traces_are_always_kept(self):
+        tracer = self.tracer(sample_rate=0)
+        with tracer.span('update'):
+            with tracer.span('fast'):
+                pass
+        with tracer.span('update'):
+            try:
+                with tracer.span('send_raw_transaction'):
+                    raise RuntimeError("nonce too low")
+            except RuntimeError:
+                pass
+        self.assertEqual(self.exporter.traces, [['update', 'send_raw_transaction']])
+
+    def test_slow_traces_are_always_kept(self):
+        tracer = self.tracer(slow_ms=20, sample_rate=0)
+        with tracer.span('update'):
+            with tracer.span('preflight'):
+                time.sleep(0.03)
+        self.assertEqual(self.exporter.traces, [['update', 'preflight']])
+
+    def test_other_traces_are_sampled(self):
+        tracer = self.tracer(sample_rate=0.25)
+        for draw in (0.1, 0.3, 0.2):
+            with mock.patch('telegrambot.tracing.random.random', return_value=draw), tracer.span('update', draw=draw):
+                pass
+        self.assertEqual(len(self.exporter.traces), 2)
+        self.assertEqual(tracer._traces, {})
+
+
+def _busy_until(done):
+    while not done.is_set():
+        sum(range(1000))
+
+
+class ProfilerTests(SimpleTestCase):
+    def request(self, method, query, **data):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from .views import profile
+
+        request = getattr(APIRequestFactory(), method)(f'/profile/?{query}', data, format='json')
+        force_authenticate(request, user=User(username='admin', is_staff=True))
+        return profile(request)
+
+    def test_window_writes_collapsed_stacks(self):
+        done = threading.Event()
+        worker = threading.Thread(target=_busy_until, args=(done,), name='busy-worker')
+        worker.start()
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SamplingProfiler(interval=0.001, output_dir=directory)
+            with mock.patch('telegrambot.views.profiler', profiler):
+                self.assertEqual(self.request('get', 'process=web').status_code, 404)
+                started = self.request('post', 'process=web', seconds=0.2)
+                self.assertEqual(started.status_code, 202)
+                self.assertTrue(profiler.running)
+                self.assertEqual(self.request('post', 'process=web', seconds=0.2).status_code, 409)
+                profiler._thread.join()
+                done.set()
+                worker.join()
+                self.assertFalse(profiler.running)
+                self.assertEqual(profiler.last_output_path, started.data['output'])
+                self.assertEqual(os.path.dirname(profiler.last_output_path), directory)
+                collapsed = self.request('get', 'process=web').content.decode()
+            self.assertIsNotNone(profiler.start(0.01))
+            profiler._thread.join()
+
+        stacks = dict(line.rsplit(' ', 1) for line in collapsed.splitlines())
+        self.assertTrue(all(count.isdigit() for count in stacks.values()))
+        busy = [stack for stack in stacks if stack.startswith('busy-worker;')]
+        self.assertTrue(busy)
+        self.assertTrue(all('_busy_until (tests.py:' in stack for stack in busy))
+
+    def test_bot_profile_is_unavailable_when_the_bot_is_down(self):
+        # A port nothing listens on.
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with mock.patch.dict(os.environ, {'BOT_CONTROL_URL': f'http://127.0.0.1:{port}'}):
+            responses = [self.request('get', ''), self.request('post', 'process=bot', seconds=5)]
+        self.assertEqual([r.status_code for r in responses], [503, 503])
+        self.assertIn('unreachable', responses[0].data['error'])
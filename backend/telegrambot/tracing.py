@@ -0,0 +1,229 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from urllib import request
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('telegrambot_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace_id: str, parent_id: str | None, name: str, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class JsonlExporter:
+    """Append finished traces to a local file, one span per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list):
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in spans)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+class OtlpHttpExporter:
+    """Post finished traces as OTLP/JSON to a collector from a background thread."""
+
+    def __init__(self, endpoint: str, service_name: str = 'telegrambot', max_queue: int = 1000):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._queue = queue.Queue(maxsize=max_queue)
+        threading.Thread(target=self._run, name='otlp-exporter', daemon=True).start()
+
+    def export(self, spans: list):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning(f"Trace export queue full, dropping trace {spans[0].trace_id}")
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            body = json.dumps(self._payload(spans), default=str).encode()
+            req = request.Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'})
+            try:
+                request.urlopen(req, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"Trace export to {self.endpoint} failed: {e}")
+
+    def _payload(self, spans: list) -> dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attr('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'telegrambot'},
+                'spans': [{
+                    'traceId': span.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'startTimeUnixNano': str(span.start_ns),
+                    'endTimeUnixNano': str(span.end_ns),
+                    'attributes': [_otlp_attr(k, v) for k, v in span.attributes.items()],
+                    # STATUS_CODE_ERROR = 2, STATUS_CODE_OK = 1
+                    'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+                } for span in spans],
+            }],
+        }]}
+
+
+def _otlp_attr(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Tracer:
+    """Collect spans per trace and decide what to keep once the root span ends.
+
+    Sampling is tail-based: a trace is exported if any span failed or the
+    root took at least ``slow_ms``, otherwise with probability ``sample_rate``.
+    """
+
+    def __init__(self, exporter=None, slow_ms: float = 2000.0, sample_rate: float = 0.01):
+        self.exporter = exporter
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self._traces = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            span = Span(secrets.token_hex(16), None, name, attributes)
+            if self.exporter is not None:
+                self._traces[span.trace_id] = [span]
+        else:
+            span = Span(parent.trace_id, parent.span_id, name, attributes)
+            buffered = self._traces.get(span.trace_id)
+            if buffered is not None:
+                buffered.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish(span)
+
+    def _finish(self, root: Span):
+        spans = self._traces.pop(root.trace_id, [])
+        if self.exporter is None or not self._keep(root, spans):
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Trace export failed: {e}")
+
+    def _keep(self, root: Span, spans: list) -> bool:
+        if root.duration_ms >= self.slow_ms:
+            return True
+        if any(span.error for span in spans):
+            return True
+        return random.random() < self.sample_rate
+
+
+def current_trace_id() -> str | None:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def _exporter_from_env():
+    # TRACE_EXPORT=jsonl:/var/log/bot/traces.jsonl or otlp:http://collector:4318/v1/traces
+    target = os.getenv('TRACE_EXPORT')
+    if not target:
+        return None
+    kind, _, location = target.partition(':')
+    if kind == 'jsonl':
+        return JsonlExporter(location)
+    if kind == 'otlp':
+        return OtlpHttpExporter(location)
+    raise ValueError(f"Unknown TRACE_EXPORT kind: {kind}")
+
+
+tracer = Tracer()
+
+
+def configure_from_env():
+    tracer.exporter = _exporter_from_env()
+    tracer.slow_ms = float(os.getenv('TRACE_SLOW_MS', '2000'))
+    tracer.sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def traced_update(func):
+    """Open the root span of an update around an async Telegram handler."""
+
+    @functools.wraps(func)
+    async def wrapper(self, update, context, *args, **kwargs):
+        with tracer.span('update', handler=func.__name__, update_id=update.update_id):
+            return await func(self, update, context, *args, **kwargs)
+
+    return wrapper
+
+
+def install_log_record_factory():
+    """Stamp every log record with ``trace_id`` so formats can use %(trace_id)s."""
+    base_factory = logging.getLogRecordFactory()
+    if getattr(base_factory, 'adds_trace_id', False):
+        return
+
+    def factory(*args, **kwargs):
+        record = base_factory(*args, **kwargs)
+        record.trace_id = current_trace_id() or '-'
+        return record
+
+    factory.adds_trace_id = True
+    logging.setLogRecordFactory(factory)
@@ -2,5 +2,9 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("transact/", views.transfer_funds, name='transfer_funds')
+    path("transact/", views.transfer_funds, name='transfer_funds'),
+    path("metrics", views.metrics_view, name='metrics'),
+    path("profile/", views.profile, name='profile'),
+    path("history/", views.history, name='history'),
+    path("stats/", views.stats, name='stats'),
 ]
\ No newline at end of file
@@ -1,13 +1,25 @@
+import logging
+import os
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.http import HttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
 from rest_framework import status
-from .bot import TelegramBot
+from . import metrics
+from .ledger import DEFAULT_PAGE_SIZE, InvalidCursor, history_page
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 # @permission_classes([IsAdminUser])  
 def transfer_funds(request):   
     print("Funds transfer initiated")
+    from .bot import TelegramBot
     # Initialize the TelegramBot instance
     bot_instance = TelegramBot()
     bot_instance.initialize_web3_connections()
@@ -15,3 +27,119 @@ def transfer_funds(request):
     # Call the transferFunds method
     bot_instance.transferFunds()
     return Response({"message": "Funds transferred successfully!"}, status=200)
+
+
+def _bot_control(method: str, path: str, timeout: float = 2.0) -> tuple:
+    """Call the bot process's control server; returns ``(status, body, content_type)``."""
+    from .control import control_url
+    try:
+        with urlopen(Request(control_url() + path, method=method), timeout=timeout) as response:
+            return response.status, response.read(), response.headers.get('Content-Type')
+    except HTTPError as e:
+        return e.code, e.read(), e.headers.get('Content-Type')
+
+
+def metrics_view(request):
+    # The bot runs in its own process; its metrics are scraped through here too.
+    bot_text = ''
+    try:
+        code, body, _ = _bot_control('GET', '/metrics')
+        if code == 200:
+            bot_text = body.decode()
+    except (URLError, OSError) as e:
+        logger.debug(f"Bot metrics unavailable: {e}")
+    metrics.BOT_SCRAPE_UP.set(1 if bot_text else 0)
+    text = metrics.merge_expositions(metrics.REGISTRY.render(process='web'), bot_text)
+    return HttpResponse(text, content_type=metrics.CONTENT_TYPE)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def profile(request):
+    # Samples the bot process unless ?process=web asks for this worker.
+    if request.query_params.get('process', 'bot') == 'bot':
+        return _bot_profile(request)
+    if request.method == 'POST':
+        try:
+            seconds = float(request.data.get('seconds', 30))
+        except (TypeError, ValueError):
+            return Response({"error": "seconds must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < seconds <= 600:
+            return Response({"error": "seconds must be between 0 and 600"}, status=status.HTTP_400_BAD_REQUEST)
+        path = profiler.start(seconds)
+        if path is None:
+            return Response({"error": "A profile is already running"}, status=status.HTTP_409_CONFLICT)
+        return Response({"message": f"Profiling for {seconds:g}s", "output": path}, status=status.HTTP_202_ACCEPTED)
+
+    if profiler.last_output_path is None:
+        return Response({"error": "No profile has been collected yet"}, status=status.HTTP_404_NOT_FOUND)
+    with open(profiler.last_output_path) as f:
+        return HttpResponse(f.read(), content_type='text/plain; charset=utf-8')
+
+
+def _bot_profile(request):
+    if request.method == 'POST':
+        path = '/profile?' + urlencode({'seconds': request.data.get('seconds', 30)})
+    else:
+        path = '/profile'
+    try:
+        code, body, content_type = _bot_control(request.method, path)
+    except (URLError, OSError) as e:
+        return Response({"error": f"Bot control server unreachable: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return HttpResponse(body, status=code, content_type=content_type)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def history(request):
+    from .addresses import InvalidAddress, normalize_address
+    user = request.query_params.get('user')
+    recipient = request.query_params.get('recipient')
+    if (user is None) == (recipient is None):
+        return Response({"error": "Pass exactly one of user or recipient"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        user = int(user) if user is not None else None
+        limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return Response({"error": "user and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        recipient = normalize_address(recipient).checksum if recipient is not None else None
+        entries, next_cursor = history_page(user, recipient, request.query_params.get('cursor'), limit)
+    except (InvalidAddress, InvalidCursor) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = [
+        {
+            "telegram_user_id": entry.telegram_user_id,
+            "chat_id": entry.chat_id,
+            "chain_id": entry.chain_id,
+            "tx_hash": entry.tx_hash,
+            "recipient": entry.recipient,
+            "amount_wei": str(entry.amount_wei),
+            "status": entry.status,
+            "created": entry.created.isoformat(),
+        }
+        for entry in entries
+    ]
+    return Response({"results": results, "next_cursor": next_cursor})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def stats(request):
+    path = os.getenv('ANALYTICS_SNAPSHOT_PATH')
+    if not path or not os.path.exists(path):
+        return Response({"error": "No analytics snapshot has been written yet"}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        window = int(request.query_params.get('window_hours', 24)) * 3600
+        top = int(request.query_params.get('top', 10))
+        hours = int(request.query_params.get('hours', 24))
+    except ValueError:
+        return Response({"error": "window_hours, top and hours must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    # The bot compacts the snapshot to its own window; nothing older is retained.
+    retained_hours = max(1, int(os.getenv('ANALYTICS_WINDOW_SECONDS', '86400')) // 3600)
+    if window <= 0 or not 0 < top <= 100 or not 0 < hours <= retained_hours or window > retained_hours * 3600:
+        return Response({"error": f"window_hours and hours must be between 1 and {retained_hours} "
+                                  f"(ANALYTICS_WINDOW_SECONDS), and top at most 100"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    from .analytics import load_snapshot
+    return Response(load_snapshot(path, window).snapshot(top=top, hours=hours))
@@ -1,19 +1,34 @@
 #!/usr/bin/env python3
 
 import argparse
-import copy
+import hashlib
 import json
+import os
 import re
 import subprocess
+import sys
+import tempfile
 from enum import Enum as PyEnum
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator, TextIO
 from urllib import request
 
 VoidFn = Callable[[], None]
 
 CHEATCODES_JSON_URL = "https://raw.githubusercontent.com/foundry-rs/foundry/master/crates/cheatcodes/assets/cheatcodes.json"
 OUT_PATH = "src/Vm.sol"
+# Content hashes of the last generation's inputs and formatted output. Kept in
+# Foundry's cache directory: ignored by git and not published with src/.
+CACHE_PATH = "cache/Vm.sol.cache"
+WRITE_BUFFER_SIZE = 1 << 16
+# Number of functions printed between two chunks of `CheatcodesPrinter.stream_contract`.
+STREAM_BATCH_SIZE = 256
+
+PRINTER_OPTIONS = {
+    "spdx_identifier": "MIT OR Apache-2.0",
+    "solidity_requirement": ">=0.6.2 <0.9.0",
+    "abicoder_pragma": True,
+}
 
 VM_SAFE_DOC = """\
 /// The `VmSafe` interface does not allow manipulation of the EVM state or other actions that may
@@ -36,8 +51,102 @@ def main():
             dest="path",
             required=False,
             help="path to a json file containing the Vm interface, as generated by Foundry")
+    parser.add_argument(
+            "--check",
+            action="store_true",
+            help=f"only report whether {OUT_PATH} is up to date, exiting with 1 if it is not")
+    parser.add_argument(
+            "--force",
+            action="store_true",
+            help=f"regenerate {OUT_PATH} even if its inputs have not changed")
     args = parser.parse_args()
     json_str = request.urlopen(CHEATCODES_JSON_URL).read().decode("utf-8") if args.path is None else Path(args.path).read_text()
+
+    key = cache_key(json_str)
+    stale = staleness(key)
+    if args.check:
+        if stale is None:
+            print(f"{OUT_PATH} is up to date")
+            return
+        print(f"{OUT_PATH} is stale: {stale}")
+        sys.exit(1)
+    if stale is None and not args.force:
+        print(f"{OUT_PATH} is up to date, nothing to do")
+        return
+
+    write_formatted(json_str)
+
+    Path(CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    Path(CACHE_PATH).write_text(json.dumps({"input": key, "output": file_digest(OUT_PATH)}, indent=2) + "\n")
+
+    print(f"Wrote to {OUT_PATH}")
+
+
+def write_formatted(json_str: str):
+    """Generate and format Vm.sol in a temporary file next to `OUT_PATH`, then move it into place.
+
+    If generation or `forge fmt` fails, the existing `OUT_PATH` is left as it was.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".Vm.", suffix=".sol", dir=Path(OUT_PATH).parent)
+    try:
+        with open(fd, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            generate(json_str, f)
+
+        forge_fmt = ["forge", "fmt", tmp_path]
+        res = subprocess.run(forge_fmt)
+        assert res.returncode == 0, f"command failed: {forge_fmt}"
+
+        # mkstemp creates the file as 0600; give it the mode open() would have.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, OUT_PATH)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def cache_key(json_str: str) -> str:
+    """Hash everything the generated file depends on: the json, the printer options, this script and the formatter."""
+    h = hashlib.sha256()
+    h.update(Path(__file__).read_bytes())
+    h.update(json.dumps(PRINTER_OPTIONS, sort_keys=True).encode())
+    h.update(forge_version().encode())
+    h.update(json_str.encode())
+    return h.hexdigest()
+
+
+def forge_version() -> str:
+    """`forge --version`, since a different `forge fmt` may format the same text differently."""
+    try:
+        res = subprocess.run(["forge", "--version"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return "forge not found"
+    return res.stdout.strip()
+
+
+def file_digest(path: str) -> str | None:
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def staleness(key: str) -> str | None:
+    """Return why `OUT_PATH` needs regenerating for `key`, or None if it is up to date."""
+    try:
+        cache = json.loads(Path(CACHE_PATH).read_text())
+    except (FileNotFoundError, ValueError):
+        return f"no valid {CACHE_PATH}"
+    if cache.get("input") != key:
+        return "the cheatcodes json, printer options, generator or forge version changed"
+    if cache.get("output") != file_digest(OUT_PATH):
+        return f"{OUT_PATH} was modified since it was generated"
+    return None
+
+
+def generate(json_str: str, f: TextIO):
+    """Write the unformatted Vm.sol for the given cheatcodes json to `f`."""
     contract = Cheatcodes.from_json(json_str)
 
     ccs = contract.cheatcodes
@@ -45,29 +154,23 @@ def main():
     ccs.sort(key=lambda cc: cc.func.id)
 
     safe = list(filter(lambda cc: cc.safety == "safe", ccs))
-    safe.sort(key=CmpCheatcode)
+    safe.sort(key=cheatcode_key)
     unsafe = list(filter(lambda cc: cc.safety == "unsafe", ccs))
-    unsafe.sort(key=CmpCheatcode)
+    unsafe.sort(key=cheatcode_key)
     assert len(safe) + len(unsafe) == len(ccs)
 
-    prefix_with_group_headers(safe)
-    prefix_with_group_headers(unsafe)
-
-    out = ""
+    safe = prefix_with_group_headers(safe)
+    unsafe = prefix_with_group_headers(unsafe)
 
-    out += "// Automatically @generated by scripts/vm.py. Do not modify manually.\n\n"
+    f.write("// Automatically @generated by scripts/vm.py. Do not modify manually.\n\n")
 
-    pp = CheatcodesPrinter(
-        spdx_identifier="MIT OR Apache-2.0",
-        solidity_requirement=">=0.6.2 <0.9.0",
-        abicoder_pragma=True,
-    )
+    pp = CheatcodesPrinter(**PRINTER_OPTIONS)
     pp.p_prelude()
     pp.prelude = False
-    out += pp.finish()
+    f.write(pp.finish())
 
-    out += "\n\n"
-    out += VM_SAFE_DOC
+    f.write("\n\n")
+    f.write(VM_SAFE_DOC)
     vm_safe = Cheatcodes(
         # TODO: Custom errors were introduced in 0.8.4
         errors=[],  # contract.errors
@@ -76,11 +179,10 @@ def main():
         structs=contract.structs,
         cheatcodes=safe,
     )
-    pp.p_contract(vm_safe, "VmSafe")
-    out += pp.finish()
+    write_stripped(f, pp.stream_contract(vm_safe, "VmSafe"))
 
-    out += "\n\n"
-    out += VM_DOC
+    f.write("\n\n")
+    f.write(VM_DOC)
     vm_unsafe = Cheatcodes(
         errors=[],
         events=[],
@@ -88,67 +190,60 @@ def main():
         structs=[],
         cheatcodes=unsafe,
     )
-    pp.p_contract(vm_unsafe, "Vm", "VmSafe")
-    out += pp.finish()
+    write_stripped(f, pp.stream_contract(vm_unsafe, "Vm", "VmSafe"))
 
-    # Compatibility with <0.8.0
-    def memory_to_calldata(m: re.Match) -> str:
-        return " calldata " + m.group(1)
 
-    out = re.sub(r" memory (.*returns)", memory_to_calldata, out)
+# Compatibility with <0.8.0
+MEMORY_TO_CALLDATA = re.compile(r" memory (.*returns)")
 
-    with open(OUT_PATH, "w") as f:
-        f.write(out)
 
-    forge_fmt = ["forge", "fmt", OUT_PATH]
-    res = subprocess.run(forge_fmt)
-    assert res.returncode == 0, f"command failed: {forge_fmt}"
-
-    print(f"Wrote to {OUT_PATH}")
+def memory_to_calldata(m: re.Match) -> str:
+    return " calldata " + m.group(1)
 
 
-class CmpCheatcode:
-    cheatcode: "Cheatcode"
+def write_stripped(f: TextIO, chunks: Iterable[str]):
+    """Write the concatenation of `chunks` without trailing whitespace, as `finish()` would return it.
 
-    def __init__(self, cheatcode: "Cheatcode"):
-        self.cheatcode = cheatcode
-
-    def __lt__(self, other: "CmpCheatcode") -> bool:
-        return cmp_cheatcode(self.cheatcode, other.cheatcode) < 0
-
-    def __eq__(self, other: "CmpCheatcode") -> bool:
-        return cmp_cheatcode(self.cheatcode, other.cheatcode) == 0
-
-    def __gt__(self, other: "CmpCheatcode") -> bool:
-        return cmp_cheatcode(self.cheatcode, other.cheatcode) > 0
+    Chunks are whole lines, so the `memory` to `calldata` rewrite (which never
+    spans lines) is applied to each one as it arrives and only trailing
+    whitespace is held back until more text follows it.
+    """
+    tail = ""
+    for chunk in chunks:
+        text = chunk.rstrip()
+        if text == "":
+            tail += chunk
+            continue
+        f.write(tail)
+        f.write(MEMORY_TO_CALLDATA.sub(memory_to_calldata, text))
+        tail = chunk[len(text):]
 
 
-def cmp_cheatcode(a: "Cheatcode", b: "Cheatcode") -> int:
-    if a.group != b.group:
-        return -1 if a.group < b.group else 1
-    if a.status != b.status:
-        return -1 if a.status < b.status else 1
-    if a.safety != b.safety:
-        return -1 if a.safety < b.safety else 1
-    if a.func.id != b.func.id:
-        return -1 if a.func.id < b.func.id else 1
-    return 0
+def cheatcode_key(cheatcode: "Cheatcode") -> tuple[str, str, str, str]:
+    return (cheatcode.group, cheatcode.status, cheatcode.safety, cheatcode.func.id)
 
 
 # HACK: A way to add group header comments without having to modify printer code
-def prefix_with_group_headers(cheats: list["Cheatcode"]):
+def prefix_with_group_headers(cheats: list["Cheatcode"]) -> list["Cheatcode"]:
     s = set()
-    for i, cheat in enumerate(cheats):
-        if cheat.group in s:
-            continue
-
-        s.add(cheat.group)
-
-        c = copy.deepcopy(cheat)
-        c.func.description = ""
-        c.func.declaration = f"// ======== {group(c.group)} ========"
-        cheats.insert(i, c)
-    return cheats
+    out = []
+    for cheat in cheats:
+        if cheat.group not in s:
+            s.add(cheat.group)
+            f = cheat.func
+            header = Function(
+                f.id,
+                "",
+                f"// ======== {group(cheat.group)} ========",
+                f.visibility,
+                f.mutability,
+                f.signature,
+                f.selector,
+                f.selector_bytes,
+            )
+            out.append(Cheatcode(header, cheat.group, cheat.status, cheat.safety))
+        out.append(cheat)
+    return out
 
 
 def group(s: str) -> str:
@@ -407,7 +502,7 @@ class ItemOrder:
 
 
 class CheatcodesPrinter:
-    buffer: str
+    _parts: list[str]
 
     prelude: bool
     spdx_identifier: str
@@ -441,7 +536,7 @@ class CheatcodesPrinter:
         self.solidity_requirement = solidity_requirement
         self.abicoder_v2 = abicoder_pragma
         self.block_doc_style = block_doc_style
-        self.buffer = buffer
+        self._parts = [buffer] if buffer else []
         self.indent_level = indent_level
         self.nl_str = nl_str
 
@@ -455,12 +550,29 @@ class CheatcodesPrinter:
 
         self.items_order = items_order
 
+    @property
+    def buffer(self) -> str:
+        return "".join(self._parts)
+
     def finish(self) -> str:
         ret = self.buffer.rstrip()
-        self.buffer = ""
+        self._parts = []
         return ret
 
     def p_contract(self, contract: Cheatcodes, name: str, inherits: str = ""):
+        for _ in self._contract_steps(contract, name, inherits):
+            pass
+
+    def stream_contract(self, contract: Cheatcodes, name: str, inherits: str = "") -> Iterator[str]:
+        """Print a contract like `p_contract`, yielding the buffer in chunks of whole lines as it fills.
+
+        Unlike `finish()`, the chunks are not stripped.
+        """
+        for _ in self._contract_steps(contract, name, inherits):
+            yield self._take()
+
+    def _contract_steps(self, contract: Cheatcodes, name: str, inherits: str) -> Iterator[None]:
+        # Yields whenever the buffer ends on a line boundary.
         if self.prelude:
             self.p_prelude(contract)
 
@@ -475,24 +587,35 @@ class CheatcodesPrinter:
             self._p_str(" ")
         self._p_str("{")
         self._p_nl()
-        self._with_indent(lambda: self._p_items(contract))
-        self._p_str("}")
-        self._p_nl()
-
-    def _p_items(self, contract: Cheatcodes):
+        yield
+        self._inc_indent()
         for item in self.items_order.get_list():
-            if item == Item.ERROR:
-                self.p_errors(contract.errors)
-            elif item == Item.EVENT:
-                self.p_events(contract.events)
-            elif item == Item.ENUM:
-                self.p_enums(contract.enums)
-            elif item == Item.STRUCT:
-                self.p_structs(contract.structs)
-            elif item == Item.FUNCTION:
-                self.p_functions(contract.cheatcodes)
+            if item == Item.FUNCTION:
+                cheatcodes = contract.cheatcodes
+                for i in range(0, len(cheatcodes), STREAM_BATCH_SIZE):
+                    self.p_functions(cheatcodes[i:i + STREAM_BATCH_SIZE])
+                    yield
             else:
-                assert False, f"unknown item {item}"
+                self._p_item(contract, item)
+                yield
+        self._dec_indent()
+        self._p_str("}")
+        self._p_nl()
+        yield
+
+    def _p_item(self, contract: Cheatcodes, item: Item):
+        if item == Item.ERROR:
+            self.p_errors(contract.errors)
+        elif item == Item.EVENT:
+            self.p_events(contract.events)
+        elif item == Item.ENUM:
+            self.p_enums(contract.enums)
+        elif item == Item.STRUCT:
+            self.p_structs(contract.structs)
+        elif item == Item.FUNCTION:
+            self.p_functions(contract.cheatcodes)
+        else:
+            assert False, f"unknown item {item}"
 
     def p_prelude(self, contract: Cheatcodes | None = None):
         self._p_str(f"// SPDX-License-Identifier: {self.spdx_identifier}")
@@ -633,7 +756,12 @@ class CheatcodesPrinter:
         self._p_str(self.nl_str)
 
     def _p_str(self, txt: str):
-        self.buffer += txt
+        self._parts.append(txt)
+
+    def _take(self) -> str:
+        ret = "".join(self._parts)
+        self._parts = []
+        return ret
 
     def _inc_indent(self):
         self.indent_level += 1
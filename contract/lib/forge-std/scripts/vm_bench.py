@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import vm  # noqa: E402
+
+GROUPS = ["evm", "testing", "scripting", "filesystem", "environment", "string", "json", "toml", "utilities", "crypto"]
+STATUSES = ["stable", "stable", "stable", "deprecated", "experimental", "internal"]
+TYPES = ["uint256", "int256", "address", "bool", "bytes32", "string memory", "bytes memory", "uint256[] memory"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Time scripts/vm.py on a synthetic cheatcodes json; scripts/vm_test.py checks its output")
+    parser.add_argument("--count", type=int, default=50_000, help="number of synthetic cheatcodes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs; the best is reported")
+    args = parser.parse_args()
+
+    json_str = json.dumps(synthetic_cheatcodes(args.count, args.seed))
+    print(f"{args.count} cheatcodes, {len(json_str) / 1e6:.1f} MB of json")
+
+    out, elapsed = best_of(args.repeat, lambda: generate_to_file(json_str))
+    print(f"generate  {elapsed:8.3f} s  ({len(out)} bytes)")
+
+
+def best_of(repeat: int, f):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+def generate_to_file(json_str: str) -> bytes:
+    with tempfile.NamedTemporaryFile("w", suffix=".sol", buffering=vm.WRITE_BUFFER_SIZE) as f:
+        vm.generate(json_str, f)
+        f.flush()
+        return Path(f.name).read_bytes()
+
+
+def synthetic_cheatcodes(count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    cheatcodes = []
+    for i in range(count):
+        name = f"cheat{rng.randrange(count):06d}"
+        params = ", ".join(f"{rng.choice(TYPES)} arg{j}" for j in range(rng.randrange(4)))
+        mutability = rng.choice(["", "view", "pure"])
+        declaration = f"function {name}({params}) external"
+        if mutability:
+            declaration += f" {mutability}"
+        if rng.random() < 0.6:
+            declaration += f" returns ({rng.choice(TYPES)} result)"
+        declaration += ";"
+        description = f"Synthetic cheatcode {i}."
+        if rng.random() < 0.3:
+            description += "\n  Spans a second line with `code` and a <link>."
+        selector = rng.randbytes(4)
+        cheatcodes.append({
+            "func": {
+                "id": name,
+                "description": description,
+                "declaration": declaration,
+                "visibility": "external",
+                "mutability": mutability,
+                "signature": f"{name}()",
+                "selector": "0x" + selector.hex(),
+                "selectorBytes": list(selector),
+            },
+            "group": rng.choice(GROUPS),
+            "status": rng.choice(STATUSES),
+            "safety": rng.choice(["safe", "unsafe"]),
+        })
+    return {
+        "errors": [{"name": "CheatcodeError", "description": "Error thrown by cheatcodes.", "declaration": "error CheatcodeError(string message);"}],
+        "events": [{"name": "Log", "description": "A log.", "declaration": "event Log(string message);"}],
+        "enums": [{
+            "name": "CallerMode",
+            "description": "A caller mode.\nOver two lines.",
+            "variants": [{"name": f"Mode{i}", "description": f"Variant {i}."} for i in range(5)],
+        }],
+        "structs": [{
+            "name": "Log",
+            "description": "An emitted log.",
+            "fields": [{"name": f"field{i}", "ty": rng.choice(TYPES).split()[0], "description": f"Field {i}."} for i in range(6)],
+        }],
+        "cheatcodes": cheatcodes,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import hashlib
+import io
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import vm  # noqa: E402
+from vm_bench import synthetic_cheatcodes  # noqa: E402
+
+# sha256 of the unformatted output for synthetic_cheatcodes(2000, 0), recorded
+# with the implementation from before generation was streamed. Changes to
+# vm.py must not change it.
+GOLDEN_COUNT = 2000
+GOLDEN_SEED = 0
+GOLDEN_SHA256 = "1ea08b3192fbdf08b1b15cdd842d18c2ac752b439428a61e4c505af3aa4aeac3"
+
+
+class GenerateTest(unittest.TestCase):
+    def test_output_matches_golden_hash(self):
+        out = io.StringIO()
+        vm.generate(json.dumps(synthetic_cheatcodes(GOLDEN_COUNT, GOLDEN_SEED)), out)
+        self.assertEqual(hashlib.sha256(out.getvalue().encode()).hexdigest(), GOLDEN_SHA256)
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(tmp.name)
+        Path("src").mkdir()
+        Path(vm.OUT_PATH).write_text("// previous Vm.sol\n")
+        Path("cheatcodes.json").write_text(json.dumps(synthetic_cheatcodes(50, 0)))
+
+    def run_main(self, fmt_returncode: int = 0):
+        def run(cmd, **kwargs):
+            return subprocess.CompletedProcess(cmd, 0 if cmd[1] == "--version" else fmt_returncode, "forge 1.0.0", "")
+
+        with mock.patch.object(vm.subprocess, "run", side_effect=run), \
+                mock.patch.object(sys, "argv", ["vm.py", "--from", "cheatcodes.json", "--force"]), \
+                mock.patch("builtins.print"):
+            vm.main()
+
+    def test_output_replaces_the_previous_file(self):
+        self.run_main()
+        self.assertTrue(Path(vm.OUT_PATH).read_text().startswith("// Automatically @generated by scripts/vm.py."))
+        self.assertEqual(os.listdir("src"), ["Vm.sol"])
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(vm.OUT_PATH).st_mode), 0o666 & ~umask)
+        self.assertEqual(json.loads(Path(vm.CACHE_PATH).read_text())["output"], vm.file_digest(vm.OUT_PATH))
+
+    def test_failed_generation_keeps_the_previous_file(self):
+        with mock.patch.object(vm, "generate", side_effect=RuntimeError("interrupted")):
+            with self.assertRaises(RuntimeError):
+                self.run_main()
+        self.assertEqual(Path(vm.OUT_PATH).read_text(), "// previous Vm.sol\n")
+        self.assertEqual(os.listdir("src"), ["Vm.sol"])
+
+    def test_failed_format_keeps_the_previous_file(self):
+        with self.assertRaises(AssertionError):
+            self.run_main(fmt_returncode=1)
+        self.assertEqual(Path(vm.OUT_PATH).read_text(), "// previous Vm.sol\n")
+        self.assertEqual(os.listdir("src"), ["Vm.sol"])
+
+
+if __name__ == "__main__":
+    unittest.main()